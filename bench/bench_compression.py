@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+"""
+Fetch a large download result (GET /results/{session}/{id}) once per response encoding and report
+bytes on the wire and end to end latency, the result is kept inline (not in the blob store) the
+way it is served whenever it is under blob_threshold.
+
+    python3 bench/bench_compression.py -s 50 -l 100
+"""
+import argparse
+import base64
+import gzip
+import os
+import random
+import string
+
+from bench_helper import scratch_database, get_token_headers, timer
+
+scratch_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from server.lighthouse import app  # noqa: E402
+from server.server_helper.blob_helper import blobs  # noqa: E402
+from server.server_helper.compression_helper import CODECS  # noqa: E402
+
+client = TestClient(app)
+
+
+def seed_download(size_mb: int, headers: dict) -> tuple:
+    """
+    Store a download result whose encoded (hex(base64(gzip))) form is about size_mb megabytes
+    :param size_mb: The size of the result text in MB
+    :param headers: The operator token headers
+    :return: The session and tasking id of the result
+    """
+    blobs.threshold = 1 << 40
+    session = "".join(random.choices(string.hexdigits, k=8))
+    client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+    args = base64.b64encode(b"/tmp/loot").hex()
+    client.post(f"/tasking/{session}", headers=headers, json={"task": "download", "args": args})
+    task = client.get(f"/tasks/{session}").json()[0]
+    # file contents are gzipped by the agent already, random bytes stand in for that gzip stream
+    payload = gzip.compress(os.urandom(size_mb * 1024 * 1024 * 3 // 8), compresslevel=1)
+    results = base64.b64encode(payload).hex()
+    client.post(
+        f"/results/{session}",
+        json={"tasking_id": task["id"], "task": "download", "args": args, "results": results},
+    )
+    return session, task["id"]
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="response compression benchmark")
+    opts.add_argument("-s", "--size", default=50, type=int, dest="size", help="result size in MB")
+    opts.add_argument("-l", "--link", default=100, type=int, dest="link", help="link speed in Mbit/s")
+    args = opts.parse_args()
+
+    token_headers = get_token_headers(client)
+    bench_session, bench_id = seed_download(args.size, token_headers)
+    for encoding in ["identity", *CODECS]:
+        with timer() as elapsed:
+            response = client.get(
+                f"/results/{bench_session}/{bench_id}",
+                headers=dict(token_headers, **{"Accept-Encoding": encoding}),
+            )
+            body = response.content
+        wire = response.num_bytes_downloaded
+        transfer = wire * 8 / (args.link * 1000 * 1000)
+        print(
+            f"{encoding:<9} body={len(body) / 1e6:.1f}MB wire={wire / 1e6:.1f}MB "
+            f"in-process={elapsed['seconds']:.2f}s +{args.link}Mbit/s transfer={transfer:.2f}s "
+            f"total={elapsed['seconds'] + transfer:.2f}s"
+        )
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Compare the legacy json + hex(base64()) result encoding with the raw octet-stream endpoint
+(POST /results/v2/{session}/{id}): request size, the CPU to encode / decode the payload and the
+end to end time of posting one result each way.
+
+    python3 bench/bench_encoding.py -s 1 10
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import string
+import time
+
+from bench_helper import scratch_database, get_token_headers, timer
+
+scratch_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from server.lighthouse import app  # noqa: E402
+
+client = TestClient(app)
+
+
+def cpu(func, *args):
+    start = time.process_time()
+    value = func(*args)
+    return value, time.process_time() - start
+
+
+def legacy_body(payload: bytes) -> bytes:
+    # what an agent builds today, hex(base64()) inside a json document
+    return json.dumps({"tasking_id": 1, "task": "ls", "args": "", "results": base64.b64encode(payload).hex()}).encode()
+
+
+def legacy_decode(body: bytes) -> bytes:
+    # what a reader of the legacy encoding does to get the bytes back
+    return base64.b64decode(bytes.fromhex(json.loads(body)["results"]))
+
+
+def seed_tasks(count: int, headers: dict) -> tuple:
+    session = "".join(random.choices(string.hexdigits, k=8))
+    client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+    for _ in range(count):
+        client.post(f"/tasking/v2/{session}", headers=headers, params={"task": "ls", "args": "/tmp"})
+    return session, client.get(f"/tasks/{session}").json()
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="result encoding benchmark")
+    opts.add_argument("-s", "--sizes", default=[1, 10], type=int, nargs="+", dest="sizes", help="payload MB")
+    args = opts.parse_args()
+
+    token_headers = get_token_headers(client)
+    bench_session, bench_tasks = seed_tasks(2 * len(args.sizes), token_headers)
+    for size in args.sizes:
+        payload = os.urandom(size * 1024 * 1024)
+        body, encode_cpu = cpu(legacy_body, payload)
+        _, decode_cpu = cpu(legacy_decode, body)
+        legacy_task, raw_task = bench_tasks.pop(), bench_tasks.pop()
+        with timer() as legacy_elapsed:
+            client.post(f"/results/{bench_session}", json=dict(json.loads(body), tasking_id=legacy_task["id"]))
+        with timer() as raw_elapsed:
+            client.post(
+                f"/results/v2/{bench_session}/{raw_task['id']}",
+                params={"task": "ls", "args": ""},
+                headers={"Content-Type": "application/octet-stream"},
+                content=payload,
+            )
+        print(
+            f"{size}MB legacy: body={len(body) / 1e6:.1f}MB ({len(body) / len(payload):.2f}x) "
+            f"encode={encode_cpu * 1000:.0f}ms decode={decode_cpu * 1000:.0f}ms post={legacy_elapsed['seconds']:.2f}s | "
+            f"raw: body={len(payload) / 1e6:.1f}MB (1.00x) encode=0ms decode=0ms post={raw_elapsed['seconds']:.2f}s"
+        )
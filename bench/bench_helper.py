@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+SCHEMA_PATH = PROJECT_ROOT / "db" / "schema.sql"
+
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def scratch_database() -> Path:
+    """
+    Build a throw away database from db/schema.sql plus the migrations and point the server at it,
+    must run before anything from server/ is imported so the engine binds to the scratch file
+    :return db_path: The path of the scratch database
+    """
+    db_path = Path(tempfile.mkdtemp(prefix="lighthouse-bench-")) / "database.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(SCHEMA_PATH.read_text())
+    os.environ["LIGHTHOUSE_DB"] = str(db_path)
+    from server.server_helper.migrations import run_migrations
+
+    run_migrations()
+    return db_path
+
+
+def get_token_headers(client) -> dict:
+    data = {"grant_type": "password", "username": "admin", "password": "password"}
+    response = client.post("/token/", data=data)
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@contextmanager
+def count_queries(engine):
+    """
+    Collect every SQL statement the engine sends to sqlite while the block runs
+    :param engine: The SQLAlchemy engine to listen on
+    :return statements: The list the statements are appended to
+    """
+    from sqlalchemy import event
+
+    statements = []
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+@contextmanager
+def timer():
+    elapsed = {}
+    start = time.perf_counter()
+    try:
+        yield elapsed
+    finally:
+        elapsed["seconds"] = time.perf_counter() - start
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+"""
+Latency under a burst of concurrent agent check ins. Starts lighthouse under uvicorn on a scratch
+database, opens --connections concurrent connections that each check in --rounds times and reports
+the latency percentiles.
+
+    python3 bench/bench_load.py -c 1000 -r 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import string
+import subprocess
+import sys
+import time
+
+import httpx
+
+from bench_helper import PROJECT_ROOT, scratch_database
+
+
+def start_server() -> tuple:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, PYTHONPATH=str(PROJECT_ROOT))
+    cmd = [sys.executable, "-m", "uvicorn", "server.lighthouse:app", "--port", str(port),
+           "--log-level", "critical", "--backlog", "4096"]
+    proc = subprocess.Popen(cmd, env=env, cwd=PROJECT_ROOT)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            httpx.get(f"{base}/docs")
+            return proc, base
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError("lighthouse did not start")
+
+
+async def agent(client: httpx.AsyncClient, rounds: int, latencies: list, errors: list):
+    session = "".join(random.choices(string.hexdigits, k=8))
+    try:
+        await client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+    except httpx.HTTPError as e:
+        errors.append(e)
+        return
+    for _ in range(rounds):
+        start = time.perf_counter()
+        try:
+            response = await client.get(f"/health/{session}")
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(base: str, connections: int, rounds: int):
+    latencies, errors = [], []
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(base_url=base, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(agent(client, rounds, latencies, errors) for _ in range(connections)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    if not latencies:
+        print(f"connections={connections} every request failed, first error: {errors[0]!r}")
+        return
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print(
+        f"connections={connections} requests={len(latencies)} errors={len(errors)} "
+        f"rps={len(latencies) / elapsed:.0f} p50={pct(0.50):.0f}ms p95={pct(0.95):.0f}ms p99={pct(0.99):.0f}ms"
+    )
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="concurrent check in load test")
+    opts.add_argument("-c", "--connections", default=1000, type=int, dest="connections")
+    opts.add_argument("-r", "--rounds", default=5, type=int, dest="rounds")
+    args = opts.parse_args()
+
+    scratch_database()
+    server, base_url = start_server()
+    try:
+        asyncio.run(run(base_url, args.connections, args.rounds))
+    finally:
+        server.terminate()
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+"""
+Post many small results (POST /results/{session}) and report throughput, SQL statements
+and commits per post, run it against an older checkout to compare ingestion paths.
+
+    python3 bench/bench_results.py -n 500
+"""
+import argparse
+import base64
+import random
+import string
+
+from bench_helper import scratch_database, get_token_headers, count_queries, timer
+
+scratch_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from server.lighthouse import app  # noqa: E402
+from server.server_helper.db import async_engine  # noqa: E402
+
+client = TestClient(app)
+
+
+def seed_tasks(count: int, headers: dict) -> tuple:
+    session = "".join(random.choices(string.hexdigits, k=8))
+    client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+    args = base64.b64encode(b"/tmp").hex()
+    for _ in range(count):
+        client.post(f"/tasking/{session}", headers=headers, json={"task": "ls", "args": args})
+    return session, client.get(f"/tasks/{session}").json()
+
+
+def post_results(session: str, tasks: list) -> dict:
+    commits = []
+    args = base64.b64encode(b"/tmp").hex()
+
+    def _record(conn):
+        commits.append(conn)
+
+    event.listen(async_engine.sync_engine, "commit", _record)
+    try:
+        with count_queries(async_engine.sync_engine) as statements, timer() as elapsed:
+            for task in tasks:
+                client.post(
+                    f"/results/{session}",
+                    json={"tasking_id": task["id"], "task": "ls", "args": args, "results": "total 0"},
+                )
+    finally:
+        event.remove(async_engine.sync_engine, "commit", _record)
+    return {"statements": len(statements), "commits": len(commits), "seconds": elapsed["seconds"]}
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="result ingestion benchmark")
+    opts.add_argument("-n", "--results", default=500, type=int, dest="results")
+    args = opts.parse_args()
+
+    token_headers = get_token_headers(client)
+    bench_session, bench_tasks = seed_tasks(args.results, token_headers)
+    stats = post_results(bench_session, bench_tasks)
+    posts = len(bench_tasks)
+    print(
+        f"posts={posts} posts/s={posts / stats['seconds']:.0f} "
+        f"statements/post={stats['statements'] / posts:.2f} "
+        f"commits/post={stats['commits'] / posts:.2f}"
+    )
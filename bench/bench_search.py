@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+"""
+Query latency of GET /results/search on a scratch database of a million text results. The rows are
+inserted without an index, migration 0009 then backfills it (the one-time indexer) and the endpoint's
+own select is timed for rare and common words, phrases, prefixes, a session filter and deep pages.
+
+    python3 bench/bench_search.py -n 1000000
+"""
+import argparse
+import base64
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from bench_helper import SCHEMA_PATH, scratch_database, timer
+
+scratch_database()
+
+from server.server_helper import implant_helper, tasking_helper  # noqa: E402, F401 mappers Results relates to
+from server.server_helper.migrations import apply_migration, discover_migrations  # noqa: E402
+from server.server_helper.search_helper import SearchQuery, search_statement  # noqa: E402
+
+SESSIONS = 1000
+WORDS = [f"{random.choice('bcdfghjklmnprstvz')}{random.choice('aeiou')}{i:x}" for i in range(5000)]
+# one result in NEEDLE_EVERY carries a word found nowhere else
+NEEDLE_EVERY = 100_000
+
+
+def output(i: int) -> bytes:
+    # something like a directory listing, a few lines of common and rare words
+    lines = [
+        f"-rw-r--r-- 1 root root {random.randrange(1 << 20)} Jan 1 {' '.join(random.choices(WORDS, k=3))}.txt"
+        for _ in range(random.randint(1, 4))
+    ]
+    if i % NEEDLE_EVERY == 0:
+        lines.append(f"id_rsa needle{i}")
+    return "\n".join(lines).encode("utf-8")
+
+
+def build(db_path: Path, count: int) -> None:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.executescript(SCHEMA_PATH.read_text())
+    for version, path in discover_migrations():
+        if version < 9:
+            apply_migration(conn, version, path)
+    conn.execute("PRAGMA foreign_keys = OFF")
+    rows = (
+        (f"{random.randrange(SESSIONS):08x}", i, "ls", "/tmp", base64.b64encode(output(i)).hex())
+        for i in range(1, count + 1)
+    )
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO results (session, tasking_id, task, args, results) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def file_mb(conn) -> float:
+    return conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0] / 1e6
+
+
+def main():
+    opts = argparse.ArgumentParser(description="result search benchmark")
+    opts.add_argument("-n", "--count", default=1_000_000, type=int, dest="count", help="results in the table")
+    opts.add_argument("-r", "--runs", default=20, type=int, dest="runs", help="runs of each query")
+    args = opts.parse_args()
+
+    db_path = Path(tempfile.mkdtemp(prefix="lighthouse-bench-")) / "database.db"
+    build(db_path, args.count)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    before = file_mb(conn)
+    started = time.perf_counter()
+    apply_migration(conn, 9, discover_migrations()[8][1])
+    indexed = conn.execute("SELECT count(*) FROM results_fts").fetchone()[0]
+    print(f"backfilled {indexed} results in {time.perf_counter() - started:.1f}s, "
+          f"file {before:.0f} MB -> {file_mb(conn):.0f} MB")
+    conn.close()
+
+    common = WORDS[0]
+    middle = args.count // 2
+    queries = {
+        "rare word": {"q": f"needle{NEEDLE_EVERY}"},
+        "common word": {"q": common},
+        "common, deep page": {"q": common, "after_id": middle},
+        "phrase": {"q": '"root root"'},
+        "two words": {"q": f"{WORDS[1]} {WORDS[2]}"},
+        "prefix": {"q": f"{WORDS[3][:3]}*"},
+        "session filter": {"q": "root", "session": f"{7:08x}"},
+        "no match": {"q": "nothingmatchesthis"},
+    }
+    engine = create_engine(f"sqlite:///{db_path}")
+    with Session(engine) as db:
+        for name, params in queries.items():
+            stmt = search_statement(SearchQuery(limit=100, **params))
+            db.execute(stmt).all()
+            with timer() as elapsed:
+                for _ in range(args.runs):
+                    found = len(db.execute(stmt).all())
+            print(f"  {name:>17}: {elapsed['seconds'] / args.runs * 1000:8.2f} ms ({found} rows)")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
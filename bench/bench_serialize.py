@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+"""
+Render a large implant list both ways, ORM objects + pydantic response_model + JSONResponse
+(the old read_implants path) against Core rows + orjson (rows_response), and report CPU time,
+peak memory and whether the bytes match.
+
+    python3 bench/bench_serialize.py -n 10000
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from bench_helper import scratch_database
+
+scratch_database()
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from sqlalchemy import insert, select  # noqa: E402
+from server.server_helper.db import AsyncSessionLocal, async_engine  # noqa: E402
+from server.server_helper.implant_helper import READ_COLUMNS, Implant, ImplantRead  # noqa: E402
+from server.server_helper.response_helper import row_dicts, rows_response  # noqa: E402
+
+
+async def seed_implants(count: int) -> None:
+    now = datetime.now(timezone.utc).isoformat()
+    rows = [
+        {
+            "session": f"{i:08x}",
+            "first_checkin": now,
+            "last_checkin": now,
+            "alive": True,
+            "callback_freq": 60,
+            "jitter": 15,
+            "username": "bench",
+            "hostname": f"host-{i}",
+        }
+        for i in range(count)
+    ]
+    async with async_engine.begin() as conn:
+        await conn.execute(insert(Implant), rows)
+
+
+async def orm_path() -> bytes:
+    async with AsyncSessionLocal() as db:
+        implants = (await db.scalars(select(Implant).order_by(Implant.id))).all()
+        models = [ImplantRead.model_validate(i, from_attributes=True) for i in implants]
+    # what FastAPI does with a response_model before handing the content to JSONResponse
+    return JSONResponse([model.model_dump(mode="json") for model in models]).body
+
+
+async def core_path() -> bytes:
+    async with AsyncSessionLocal() as db:
+        implants = row_dicts(await db.execute(select(*READ_COLUMNS).order_by(Implant.id)))
+    return rows_response(implants).body
+
+
+async def measure(render) -> dict:
+    await render()  # warm up, first connection and statement compilation
+    tracemalloc.start()
+    start = time.process_time()
+    body = await render()
+    cpu = time.process_time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"cpu": cpu, "peak": peak, "body": body}
+
+
+async def main(count: int) -> None:
+    await seed_implants(count)
+    orm = await measure(orm_path)
+    core = await measure(core_path)
+    await async_engine.dispose()
+    for name, stats in (("orm+pydantic+json", orm), ("core+orjson", core)):
+        print(f"{name:<18} rows={count} cpu={stats['cpu'] * 1000:.1f}ms peak={stats['peak'] / 1024 / 1024:.1f}MiB")
+    print(f"cpu x{orm['cpu'] / core['cpu']:.1f} peak x{orm['peak'] / core['peak']:.1f} identical={orm['body'] == core['body']}")
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="list serialization benchmark")
+    opts.add_argument("-n", "--rows", default=10000, type=int, dest="rows")
+    args = opts.parse_args()
+    asyncio.run(main(args.rows))
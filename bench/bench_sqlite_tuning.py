@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+"""
+Check in throughput while operators hammer GET /implants/, once with sqlite's defaults
+(rollback journal, synchronous=FULL, no busy timeout) and once with the SQLITE_PRAGMAS profile.
+Each profile runs in its own process against its own scratch database.
+
+    python3 bench/bench_sqlite_tuning.py -d 10 -w 8 -r 8
+"""
+import argparse
+import base64
+import random
+import socket
+import string
+import subprocess
+import sys
+import threading
+import time
+
+import httpx
+
+from bench_helper import scratch_database, get_token_headers
+
+# sqlite's out of the box behaviour, what the server ran with before the connect hook
+DEFAULT_PROFILE = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+    "busy_timeout": 0,
+    "cache_size": -2000,
+    "mmap_size": 0,
+    "foreign_keys": False,
+}
+
+
+def start_server():
+    import uvicorn
+    from server.lighthouse import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="critical"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+def writer(base: str, headers: dict, stop: threading.Event, stats: dict):
+    args = base64.b64encode(b"/tmp").hex()
+    with httpx.Client(base_url=base, timeout=30) as client:
+        session = "".join(random.choices(string.hexdigits, k=8))
+        client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+        while not stop.is_set():
+            try:
+                client.post(f"/tasking/{session}", headers=headers, json={"task": "ls", "args": args})
+                response = client.get(f"/health/v2/{session}")
+            except httpx.HTTPError:
+                stats["errors"] += 1
+                continue
+            key = "checkins" if response.status_code == 200 else "errors"
+            stats[key] += 1
+
+
+def reader(base: str, headers: dict, stop: threading.Event, stats: dict):
+    with httpx.Client(base_url=base, timeout=30) as client:
+        while not stop.is_set():
+            try:
+                response = client.get("/implants/", headers=headers)
+            except httpx.HTTPError:
+                stats["errors"] += 1
+                continue
+            key = "reads" if response.status_code == 200 else "errors"
+            stats[key] += 1
+
+
+def run_profile(profile: str, duration: int, writers: int, readers: int):
+    scratch_database()
+    from server.server_helper.db import configure_sqlite, effective_pragmas
+
+    if profile == "before":
+        configure_sqlite(DEFAULT_PROFILE)
+    base = start_server()
+    headers = get_token_headers(httpx.Client(base_url=base))
+    stats = {"checkins": 0, "reads": 0, "errors": 0}
+    stop = threading.Event()
+    threads = [threading.Thread(target=writer, args=(base, headers, stop, stats)) for _ in range(writers)]
+    threads += [threading.Thread(target=reader, args=(base, headers, stop, stats)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    print(f"{profile:<7} {effective_pragmas()}")
+    print(
+        f"{profile:<7} checkins/s={stats['checkins'] / duration:.1f} "
+        f"reads/s={stats['reads'] / duration:.1f} errors={stats['errors']}"
+    )
+
+
+if __name__ == "__main__":
+    opts = argparse.ArgumentParser(description="sqlite tuning profile benchmark")
+    opts.add_argument("-d", "--duration", default=10, type=int, dest="duration")
+    opts.add_argument("-w", "--writers", default=8, type=int, dest="writers")
+    opts.add_argument("-r", "--readers", default=8, type=int, dest="readers")
+    opts.add_argument("--profile", choices=["before", "after"], dest="profile")
+    args = opts.parse_args()
+
+    if args.profile:
+        run_profile(args.profile, args.duration, args.writers, args.readers)
+    else:
+        for name in ("before", "after"):
+            subprocess.run([sys.executable, __file__, "--profile", name, "-d", str(args.duration),
+                            "-w", str(args.writers), "-r", str(args.readers)], check=True)
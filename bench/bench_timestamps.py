@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""
+Row size and range query speed of the tasking table before and after 0006_epoch_timestamps, on
+a scratch database of a million tasks. The string schema is measured as shipped (no index on date)
+and with a text index on date, then the same file is migrated and measured again.
+
+    python3 bench/bench_timestamps.py -n 1000000
+"""
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+from bench_helper import SCHEMA_PATH, scratch_database, timer
+
+scratch_database()
+
+from server.server_helper.column_helper import TASK_STATES  # noqa: E402
+from server.server_helper.migrations import apply_migration, discover_migrations  # noqa: E402
+
+STATES = ["False", "Pending", "True", "True", "True", "Dead"]
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DAYS = 90
+
+
+def build(db_path: Path, count: int) -> None:
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.executescript(SCHEMA_PATH.read_text())
+    for version, path in discover_migrations():
+        if version < 6:
+            apply_migration(conn, version, path)
+    conn.executemany("INSERT INTO implants (session) VALUES (?)", [(f"{i:08x}",) for i in range(1000)])
+    step = timedelta(days=DAYS) / count
+    rows = (
+        (f"{random.randrange(1000):08x}", (START + step * i).isoformat(), "ls", "/tmp", random.choice(STATES))
+        for i in range(count)
+    )
+    conn.execute("BEGIN")
+    conn.executemany("INSERT INTO tasking (session, date, task, args, complete) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.execute("COMMIT")
+    conn.close()
+
+
+def table_bytes(conn, count: int) -> str:
+    conn.execute("VACUUM")
+    pages = conn.execute("PRAGMA page_count").fetchone()[0] * conn.execute("PRAGMA page_size").fetchone()[0]
+    return f"{pages / 1e6:.1f} MB file, {pages / count:.1f} bytes per task"
+
+
+def range_queries(conn, label: str, bound) -> None:
+    # tasks of the last day, and the ones of that day still queued
+    queued = TASK_STATES["False"] if label == "epoch" else "False"
+    queries = {
+        "count since": ("SELECT count(*) FROM tasking WHERE date >= ?", (bound(DAYS - 1),)),
+        "queued since": ("SELECT count(*) FROM tasking WHERE date >= ? AND complete = ?", (bound(DAYS - 1), queued)),
+    }
+    for name, (sql, params) in queries.items():
+        conn.execute(sql, params).fetchone()
+        runs = 20
+        with timer() as elapsed:
+            for _ in range(runs):
+                found = conn.execute(sql, params).fetchone()[0]
+        print(f"  {name:>13}: {elapsed['seconds'] / runs * 1000:8.2f} ms ({found} rows)")
+
+
+def main():
+    opts = argparse.ArgumentParser(description="integer timestamp schema benchmark")
+    opts.add_argument("-n", "--count", default=1_000_000, type=int, dest="count", help="tasks in the table")
+    args = opts.parse_args()
+
+    db_path = Path(tempfile.mkdtemp(prefix="lighthouse-bench-")) / "database.db"
+    build(db_path, args.count)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+
+    def iso(day):
+        return (START + timedelta(days=day)).isoformat()
+
+    def epoch(day):
+        return (START + timedelta(days=day) - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(microseconds=1)
+
+    print(f"strings, as shipped: {table_bytes(conn, args.count)}")
+    range_queries(conn, "iso", iso)
+    conn.execute("CREATE INDEX idx_tasking_date_text ON tasking (date)")
+    print(f"strings, text index on date: {table_bytes(conn, args.count)}")
+    range_queries(conn, "iso", iso)
+    conn.execute("DROP INDEX idx_tasking_date_text")
+
+    started = time.perf_counter()
+    apply_migration(conn, 6, discover_migrations()[5][1])
+    print(f"migrated in {time.perf_counter() - started:.1f}s")
+    print(f"integers: {table_bytes(conn, args.count)}")
+    range_queries(conn, "epoch", epoch)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
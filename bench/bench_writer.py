@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Write throughput with 100 concurrent writers, once with every route committing its own write and
+once through the group commit writer. Each writer registers an implant then loops queueing a task
+and checking in to claim it, two writes per round. Requests go through the app in process.
+
+    python3 bench/bench_writer.py -w 100 -r 20
+"""
+import argparse
+import asyncio
+import base64
+import random
+import string
+
+import httpx
+
+from bench_helper import scratch_database, get_token_headers, timer
+
+
+async def agent(client: httpx.AsyncClient, headers: dict, rounds: int, stats: dict):
+    session = "".join(random.choices(string.hexdigits, k=8))
+    await client.post("/implants/", json={"session": session, "callback_freq": 1, "jitter": 15})
+    data = {"task": "ls", "args": base64.b64encode(b"/tmp").hex()}
+    for _ in range(rounds):
+        queued = await client.post(f"/tasking/{session}", headers=headers, json=data)
+        claimed = await client.get(f"/health/v2/{session}")
+        for response in (queued, claimed):
+            stats["writes" if response.status_code == 200 else "errors"] += 1
+
+
+async def run(mode: str, writers: int, rounds: int) -> dict:
+    from sqlalchemy import event
+    from server.lighthouse import app
+    from server.server_helper.db import async_engine, writer_engine
+    from server.server_helper.writer_helper import writer
+
+    from fastapi.testclient import TestClient
+
+    headers = get_token_headers(TestClient(app))
+    stats = {"writes": 0, "errors": 0, "commits": 0}
+
+    def record(conn):
+        stats["commits"] += 1
+
+    for engine in (async_engine, writer_engine):
+        event.listen(engine.sync_engine, "commit", record)
+    if mode == "group":
+        await writer.start()
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        with timer() as elapsed:
+            await asyncio.gather(*[agent(client, headers, rounds, stats) for _ in range(writers)])
+    if mode == "group":
+        await writer.stop()
+    await async_engine.dispose()
+    stats["seconds"] = elapsed["seconds"]
+    return stats
+
+
+def main():
+    opts = argparse.ArgumentParser(description="group commit writer benchmark")
+    opts.add_argument("-w", "--writers", default=100, type=int, dest="writers", help="concurrent writers")
+    opts.add_argument("-r", "--rounds", default=20, type=int, dest="rounds", help="task/check in rounds per writer")
+    args = opts.parse_args()
+
+    scratch_database()
+    for mode in ("inline", "group"):
+        stats = asyncio.run(run(mode, args.writers, args.rounds))
+        rate = stats["writes"] / stats["seconds"]
+        print(
+            f"{mode:>6}: {stats['writes']} writes in {stats['seconds']:.2f}s ({rate:.0f}/s), "
+            f"{stats['commits']} commits, {stats['errors']} errors"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+import json
+from time import sleep
+
+import httpx
+from prompt_toolkit import print_formatted_text
+
+# seconds to wait before reconnecting after the stream ends or drops
+RECONNECT_SECONDS = 5
+
+EVENT_MESSAGES = {
+    "result_arrived": "[+] Result {tasking_id} ({task}) arrived from session {session}",
+    "task_picked_up": "[*] Session {session} picked up tasking {tasking_ids}",
+    "session_registered": "[+] New session {session} ({username}@{hostname})",
+    "session_deregistered": "[*] Session {session} deregistered",
+    "session_lost": "[-] Session {session} missed its check in, marked dead",
+}
+
+
+def format_event(message: dict) -> str:
+    """
+    Turn a lighthouse event into the one line notification shown in merchant
+    :param message: The decoded data of one server-sent event
+    :return: The notification text
+    """
+    template = EVENT_MESSAGES.get(message.get("event"))
+    if template is None:
+        return f"[*] {message}"
+    try:
+        return template.format(**message)
+    except KeyError:
+        return f"[*] {message}"
+
+
+def read_events(response):
+    """
+    Parse a text/event-stream response, comment lines (keepalives) are skipped
+    :param response: A streaming httpx response from GET /events/
+    :return: A generator of decoded event data
+    """
+    data = []
+    for line in response.iter_lines():
+        if line.startswith("data:"):
+            data.append(line[5:].strip())
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+
+
+def listen_events(server: str) -> None:
+    """
+    Subscribe to the lighthouse event stream and print notifications as they arrive. Meant to run in a
+    daemon thread, the stream is reopened with the current token whenever the server closes it
+    :param server: The lighthouse server address
+    :return: None
+    """
+    url = f"https://{server}/events/"
+    while True:
+        with open(".auth-token", "r") as fp:
+            token = fp.read()
+        headers = {"Authorization": f"Bearer {token}"}
+        try:
+            with httpx.stream("GET", url, headers=headers, verify=False, timeout=None) as response:
+                if response.status_code == 200:
+                    for message in read_events(response):
+                        print_formatted_text(format_event(message))
+        except (httpx.HTTPError, json.JSONDecodeError):
+            pass
+        sleep(RECONNECT_SECONDS)
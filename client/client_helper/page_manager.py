@@ -0,0 +1,26 @@
+#!/usr/bin/python3
+import httpx
+
+# rows requested per page from the lighthouse list endpoints (server caps it at 1000)
+PAGE_SIZE = 100
+
+
+def fetch_pages(url: str, headers: dict, params: dict = None):
+    """
+    Walk a paginated lighthouse list endpoint one page at a time using the after_id cursor.
+    Stops after a short page or the first response that is not a 200 json array
+    :param url: The list endpoint to page through
+    :param headers: The request headers including the bearer token
+    :param params: Optional filter query parameters sent with every page
+    :return: A generator of httpx responses, one per page
+    """
+    params = dict(params or {}, limit=PAGE_SIZE)
+    while True:
+        response = httpx.get(url, headers=headers, params=params, verify=False)
+        yield response
+        if response.status_code != 200 or not isinstance(response.json(), list):
+            return
+        page = response.json()
+        if len(page) < PAGE_SIZE:
+            return
+        params["after_id"] = page[-1]["id"]
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+from prettytable import PrettyTable
+from prompt_toolkit import print_formatted_text
+from prompt_toolkit.formatted_text import ANSI
+
+# local imports
+from client.client_helper.user_manager import fix_date
+from client.client_helper.page_manager import fetch_pages
+
+# matches in a snippet are printed bold red
+MARK_OPEN = "\x1b[1;31m"
+MARK_CLOSE = "\x1b[0m"
+
+
+def phrase_query(text: str) -> str:
+    # the operator looks for a literal string, quoted it is one fts5 phrase and AND / NOT / * are just words
+    return '"' + text.replace('"', '""') + '"'
+
+
+def create_search_table(json_data: list):
+    table = PrettyTable()
+    table.field_names = ["ID", "Session", "Date", "Task", "Match"]
+    table.align["Match"] = "l"
+    for hit in json_data:
+        # one line per hit, the output around the match may span several
+        snippet = " ".join(hit.get("snippet", "").split())
+        table.add_row(
+            [hit.get("tasking_id"), hit.get("session"), fix_date(hit.get("date")), hit.get("task"), snippet]
+        )
+    return table
+
+
+def search_results(token: str, server: str, text: str) -> None:
+    """
+    Finds the results whose decoded output contains text, across every session, newest first.
+    :param token: The authentication token for the lighthouse server
+    :param server: The lighthouse server address
+    :param text: The string to look for
+    :return: None
+    """
+    url = f"https://{server}/results/search"
+    headers = {
+        "accept": "application/json",
+        "Authorization": f"Bearer {token}",
+    }
+    params = {"q": phrase_query(text), "mark_open": MARK_OPEN, "mark_close": MARK_CLOSE}
+    for page_number, response in enumerate(fetch_pages(url, headers, params)):
+        if response.status_code == 200:
+            print_search_page(response.json(), page_number, text)
+        elif response.status_code == 400:
+            print_formatted_text(f"[*] {response.json().get('detail')}")
+        elif (
+            response.status_code == 401
+            and response.json().get("detail") == "Bad Credentials"
+        ):
+            print_formatted_text("[*] Invalid token...time to reauthenticate")
+            return
+        else:
+            print_formatted_text(response.status_code, response.text, response)
+
+
+def print_search_page(json_data, page_number: int, text: str) -> None:
+    """
+    Prints one page of search hits, the first page says so when nothing matched.
+    :param json_data: The decoded response body of the page
+    :param page_number: The index of the page, 0 for the first
+    :param text: The string searched for
+    :return: None
+    """
+    if not isinstance(json_data, list):
+        print_formatted_text("[*] Unknown data returned")
+        print_formatted_text(json_data)
+    elif page_number == 0 and not json_data:
+        print_formatted_text(f"[*] No results contain {text}")
+    elif json_data:
+        print_formatted_text(ANSI(create_search_table(json_data).get_string()))
@@ -4,8 +4,9 @@ import shlex
 import base64
 import binascii
 import gzip
-import io
 import os
+import zlib
+from urllib.parse import unquote
 
 from prettytable import PrettyTable
 
@@ -16,7 +17,8 @@ from prompt_toolkit import print_formatted_text
 
 # local imports
 from client.client_helper.user_manager import fix_date
-from client.client_helper.tasking_manager import get_tasking, send_task, format_args
+from client.client_helper.page_manager import fetch_pages
+from client.client_helper.tasking_manager import get_tasking, send_task, send_upload
 from client.client_helper.help_manager import (
     print_info_help,
     print_download_help,
@@ -80,37 +82,35 @@ def format_output(output: str) -> str:
         return ""
 
 
-def format_download_output(output):
-    try:
-        # hex -> base64 -> gzip
-        decoded_bytes = bytes.fromhex(output)
-        decoded_data = base64.b64decode(decoded_bytes)
-        with gzip.GzipFile(fileobj=io.BytesIO(decoded_data)) as gz:
-            decompressed_data = gz.read()
-        return decompressed_data.decode("utf-8", errors="replace")
-    except Exception as e:
-        # we had a download error and the error messages are base64 -> hex
-        # call the normal viewer
-        print_formatted_text(format_output(output))
+def decode_raw_output(task: str, content: bytes) -> str:
+    """
+    Turn a raw result from lighthouse into printable text
+    :param task: The task the result belongs to
+    :param content: The raw result bytes, for downloads the agent's gzip stream
+    :return: The decoded text
+    """
+    if task == "download":
+        try:
+            content = gzip.decompress(content)
+        except (OSError, EOFError, zlib.error):
+            # a failed download sends back the error message instead of a gzip stream
+            pass
+    return content.decode("utf-8", errors="replace")
 
 
-def get_download_result(response: list):
-    result = response.json()
+def format_raw_result(response, session: str, id: int) -> None:
+    task = response.headers.get("x-task", "Null")
+    if task == "upload":
+        print_formatted_text("[+] No output for upload commands")
+        return
     table = PrettyTable()
     table.field_names = ["ID", "Session", "Date Received", "Task", "Args"]
-    id = result.get("id")
-    session_id = result.get("session")
-    date_received = result.get("date", "Null")
-    if date_received != "Null":
-        date_received_formatted = fix_date(date_received)
-    else:
-        date_received_formatted = "Null"
-    task = result.get("task", "Null")
-    args = result.get("args", "Null")
-    table.add_row([id, session_id, date_received_formatted, task, args])
+    date_received = response.headers.get("x-date")
+    date_received_formatted = fix_date(date_received) if date_received else "Null"
+    args = unquote(response.headers.get("x-args", ""))
+    table.add_row([id, session, date_received_formatted, task, args])
     print_formatted_text(table)
-    output = result.get("results", "Null")
-    print_formatted_text(format_download_output(output))
+    print_formatted_text(decode_raw_output(task, response.content))
 
 
 def get_result(token: str, server: str, session: str, id: int) -> None:
@@ -122,9 +122,9 @@ def get_result(token: str, server: str, session: str, id: int) -> None:
     :param id: The ID of the task result to retrieve
     :return: None
     """
-    url = f"https://{server}/results/{session}/{id}"
+    # raw bytes, no hex / base64 to undo here
+    url = f"https://{server}/results/v2/{session}/{id}"
     headers = {
-        "accept": "application/json",
         "Authorization": f"Bearer {token}",
     }
 
@@ -137,8 +137,7 @@ def get_result(token: str, server: str, session: str, id: int) -> None:
         case 401:
             print_formatted_text("[*] Invalid token...time to reauthenticate")
         case 200:
-            result = response.json()
-            format_results_table(result, response)
+            format_raw_result(response, session, id)
         case _:
             print_formatted_text(response.status_code, response.text, response)
 
@@ -177,31 +176,6 @@ def format_creds_table(result: list, response) -> None:
     print_formatted_text(table)
     
 
-def format_results_table(result: list, response) -> None:
-    if result.get("task") == "download":
-        get_download_result(response)
-        return
-    table = PrettyTable()
-    table.field_names = ["ID", "Session", "Date Received", "Task", "Args"]
-    id = result.get("id")
-    session_id = result.get("session")
-    date_received = result.get("date", "Null")
-    if date_received != "Null":
-        date_received_formatted = fix_date(date_received)
-    else:
-        date_received_formatted = "Null"
-    task = result.get("task", "Null")
-    if task == "upload":
-        print_formatted_text("[+] No output for upload commands")
-        return
-    args = result.get("args", "Null")
-    table.add_row([id, session_id, date_received_formatted, task, args])
-    print_formatted_text(table)
-    output = result.get("results", "Null")
-    print_formatted_text(format_output(output))
-
-
-
 def format_sessions(sessions: list) -> None:
     """
     Formats the session data into a table for display in the merchant client.
@@ -247,8 +221,8 @@ def format_sessions(sessions: list) -> None:
 
 def get_sessions(token: str, server: str) -> None:
     """
-    Grab all sessions from the lighthouse server. Data will be returned in a json array,
-    data is passed to format_session() to properly display the session data
+    Grab all sessions from the lighthouse server a page at a time. Each page is a json array,
+    passed to format_session() to properly display the session data as it arrives
     :param token: The token used to auth to lighthouse server
     :param server: The uri for the lighthouse server to retrieve the sessions
     :return: None
@@ -259,19 +233,20 @@ def get_sessions(token: str, server: str) -> None:
         "Authorization": f"Bearer {token}",
     }
     try:
-        response = httpx.get(url, headers=headers, verify=False)
-        if (
-            response.status_code == 401
-            and response.json().get("detail") == "Bad Credentials"
-        ):
-            print_formatted_text("[*] Invalid token...time to reauthenticate")
+        for page_number, response in enumerate(fetch_pages(url, headers)):
+            if (
+                response.status_code == 401
+                and response.json().get("detail") == "Bad Credentials"
+            ):
+                print_formatted_text("[*] Invalid token...time to reauthenticate")
 
-        elif response.status_code == 200 and isinstance(response.json(), list):
-            # proper json array
-            format_sessions(response.json())
-        else:
-            print_formatted_text("[*] Invalid data format")
-            print_formatted_text(response.status_code, response.text, response)
+            elif response.status_code == 200 and isinstance(response.json(), list):
+                # proper json array, an empty trailing page has nothing to show
+                if page_number == 0 or response.json():
+                    format_sessions(response.json())
+            else:
+                print_formatted_text("[*] Invalid data format")
+                print_formatted_text(response.status_code, response.text, response)
     except httpx.ConnectError as e:
         print_formatted_text("[-] Connection Refused to Lighthouse")
 
@@ -546,14 +521,10 @@ def handle_ssh_monitor(token: str, server: str, session_id: str, args: list) ->
 
 def handle_upload(token: str, server: str, session_id: str, args: list) -> None:
     if len(args) == 2:
-        # get binary formatted properly and ship it here as args[0]
-        # we also should specify what to name it likely need another arg here
-        dst_path = format_args(args[1])
+        # the gzip compressed file is the raw request body, the destination a plain arg
         success, binary_to_send = process_upload_binary(args[0])
         if success:
-            send_task(
-                token, server, session_id, "upload", dst_path + ":" + binary_to_send
-            )
+            send_upload(token, server, session_id, args[1], binary_to_send)
             return
     else:
         print_formatted_text(
@@ -561,28 +532,19 @@ def handle_upload(token: str, server: str, session_id: str, args: list) -> None:
         )
 
 
-def format_upload_binary(bin_contents: bytes) -> str:
-    buf = io.BytesIO()
-    with gzip.GzipFile(fileobj=buf, mode="wb") as gz:
-        gz.write(bin_contents)
-    compressed_bytes = buf.getvalue()
-    base64_bytes = base64.b64encode(compressed_bytes)
-    return base64_bytes.hex()
-
-
-def process_upload_binary(file_path: str) -> tuple[bool, str]:
+def process_upload_binary(file_path: str) -> tuple[bool, bytes]:
     if not os.path.exists(file_path):
         print_formatted_text(f"[!!!] {file_path} no such file or directory")
-        return False, ""
+        return False, b""
     try:
         with open(file_path, "rb") as fp:
             contents = fp.read()
-            final_bin = format_upload_binary(contents)
-        return True, final_bin  # <-- return string
+        # fixed mtime so the same file always compresses the same, lighthouse stores it once
+        return True, gzip.compress(contents, mtime=0)
 
     except Exception as e:
         print_formatted_text(f"[!!!] {e}")
-        return False, ""
+        return False, b""
 
 
 def validate_reconfig_values(args):
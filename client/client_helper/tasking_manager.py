@@ -7,6 +7,7 @@ from prompt_toolkit import print_formatted_text
 from prettytable import PrettyTable
 
 from client.client_helper.user_manager import fix_date
+from client.client_helper.page_manager import fetch_pages
 
 
 def format_output(output: str) -> str:
@@ -24,17 +25,6 @@ def format_output(output: str) -> str:
         return ""
 
 
-def format_args(args: str) -> str:
-    """
-    Base64 encodes the arguments and converts them to a hex string.
-    This is to ensure no special characters break the tasking.
-    :param args: The arguments to be formatted
-    :return: A hex string representation of the base64 encoded arguments
-    """
-    based = base64.b64encode(args.encode("utf-8"))
-    return based.hex()
-
-
 def send_task(token: str, server: str, session: str, tasking: str, args: str) -> None:
     """
     Sends a task to the lighthouse server for a specific session.
@@ -45,18 +35,31 @@ def send_task(token: str, server: str, session: str, tasking: str, args: str) ->
     :param args: The arguments for the task
     :return: None
     """
-    argsf = format_args(args)
-    url = f"https://{server}/tasking/{session}"
+    submit_task(token, server, session, {"task": tasking, "args": args})
+
+
+def send_upload(token: str, server: str, session: str, destination: str, payload: bytes) -> None:
+    """
+    Sends an upload task, the gzip compressed file goes as the raw request body
+    :param token: The authentication token for the lighthouse server
+    :param server: The lighthouse server address
+    :param session: The session ID to which the task is sent
+    :param destination: The path the agent writes the file to
+    :param payload: The gzip compressed file
+    :return: None
+    """
+    submit_task(token, server, session, {"task": "upload", "args": destination}, payload)
+
+
+def submit_task(token: str, server: str, session: str, params: dict, payload: bytes = b"") -> None:
+    # args are plain query parameters and files the raw body, nothing is hex / base64 encoded
+    url = f"https://{server}/tasking/v2/{session}"
     headers = {
         "accept": "application/json",
         "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
-    data = {
-        "task": f"{tasking}",
-        "args": f"{argsf}",
+        "Content-Type": "application/octet-stream",
     }
-    response = httpx.post(url, headers=headers, json=data, verify=False)
+    response = httpx.post(url, headers=headers, params=params, content=payload, verify=False)
     if response.status_code == 200:
         data = response.json()
         completed = data.get("complete")
@@ -100,10 +103,11 @@ def create_tasking_table(json_data: list):
         if date_sent != "Null":
             date_sent_formatted = fix_date(date_sent)
         task = tasking.get("task")
+        # the list only carries a preview, uploads preview just their destination
         if task == "upload":
-            args = reformat_upload(tasking.get("args"))
+            args = reformat_upload(tasking.get("args_preview"))
         else:
-            args = tasking.get("args")
+            args = tasking.get("args_preview")
         complete = tasking.get("complete")
         table.add_row(
             [id, session_id, date_sent_formatted, task, args, complete]
@@ -113,7 +117,7 @@ def create_tasking_table(json_data: list):
 
 def get_tasking(token: str, session: str, server: str) -> None:
     """
-    Retrieves tasking for a specific session from the lighthouse server.
+    Retrieves tasking for a specific session from the lighthouse server, a page at a time.
     :param token: The authentication token for the lighthouse server
     :param session: The session ID for which to retrieve tasking
     :param server: The lighthouse server address
@@ -124,21 +128,21 @@ def get_tasking(token: str, session: str, server: str) -> None:
         "accept": "application/json",
         "Authorization": f"Bearer {token}",
     }
-    response = httpx.get(url, headers=headers, verify=False)
-    if response.status_code == 200:
-        json_data = response.json()
-        if isinstance(json_data, list):
-            print_formatted_text(create_tasking_table(json_data))
+    for page_number, response in enumerate(fetch_pages(url, headers)):
+        if response.status_code == 200:
+            json_data = response.json()
+            if not isinstance(json_data, list):
+                print_formatted_text("[*] Unknown data returned")
+                print_formatted_text(json_data)
+            elif page_number == 0 or json_data:
+                print_formatted_text(create_tasking_table(json_data))
+        elif response.status_code == 404:
+            print_formatted_text(f"[*] Session id {session} not found!")
+        elif (
+            response.status_code == 401
+            and response.json().get("detail") == "Bad Credentials"
+        ):
+            print_formatted_text("[*] Invalid token...time to reauthenticate")
+            return
         else:
-            print_formatted_text("[*] Unknown data returned")
-            print_formatted_text(json_data)
-    elif response.status_code == 404:
-        print_formatted_text(f"[*] Session id {session} not found!")
-    elif (
-        response.status_code == 401
-        and response.json().get("detail") == "Bad Credentials"
-    ):
-        print_formatted_text("[*] Invalid token...time to reauthenticate")
-        return
-    else:
-        print_formatted_text(response.status_code, response.text, response)
+            print_formatted_text(response.status_code, response.text, response)
@@ -5,6 +5,8 @@ import datetime
 from prompt_toolkit import print_formatted_text
 from prettytable import PrettyTable
 
+from client.client_helper.page_manager import fetch_pages
+
 
 def fix_date(raw_date: str) -> str:
     """
@@ -75,9 +77,24 @@ def user_delete(token: str, server: str, user_id: int) -> None:
         print_formatted_text(response.status_code, response.text, response)
 
 
+def format_users_table(users: list) -> PrettyTable:
+    table = PrettyTable()
+    table.field_names = ["ID", "Username", "Created At"]
+    for user in users:
+        id = user.get("id")
+        username = user.get("username")
+        created_at = user.get("created_at", "Null")
+        if created_at != "Null":
+            created_at_formatted = fix_date(created_at)
+        else:
+            created_at_formatted = "Null"
+        table.add_row([id, username, created_at_formatted])
+    return table
+
+
 def get_users(token: str, server: str) -> None:
     """
-    Fetches all users from the lighthouse database
+    Fetches all users from the lighthouse database, a page at a time
     :param token: The authentication token for the lighthouse server
     :param server: The lighthouse server address
     :return: None
@@ -87,32 +104,23 @@ def get_users(token: str, server: str) -> None:
         "accept": "application/json",
         "Authorization": f"Bearer {token}",
     }
-    response = httpx.get(url, headers=headers, verify=False)
-    if response.status_code != 200:
-        print_formatted_text("[*] Error fetching users")
-        print_formatted_text(response.status_code, response.text, response)
-    elif (
-        response.status_code == 401
-        and response.json().get("detail") == "Bad Credentials"
-    ):
-        print_formatted_text("[*] Invalid token...time to reauthenticate")
-    else:
-        if isinstance(response.json(), list):
-            table = PrettyTable()
-            table.field_names = ["ID", "Username", "Created At"]
-            for user in response.json():
-                id = user.get("id")
-                username = user.get("username")
-                created_at = user.get("created_at", "Null")
-                if created_at != "Null":
-                    created_at_formatted = fix_date(created_at)
-                else:
-                    created_at_formatted = "Null"
-                table.add_row([id, username, created_at_formatted])
-            print_formatted_text(table)
+    for page_number, response in enumerate(fetch_pages(url, headers)):
+        if response.status_code != 200:
+            print_formatted_text("[*] Error fetching users")
+            print_formatted_text(response.status_code, response.text, response)
+        elif (
+            response.status_code == 401
+            and response.json().get("detail") == "Bad Credentials"
+        ):
+            print_formatted_text("[*] Invalid token...time to reauthenticate")
         else:
-            print_formatted_text("[*] Invalid data format")
-            print_formatted_text(response.json())
+            if isinstance(response.json(), list):
+                if page_number and not response.json():
+                    continue
+                print_formatted_text(format_users_table(response.json()))
+            else:
+                print_formatted_text("[*] Invalid data format")
+                print_formatted_text(response.json())
 
 
 def get_user(token: str, server: str, id: int) -> None:
@@ -13,6 +13,7 @@ from prompt_toolkit import PromptSession
 from prompt_toolkit.completion import WordCompleter
 from prompt_toolkit.styles import Style
 from prompt_toolkit import print_formatted_text
+from prompt_toolkit.patch_stdout import patch_stdout
 
 # local imports
 from client.client_helper.user_manager import (
@@ -24,6 +25,8 @@ from client.client_helper.user_manager import (
 )
 from client.client_helper.session_manager import get_sessions, test_session, interact_implant
 from client.client_helper.tasking_manager import get_tasking
+from client.client_helper.event_manager import listen_events
+from client.client_helper.search_manager import search_results
 
 # currently not using this logger, keeping for future use
 log_format = "%(asctime)s - %(message)s"
@@ -51,6 +54,7 @@ completer_server = WordCompleter(
         "user_add",
         "user_delete",
         "tasking",
+        "search",
         "interact",
         "quit",
     ]
@@ -77,16 +81,8 @@ def command_router(cmd: str, args: list, server: str) -> None:
             sys.exit(2)
         case "users":
             get_users(token, server)
-        case "user_add":
-            handle_user_add(args, token, server)
-        case "user_delete":
-            handle_user_delete(args, token, server)
-        case "user":
-            handle_user(args, token, server)
-        case "interact":
-            handle_interact(args, token, server)                
-        case "tasking":
-            handle_tasking(args, token, server)
+        case _ if cmd in command_handlers:
+            command_handlers[cmd](args, token, server)
 
 
 def handle_user_delete(args: list, token: str, server: str):
@@ -137,6 +133,25 @@ def handle_tasking(args: list, token: str, server: str):
         print_formatted_text("[*] Expecting session id -> tasking <session-id>")
 
 
+def handle_search(args: list, token: str, server: str):
+    if args:
+        # the words are searched for as one string, search root password finds "root password"
+        search_results(token, server, " ".join(args))
+    else:
+        print_formatted_text("[*] Expecting a string to find -> search <text>")
+
+
+# the commands that take arguments, each handler checks its own
+command_handlers = {
+    "user_add": handle_user_add,
+    "user_delete": handle_user_delete,
+    "user": handle_user,
+    "interact": handle_interact,
+    "tasking": handle_tasking,
+    "search": handle_search,
+}
+
+
 def auth_timer(seconds: int, username: str, password: str, server: str):
     sleep(seconds - 120)
     token = authenticate(username, password, server)
@@ -157,9 +172,24 @@ def driver(username: str, password: str, server: str):
     timer_thread = threading.Thread(target=auth_timer, args=(1800,username, password, server,), daemon=True)
     timer_thread.start()
 
+    # result and session notifications are pushed by lighthouse, printed above the prompt as they arrive
+    event_thread = threading.Thread(target=listen_events, args=(server,), daemon=True)
+    event_thread.start()
+
     session = PromptSession()
     print_formatted_text("[+] Enter <tab> to see available commands")
 
+    with patch_stdout():
+        prompt_loop(session, server)
+
+
+def prompt_loop(session: PromptSession, server: str):
+    """
+    Read commands until the operator quits and pass them to the command router
+    :param session: The prompt_toolkit session reading input
+    :param server: The lighthouse server address
+    :return: None
+    """
     while True:
         options = session.prompt(
             message=message_server, style=style_server, completer=completer_server
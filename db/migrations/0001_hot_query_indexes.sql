@@ -0,0 +1,13 @@
+-- indexes for the per-session lookups every agent / merchant route makes
+
+-- check_in, get_tasks and read_taskings filter tasking by session + complete
+CREATE INDEX IF NOT EXISTS idx_tasking_session_complete ON tasking (session, complete);
+
+-- only the handful of not yet completed rows per session, used when agents claim work
+CREATE INDEX IF NOT EXISTS idx_tasking_open ON tasking (session, id) WHERE complete != 'True';
+
+-- read_result
+CREATE INDEX IF NOT EXISTS idx_results_session_tasking ON results (session, tasking_id);
+
+-- get_creds
+CREATE INDEX IF NOT EXISTS idx_results_session_task ON results (session, task);
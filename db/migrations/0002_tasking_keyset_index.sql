@@ -0,0 +1,3 @@
+-- read_taskings pages through a session by id (after_id cursor), walk the index in order
+-- instead of sorting every task of the session for each page
+CREATE INDEX IF NOT EXISTS idx_tasking_session_id ON tasking (session, id);
@@ -0,0 +1,38 @@
+"""
+Blob store references on tasking and results, then move the large upload / download payloads
+already stored inline (hex(base64(gzip)) text) out to the blob store.
+"""
+from server.server_helper.blob_helper import blobs, offload_download_results, offload_upload_args
+
+BATCH = 100
+
+
+def add_columns(conn) -> None:
+    for table in ("tasking", "results"):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN blob_ref TEXT")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN blob_size INTEGER")
+
+
+def move_payloads(conn, table: str, column: str, task: str, offload) -> None:
+    # walk the candidate rows by id a batch at a time, never the whole table in memory
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            f"SELECT id, {column} FROM {table} WHERE task = ? AND length({column}) >= ? AND id > ? "
+            f"ORDER BY id LIMIT {BATCH}",
+            (task, blobs.threshold, last_id),
+        ).fetchall()
+        for row_id, value in rows:
+            fields = offload(value)
+            if fields:
+                assignments = ", ".join(f"{name} = ?" for name in fields)
+                conn.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", (*fields.values(), row_id))
+        if len(rows) < BATCH:
+            return
+        last_id = rows[-1][0]
+
+
+def upgrade(conn) -> None:
+    add_columns(conn)
+    move_payloads(conn, "results", "results", "download", offload_download_results)
+    move_payloads(conn, "tasking", "args", "upload", offload_upload_args)
@@ -0,0 +1,12 @@
+-- lease based dispatch: a handed out (Pending) task goes out again only once its lease expires,
+-- attempts counts deliveries and the task is marked Dead after too many
+ALTER TABLE tasking ADD COLUMN lease_expires TEXT;
+ALTER TABLE tasking ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0;
+
+-- tasks already Pending were handed out under the old resend-every-poll rule, make them due now
+UPDATE tasking SET lease_expires = strftime('%Y-%m-%dT%H:%M:%S+00:00', 'now'), attempts = 1
+WHERE complete = 'Pending';
+
+-- claims look for expired leases of a session and the registry reads its earliest expiry,
+-- only Pending rows carry a lease so the index stays small
+CREATE INDEX IF NOT EXISTS idx_tasking_lease ON tasking (session, lease_expires) WHERE complete = 'Pending';
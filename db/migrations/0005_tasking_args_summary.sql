@@ -0,0 +1,12 @@
+-- size and preview of args kept next to them, so the tasking list never reads args (upload args
+-- can be the whole encoded file). Uploads preview their encoded destination, everything else
+-- the first 128 characters (ARGS_PREVIEW in tasking_helper.py)
+ALTER TABLE tasking ADD COLUMN args_size INTEGER;
+ALTER TABLE tasking ADD COLUMN args_preview TEXT;
+
+UPDATE tasking SET
+    args_size = length(CAST(coalesce(args, '') AS BLOB)),
+    args_preview = CASE
+        WHEN task = 'upload' THEN substr(coalesce(args, ''), 1, instr(coalesce(args, '') || ':', ':') - 1)
+        ELSE substr(coalesce(args, ''), 1, 128)
+    END;
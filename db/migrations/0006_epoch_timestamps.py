@@ -0,0 +1,112 @@
+"""
+Dates as integer microseconds since the epoch and tasking.complete as a small integer, so range
+queries ("not seen in an hour", "tasks since") compare and index numbers instead of strings.
+sqlite can't change a column's type, implants, tasking and results are rebuilt and their indexes
+recreated against the integer values. The api keeps returning the strings (column_helper.py).
+"""
+from server.server_helper.column_helper import TASK_STATES, to_epoch_micros
+
+REBUILDS_TABLES = True
+
+TABLES = {
+    "implants": """
+        CREATE TABLE implants_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session TEXT UNIQUE NOT NULL,
+            first_checkin INTEGER, -- microseconds since the epoch, UTC
+            last_checkin INTEGER,
+            alive BOOLEAN,
+            callback_freq INTEGER, -- Minutes
+            jitter INTEGER,        -- Integer treated as % of callback_freq
+            username TEXT,
+            hostname TEXT
+        )""",
+    "tasking": """
+        CREATE TABLE tasking_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session TEXT NOT NULL,
+            date INTEGER,
+            task TEXT,
+            args TEXT,
+            complete INTEGER DEFAULT 0, -- 0 False, 1 Pending, 2 True, 3 Dead
+            blob_ref TEXT,
+            blob_size INTEGER,
+            lease_expires INTEGER,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            args_size INTEGER,
+            args_preview TEXT,
+            FOREIGN KEY (session) REFERENCES implants(session) ON DELETE CASCADE
+        )""",
+    "results": """
+        CREATE TABLE results_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tasking_id INTEGER NOT NULL,
+            session TEXT NOT NULL,
+            date INTEGER,
+            task TEXT,
+            args TEXT,
+            results TEXT,
+            blob_ref TEXT,
+            blob_size INTEGER,
+            FOREIGN KEY (session) REFERENCES implants(session) ON DELETE CASCADE,
+            FOREIGN KEY (tasking_id) REFERENCES tasking(id) ON DELETE CASCADE
+        )""",
+}
+
+# the converted columns of each table, everything else is copied as is
+CONVERTED = {
+    "implants": {"first_checkin": "epoch_us", "last_checkin": "epoch_us"},
+    "tasking": {"date": "epoch_us", "lease_expires": "epoch_us", "complete": "task_state"},
+    "results": {"date": "epoch_us"},
+}
+
+INDEXES = [
+    "CREATE INDEX idx_tasking_session_complete ON tasking (session, complete)",
+    "CREATE INDEX idx_tasking_open ON tasking (session, id) WHERE complete != 2",
+    "CREATE INDEX idx_tasking_session_id ON tasking (session, id)",
+    "CREATE INDEX idx_tasking_lease ON tasking (session, lease_expires) WHERE complete = 1",
+    "CREATE INDEX idx_results_session_tasking ON results (session, tasking_id)",
+    "CREATE INDEX idx_results_session_task ON results (session, task)",
+    # the range queries the integer dates are for
+    "CREATE INDEX idx_implants_last_checkin ON implants (last_checkin)",
+    "CREATE INDEX idx_tasking_date ON tasking (date)",
+    "CREATE INDEX idx_results_date ON results (date)",
+]
+
+
+def epoch_us(value):
+    # a date that never parsed as isoformat can't be placed in time, it becomes NULL
+    try:
+        return to_epoch_micros(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def copy_table(conn, table: str) -> None:
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+    converted = [f"{CONVERTED[table][c]}({c})" if c in CONVERTED[table] else c for c in columns]
+    conn.execute(TABLES[table])
+    conn.execute(f"INSERT INTO {table}_new ({', '.join(columns)}) SELECT {', '.join(converted)} FROM {table}")
+
+
+def restore_sequence(conn, table: str, seq: int) -> None:
+    # ids of deleted rows above the current max are never handed out again
+    if not conn.execute("UPDATE sqlite_sequence SET seq = max(seq, ?) WHERE name = ?", (seq, table)).rowcount:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)", (table, seq))
+
+
+def upgrade(conn) -> None:
+    conn.create_function("epoch_us", 1, epoch_us, deterministic=True)
+    conn.create_function("task_state", 1, TASK_STATES.get, deterministic=True)
+    sequences = dict(conn.execute("SELECT name, seq FROM sqlite_sequence"))
+    for table in TABLES:
+        copy_table(conn, table)
+    # children first, nothing is left referencing a dropped table
+    for table in reversed(list(TABLES)):
+        conn.execute(f"DROP TABLE {table}")
+    for table in TABLES:
+        conn.execute(f"ALTER TABLE {table}_new RENAME TO {table}")
+        restore_sequence(conn, table, sequences.get(table, 0))
+    # one statement at a time, executescript would commit the migration half done
+    for statement in INDEXES:
+        conn.execute(statement)
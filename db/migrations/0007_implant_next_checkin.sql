@@ -0,0 +1,8 @@
+-- the time each session is next expected to check in (microseconds since the epoch, like last_checkin):
+-- last_checkin plus callback_freq minutes plus the full jitter. The liveness reaper marks alive
+-- sessions dead once this is behind by more than its grace, a range read of the partial index
+ALTER TABLE implants ADD COLUMN next_checkin INTEGER;
+
+UPDATE implants SET next_checkin = last_checkin + callback_freq * 60000000 * (100 + coalesce(jitter, 0)) / 100;
+
+CREATE INDEX IF NOT EXISTS idx_implants_next_checkin ON implants (next_checkin) WHERE alive = 1;
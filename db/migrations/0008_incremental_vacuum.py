@@ -0,0 +1,25 @@
+"""
+Space freed by the retention purge goes back to the filesystem with PRAGMA incremental_vacuum, which
+needs auto_vacuum = INCREMENTAL. An existing database only switches mode with a full VACUUM, run once
+here. Also indexes results.tasking_id, deleting tasks (and their ON DELETE CASCADE) looked up their
+results with a full scan, and blob_ref, the purge checks a blob is no longer referenced before removing it.
+"""
+
+# VACUUM can't run inside a transaction, every step is safe to run again if this fails part way
+OUTSIDE_TRANSACTION = True
+
+INCREMENTAL = 2
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_results_tasking ON results (tasking_id)",
+    "CREATE INDEX IF NOT EXISTS idx_results_blob_ref ON results (blob_ref) WHERE blob_ref IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS idx_tasking_blob_ref ON tasking (blob_ref) WHERE blob_ref IS NOT NULL",
+]
+
+
+def upgrade(conn) -> None:
+    for statement in INDEXES:
+        conn.execute(statement)
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
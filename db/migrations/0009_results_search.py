@@ -0,0 +1,16 @@
+"""
+Full-text search over the decoded text of results. results_fts is an fts5 table of the output and
+session keyed by the result id, the writer indexes new results as they are stored and a trigger drops
+them again when the row is deleted (retention, archiving, a purged session). Everything already
+stored is indexed once here.
+"""
+from server.server_helper.search_helper import backfill
+
+
+def upgrade(conn) -> None:
+    conn.execute("CREATE VIRTUAL TABLE results_fts USING fts5(output, session, tokenize = 'unicode61')")
+    conn.execute(
+        "CREATE TRIGGER results_fts_delete AFTER DELETE ON results BEGIN "
+        "DELETE FROM results_fts WHERE rowid = old.id; END"
+    )
+    backfill(conn)
@@ -15,6 +15,8 @@ if [ -f "$DB_PATH" ]; then
   echo "Removing existing database: $DB_PATH"
   rm -f "$DB_PATH"
 fi
+# a write-ahead log left behind would be replayed onto the new database
+rm -f "$DB_PATH-wal" "$DB_PATH-shm"
 
 # Recreate database from schema
 echo "Rebuilding database from schema..."
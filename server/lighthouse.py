@@ -1,14 +1,31 @@
 #!/usr/bin/python3
 import argparse
+import asyncio
 import sys
+from contextlib import asynccontextmanager, suppress
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 import uvicorn
+from anyio import to_thread
 from fastapi import FastAPI
 
-from server.server_helper.lighthouse_config import parse_config, parse_config_vals
+from server.server_helper.db import configure_sqlite, effective_pragmas
+from server.server_helper.lighthouse_config import parse_config, parse_config_vals, TUNABLE_DEFAULTS
+from server.server_helper.heartbeat_helper import heartbeats
+from server.server_helper.reaper_helper import reaper
+from server.server_helper.retention_helper import retention
+from server.server_helper.archive_helper import archive
+from server.server_helper.migrations import run_migrations
+from server.server_helper.registry_helper import registry
+from server.server_helper.blob_helper import blobs
+from server.server_helper.transfer_helper import transfers
+from server.server_helper.longpoll_helper import notifier
+from server.server_helper.tasking_helper import leases
+from server.server_helper.compression_helper import CompressionMiddleware, compression
+from server.server_helper.body_helper import BodyLimitMiddleware, body_limits
+from server.server_helper.writer_helper import writer
 
 from server.routes.user_routes import router as user_router
 from server.routes.health_routes import router as health_router
@@ -17,8 +34,92 @@ from server.routes.implant_routes import router as implant_router
 from server.routes.task_routes import router as task_router
 from server.routes.tasking_routes import router as tasking_router
 from server.routes.token_routes import router as token_router
+from server.routes.event_routes import router as event_router
+from server.routes.retention_routes import router as retention_router
 
-app = FastAPI()
+# runtime tunables from lighthouse.conf, defaults apply when the app is imported (tests, benchmarks)
+tunables = dict(TUNABLE_DEFAULTS)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # routes are async, this only bounds what is left running in the threadpool
+    to_thread.current_default_thread_limiter().total_tokens = tunables["threadpool_size"]
+    run_migrations()
+    print(f"SQLite settings: {effective_pragmas()}")
+    print(f"Loaded {await registry.load()} sessions into the session registry")
+    await writer.start()
+    heartbeat_flusher = asyncio.create_task(heartbeats.run())
+    background_jobs = start_background_jobs()
+    yield
+    for task in background_jobs:
+        task.cancel()
+    heartbeat_flusher.cancel()
+    # a flush in flight puts its sessions back once its cancellation has run
+    with suppress(asyncio.CancelledError):
+        await heartbeat_flusher
+    # last flush so no check in recorded before shutdown is lost, then drain the writer
+    await heartbeats.flush()
+    await writer.stop()
+
+
+def start_background_jobs() -> list:
+    """
+    Start the periodic jobs lighthouse.conf turns on, the heartbeat flush always runs and is started apart
+    :return: The started tasks, cancelled on shutdown
+    """
+    jobs = []
+    if reaper.interval:
+        jobs.append(reaper.run())
+    if retention.interval and (retention.enabled() or transfers.expire_hours):
+        jobs.append(retention.run())
+    if archive.interval and archive.after_days:
+        if archive.available():
+            jobs.append(archive.run())
+        else:
+            print("archive_after_days is set but the zstandard package is not installed, results are not archived")
+    return [asyncio.create_task(job) for job in jobs]
+
+
+def apply_tunables(web_server) -> None:
+    tunables.update(web_server.tunables)
+    heartbeats.flush_interval = tunables["heartbeat_flush_interval"]
+    reaper.interval = tunables["reaper_interval"]
+    reaper.grace = tunables["reaper_grace"]
+    retention.interval = tunables["retention_interval"]
+    retention.max_age_days = tunables["retention_max_age_days"]
+    retention.max_results = tunables["retention_max_results"]
+    retention.dead_days = tunables["retention_dead_days"]
+    retention.batch = tunables["retention_batch"]
+    retention.vacuum_pages = tunables["retention_vacuum_pages"]
+    archive.after_days = tunables["archive_after_days"]
+    archive.interval = tunables["archive_interval"]
+    archive.batch = tunables["archive_batch"]
+    archive.segment_size = tunables["archive_segment_size"]
+    registry.max_size = tunables["session_cache_size"]
+    notifier.max_wait = tunables["longpoll_max_wait"]
+    notifier.max_waiters = tunables["longpoll_max_waiters"]
+    blobs.threshold = tunables["blob_threshold"]
+    transfers.max_chunk = tunables["transfer_max_chunk"]
+    transfers.expire_hours = tunables["transfer_expire_hours"]
+    leases.duration = tunables["task_lease_seconds"]
+    leases.max_attempts = tunables["task_max_attempts"]
+    writer.max_batch = tunables["writer_max_batch"]
+    writer.max_delay = tunables["writer_max_delay"]
+    compression.min_size = tunables["compression_min_size"]
+    compression.encodings = tunables["compression_encodings"]
+    body_limits.spool_threshold = tunables["body_spool_threshold"]
+    body_limits.limits = {key.removeprefix("body_limit_"): val for key, val in tunables.items() if key.startswith("body_limit_")}
+    if tunables["blob_dir"]:
+        blobs.root = Path(tunables["blob_dir"])
+    if tunables["archive_dir"]:
+        archive.root = Path(tunables["archive_dir"])
+    configure_sqlite({key.removeprefix("sqlite_"): val for key, val in tunables.items() if key.startswith("sqlite_")})
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware, settings=compression)
+app.add_middleware(BodyLimitMiddleware, settings=body_limits)
 
 app.include_router(user_router)
 app.include_router(health_router)
@@ -27,6 +128,8 @@ app.include_router(implant_router)
 app.include_router(task_router)
 app.include_router(tasking_router)
 app.include_router(token_router)
+app.include_router(event_router)
+app.include_router(retention_router)
 
 if __name__ == '__main__':
     opts = argparse.ArgumentParser(description="light_house server application")
@@ -35,5 +138,6 @@ if __name__ == '__main__':
     
     conf = parse_config(args.config)
     web_server = parse_config_vals(conf)
+    apply_tunables(web_server)
     uvicorn.run(app, host=web_server.listen_host, port=web_server.listen_port, ssl_certfile=web_server.server_crt, ssl_keyfile=web_server.server_key)
 
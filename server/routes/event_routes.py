@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+from fastapi import APIRouter, Security
+from fastapi.responses import StreamingResponse
+
+from server.server_helper.auth_helper import oauth2_scheme, verify_token
+from server.server_helper.events_helper import events, format_sse
+
+router = APIRouter(prefix="/events", tags=["events"])
+
+# seconds between keepalive comments on an idle stream, stops proxies timing the connection out
+KEEPALIVE_SECONDS = 15
+
+
+# PROTECTED endpoint for clients to subscribe to server events as a server-sent event stream
+@router.get("/")
+async def stream_events(token: str = Security(oauth2_scheme)):
+    """
+    Push result_arrived, task_picked_up, session_registered and session_deregistered events to merchant
+    as they happen. The stream ends when the jwt expires, merchant reconnects with its refreshed token
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return: A text/event-stream response
+    """
+    payload = verify_token(token)
+    return StreamingResponse(
+        event_stream(payload["exp"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+async def event_stream(expires: float):
+    subscriber = events.subscribe()
+    queue, _ = subscriber
+    try:
+        # send something straight away so the client sees the stream is open
+        yield ": connected\n\n"
+        while (remaining := expires - time.time()) > 0:
+            try:
+                message = await asyncio.wait_for(queue.get(), min(KEEPALIVE_SECONDS, remaining))
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield format_sse(message)
+    finally:
+        # also runs when the client goes away and the response is cancelled
+        events.unsubscribe(subscriber)
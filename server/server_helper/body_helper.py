@@ -0,0 +1,279 @@
+#!/usr/bin/python3
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Callable, TextIO
+
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import Headers
+
+# local imports
+from .blob_helper import blobs, COPY_CHUNK
+
+# largest request body per route (first path segment), default covers every other route, 0 is no limit.
+# results and tasking carry legacy hex(base64()) transfers, 8/3 the size of the file itself
+BODY_LIMITS = {
+    "default": 1 << 20,
+    "results": 1 << 30,
+    "tasking": 1 << 30,
+}
+# the chars that end a run of plain string content in json
+STRING_SPECIAL = re.compile(r'["\\]')
+# longest number / true / false / null FlatJsonReader reads, the fields it parses are ids and flags
+MAX_SCALAR = 64
+TOO_LARGE = "Request body too large"
+
+
+class BodyLimits:
+    """
+    Request body size limits and the size above which a body is spooled to disk instead of memory
+    """
+
+    def __init__(self, limits: dict = None, spool_threshold: int = 1 << 20):
+        self.limits = dict(limits or BODY_LIMITS)
+        self.spool_threshold = spool_threshold  # bodies larger than this are written to a temp file
+
+    @property
+    def spool_dir(self) -> Path:
+        # under the blob store, spooled payloads are renamed into it rather than copied
+        return blobs.root / ".spool"
+
+    def limit_for(self, path: str) -> int:
+        route = path.strip("/").split("/", 1)[0]
+        return self.limits.get(route, self.limits["default"])
+
+
+class BodyLimitMiddleware:
+    """
+    ASGI middleware enforcing the body limits, a Content-Length over the limit is refused before
+    anything is read and a body without one is cut off (413) as soon as it passes the limit
+    """
+
+    def __init__(self, app, settings: BodyLimits = None):
+        self.app = app
+        self.settings = settings or body_limits
+
+    async def __call__(self, scope, receive, send):
+        limit = self.settings.limit_for(scope["path"]) if scope["type"] == "http" else 0
+        if not limit:
+            await self.app(scope, receive, send)
+            return
+        length = Headers(scope=scope).get("content-length", "")
+        if length.isdigit() and int(length) > limit:
+            await JSONResponse({"detail": TOO_LARGE}, status_code=413)(scope, receive, send)
+            return
+        await self.app(scope, limited_receive(receive, limit), send)
+
+
+def limited_receive(receive, limit: int):
+    # counts body bytes as the app reads them, the HTTPException becomes a 413 response
+    received = 0
+
+    async def wrapped():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise HTTPException(status_code=413, detail=TOO_LARGE)
+        return message
+
+    return wrapped
+
+
+async def spool_body(request: Request, limit: int = 0) -> bytes | Path:
+    """
+    Read a request body, one larger than spool_threshold is written to a temp file as it arrives
+    :param request: The request to read
+    :param limit: Largest body accepted in bytes, tighter than the route's body limit, 0 for none
+    :return: The body, or the path of the temp file holding it (the caller removes it), 413 as soon
+    as it passes limit
+    """
+    buffered, size, spool = [], 0, None
+    try:
+        async for piece in request.stream():
+            size += len(piece)
+            if 0 < limit < size:
+                raise HTTPException(status_code=413, detail=TOO_LARGE)
+            if spool is None and size <= body_limits.spool_threshold:
+                buffered.append(piece)
+                continue
+            if spool is None:
+                body_limits.spool_dir.mkdir(parents=True, exist_ok=True)
+                spool = tempfile.NamedTemporaryFile(dir=body_limits.spool_dir, prefix="body-", delete=False)
+                spool.writelines(buffered)
+                buffered = []
+            spool.write(piece)
+    except BaseException:
+        if spool is not None:
+            spool.close()
+            os.unlink(spool.name)
+        raise
+    if spool is None:
+        return b"".join(buffered)
+    spool.close()
+    return Path(spool.name)
+
+
+class FlatJsonReader:
+    # incremental reader for a json object of scalar values, only a chunk of the text is held at once
+    def __init__(self, fp: TextIO, max_field: int):
+        self.fp = fp
+        self.max_field = max_field  # longest string value kept in memory
+        self.buf = ""
+        self.pos = 0
+
+    def fill(self, need: int = 1) -> bool:
+        # make at least need unread chars available, False once the text runs out
+        while len(self.buf) - self.pos < need:
+            more = self.fp.read(COPY_CHUNK)
+            if not more:
+                return False
+            self.buf = self.buf[self.pos:] + more
+            self.pos = 0
+        return True
+
+    def next_char(self) -> str:
+        # the next char that is not whitespace, consumed
+        while self.fill():
+            char = self.buf[self.pos]
+            self.pos += 1
+            if char not in " \t\r\n":
+                return char
+        raise ValueError("Unexpected end of json body")
+
+    def read_string(self, write: Callable[[str], object]) -> None:
+        # the opening quote is consumed, unescaped content goes to write up to the closing quote
+        while self.fill():
+            match = STRING_SPECIAL.search(self.buf, self.pos)
+            end = len(self.buf) if match is None else match.start()
+            write(self.buf[self.pos:end])
+            self.pos = end
+            if match is None:
+                continue
+            self.pos += 1
+            if match.group() == '"':
+                return
+            self.read_escape(write)
+        raise ValueError("Unterminated string in json body")
+
+    def read_escape(self, write: Callable[[str], object]) -> None:
+        # the backslash is consumed, room for a \uXXXX\uXXXX surrogate pair
+        self.fill(11)
+        length = 1
+        if self.buf.startswith("u", self.pos):
+            length = 5
+            if 0xD800 <= int(self.buf[self.pos + 1:self.pos + 5], 16) < 0xDC00:
+                length = 11 if self.buf.startswith("\\u", self.pos + 5) else 5
+        write(json.loads('"\\' + self.buf[self.pos:self.pos + length] + '"'))
+        self.pos += length
+
+    def read_small_string(self) -> str:
+        pieces = []
+        size = 0
+
+        def write(piece: str) -> None:
+            nonlocal size
+            size += len(piece)
+            if size > self.max_field:
+                raise ValueError("String value too long in json body")
+            pieces.append(piece)
+
+        self.read_string(write)
+        return "".join(pieces)
+
+    def read_scalar(self, first: str):
+        # a number, true, false or null starting with first
+        if first in "{[":
+            raise ValueError("Nested objects and arrays are not supported in json body")
+        token = first
+        while self.fill() and self.buf[self.pos] not in ",} \t\r\n":
+            if len(token) == MAX_SCALAR:
+                raise ValueError("Value too long in json body")
+            token += self.buf[self.pos]
+            self.pos += 1
+        return json.loads(token)
+
+    def read_pair(self, char: str, spill_key: str, spill: TextIO) -> tuple:
+        if char != '"':
+            raise ValueError("Expected a key in json body")
+        key = self.read_small_string()
+        if self.next_char() != ":":
+            raise ValueError("Expected ':' in json body")
+        char = self.next_char()
+        if key == spill_key:
+            # a repeated key replaces the earlier value, as in json.loads
+            spill.seek(0)
+            spill.truncate()
+        if char == '"' and key == spill_key:
+            self.read_string(spill.write)
+            return key, ""
+        if char == '"':
+            return key, self.read_small_string()
+        return key, self.read_scalar(char)
+
+    def read_object(self, spill_key: str, spill: TextIO) -> dict:
+        """
+        Read the whole object, the spill_key string is written to spill instead of being kept
+        :param spill_key: The key of the (large) string value to stream out
+        :param spill: Where its unescaped value is written
+        :return: The other fields, spill_key maps to an empty string
+        """
+        if self.next_char() != "{":
+            raise ValueError("Expected a json object")
+        fields = {}
+        char = self.next_char()
+        while char != "}":
+            key, value = self.read_pair(char, spill_key, spill)
+            fields[key] = value
+            char = self.next_char()
+            if char == ",":
+                char = self.next_char()
+            elif char != "}":
+                raise ValueError("Expected ',' or '}' in json body")
+        return fields
+
+
+def read_spooled_json(model: type[BaseModel], body: Path, spill_key: str) -> tuple[BaseModel, Path]:
+    """
+    Parse and validate a json body spooled to disk without loading it, one large string field is
+    streamed to a file of its own. Runs on a worker thread
+    :param model: The model the body must validate as, spill_key is validated as an empty string
+    :param body: The spooled body
+    :param spill_key: The field to stream out
+    :return: The validated model and the file holding the spill_key value (the caller removes it)
+    """
+    spill_path = body.with_suffix(f".{spill_key}")
+    try:
+        with open(body, encoding="utf-8", newline="") as fp, open(spill_path, "w", encoding="utf-8", newline="") as spill:
+            fields = FlatJsonReader(fp, body_limits.spool_threshold).read_object(spill_key, spill)
+        return model.model_validate(fields), spill_path
+    except (ValueError, UnicodeDecodeError) as e:
+        spill_path.unlink(missing_ok=True)
+        raise body_validation_error(e) from e
+
+
+def validate_body(model: type[BaseModel], body: bytes) -> BaseModel:
+    # the in memory path, same 422 a declared body parameter gives
+    try:
+        return model.model_validate_json(body)
+    except ValidationError as e:
+        raise body_validation_error(e) from e
+
+
+def body_validation_error(error: ValueError) -> RequestValidationError:
+    if isinstance(error, ValidationError):
+        return RequestValidationError(
+            [dict(item, loc=("body", *item["loc"])) for item in error.errors(include_url=False)]
+        )
+    return RequestValidationError(
+        [{"type": "json_invalid", "loc": ("body",), "msg": "JSON decode error", "ctx": {"error": str(error)}}]
+    )
+
+
+body_limits = BodyLimits()
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import Integer
+from sqlalchemy.types import TypeDecorator
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+# tasking.complete as stored, the api keeps the names
+TASK_STATES = {"False": 0, "Pending": 1, "True": 2, "Dead": 3}
+TASK_STATE_NAMES = {number: name for name, number in TASK_STATES.items()}
+
+
+def to_epoch_micros(value: str | None) -> int | None:
+    """
+    An isoformat date as microseconds since the epoch, naive times are taken as UTC
+    :param value: The date string, as datetime.isoformat() writes it
+    :return: The integer stored in the database
+    """
+    if value is None:
+        return None
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return (moment - EPOCH) // MICROSECOND
+
+
+def from_epoch_micros(value: int | None) -> str | None:
+    # the same string datetime.now(timezone.utc).isoformat() gave before the column was converted
+    if value is None:
+        return None
+    return (EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+class EpochMicros(TypeDecorator):
+    """
+    A UTC date stored as integer microseconds since the epoch, so range filters compare (and index)
+    numbers. Python code and the api keep using isoformat strings
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return value if isinstance(value, int) else to_epoch_micros(value)
+
+    def process_result_value(self, value, dialect):
+        return from_epoch_micros(value)
+
+
+class TaskState(TypeDecorator):
+    """
+    tasking.complete stored as a small integer (TASK_STATES), read and written as the state names
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return value if value is None or isinstance(value, int) else TASK_STATES[value]
+
+    def process_result_value(self, value, dialect):
+        return TASK_STATE_NAMES.get(value)
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+import zlib
+
+from anyio import to_thread
+from starlette.datastructures import Headers, MutableHeaders
+
+# zstd and brotli are optional, gzip is always available
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# only text the server builds itself, already compressed payloads (blobs) and event streams pass through
+COMPRESSIBLE_TYPES = ("application/json", "text/plain")
+# whole bodies this big are compressed on a worker thread, a 50MB download result would stall the loop
+THREAD_THRESHOLD = 1 << 20
+
+
+class BrotliCompressor:
+    # brotli.Compressor with the compress / flush interface of zlib and zstandard
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=4)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+# fast levels, hex / base64 text compresses nearly as well at these and level 5+ gzip costs more time
+# on a 50MB download result than the smaller transfer saves (bench/bench_compression.py)
+CODECS = {"gzip": lambda: zlib.compressobj(1, zlib.DEFLATED, 31)}
+if zstandard is not None:
+    CODECS["zstd"] = lambda: zstandard.ZstdCompressor(level=3).compressobj()
+if brotli is not None:
+    CODECS["br"] = BrotliCompressor
+
+
+class ResponseCompression:
+    """
+    Settings for the response compression middleware, the encoding used is the first of encodings
+    (server preference) that the client accepts and is installed here
+    """
+
+    def __init__(self, min_size: int = 1024, encodings: str = "zstd,br,gzip"):
+        self.min_size = min_size  # smaller bodies are sent as they are
+        self.encodings = encodings  # comma separated preference, empty turns compression off
+
+    def negotiate(self, accept_encoding: str) -> str | None:
+        """
+        Pick the response encoding for a request
+        :param accept_encoding: The Accept-Encoding request header
+        :return: The encoding to use, None to send the body uncompressed
+        """
+        accepted = set()
+        for item in accept_encoding.lower().split(","):
+            name, _, params = item.partition(";")
+            quality = params.strip().removeprefix("q=")
+            try:
+                if params and float(quality) == 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(name.strip())
+        for encoding in self.encodings.split(","):
+            encoding = encoding.strip()
+            if encoding in CODECS and (encoding in accepted or "*" in accepted):
+                return encoding
+        return None
+
+
+def compress_body(encoding: str, body: bytes) -> bytes:
+    compressor = CODECS[encoding]()
+    return compressor.compress(body) + compressor.flush()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing json / text responses with the encoding negotiated from Accept-Encoding.
+    Single message bodies get a new Content-Length, streamed bodies are compressed chunk by chunk
+    """
+
+    def __init__(self, app, settings: ResponseCompression = None):
+        self.app = app
+        self.settings = settings or compression
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.settings.negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = CompressedResponder(send, encoding, self.settings.min_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressedResponder:
+    # wraps send for one response, holds the start message until the first body chunk decides
+    def __init__(self, send, encoding: str, min_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.min_size = min_size
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    def compressible(self, headers: MutableHeaders) -> bool:
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        return content_type in COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+    async def send(self, message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+        elif message["type"] != "http.response.body" or self.passthrough:
+            await self.flush_start()
+            await self._send(message)
+        elif self.compressor is not None:
+            await self.send_chunk(message)
+        else:
+            await self.send_first(message)
+
+    async def flush_start(self) -> None:
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self._send(start)
+
+    async def send_first(self, message) -> None:
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not self.compressible(headers) or (not more_body and len(body) < self.min_size):
+            self.passthrough = True
+            await self.flush_start()
+            await self._send(message)
+            return
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            # length unknown until the stream ends
+            del headers["Content-Length"]
+            self.compressor = CODECS[self.encoding]()
+            await self.flush_start()
+            await self.send_chunk(message)
+            return
+        if len(body) >= THREAD_THRESHOLD:
+            body = await to_thread.run_sync(compress_body, self.encoding, body)
+        else:
+            body = compress_body(self.encoding, body)
+        headers["Content-Length"] = str(len(body))
+        await self.flush_start()
+        await self._send({"type": "http.response.body", "body": body})
+
+    async def send_chunk(self, message) -> None:
+        more_body = message.get("more_body", False)
+        body = self.compressor.compress(message.get("body", b""))
+        if not more_body:
+            body += self.compressor.flush()
+        await self._send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+
+compression = ResponseCompression()
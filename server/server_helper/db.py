@@ -1,14 +1,72 @@
 #!/usr/bin/python3
+import os
 import sqlite3
 from pathlib import Path
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-DATABASE_URL = Path(__file__).resolve().parent.parent.parent / "db" / "database.db"
+# LIGHTHOUSE_DB lets tests and benchmarks point the server at a scratch database
+DATABASE_URL = Path(
+    os.environ.get(
+        "LIGHTHOUSE_DB",
+        Path(__file__).resolve().parent.parent.parent / "db" / "database.db",
+    )
+)
 engine = create_engine(f"sqlite:///{DATABASE_URL}", connect_args={"check_same_thread": False})
+# routes use the async engine, the sync one is left for migrations, startup checks and tests
+async_engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_URL}")
+# the group commit writer's own connection, routes waiting on the writer hold pooled connections of
+# async_engine and must not be able to starve it of one
+writer_engine = create_async_engine(f"sqlite+aiosqlite:///{DATABASE_URL}", pool_size=1, max_overflow=0)
+
+# PRAGMAs set on every new sqlite connection, the sqlite_* keys in lighthouse.conf override them
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",  # operator reads no longer block agent writes
+    "synchronous": "NORMAL",  # safe with WAL, fsync on checkpoint instead of every commit
+    "busy_timeout": 5000,  # ms to wait on a locked database before "database is locked"
+    "cache_size": -65536,  # negative is KiB, 64 MiB page cache per connection
+    "mmap_size": 268435456,  # 256 MiB of the file memory mapped
+    "foreign_keys": True,  # schema.sql turns these on but that only lasts for its own connection
+}
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+@event.listens_for(writer_engine.sync_engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+
+def configure_sqlite(pragmas: dict) -> None:
+    """
+    Override the connection PRAGMAs, pooled connections are dropped so every connection gets the new values
+    :param pragmas: PRAGMA name -> value
+    :return: None
+    """
+    SQLITE_PRAGMAS.update(pragmas)
+    engine.dispose()
+    # aiosqlite connections can only be closed from the event loop, just drop them from the pool
+    async_engine.sync_engine.dispose(close=False)
+    writer_engine.sync_engine.dispose(close=False)
+
+
+def effective_pragmas() -> dict:
+    # what sqlite actually settled on, journal_mode=WAL can silently fail on some filesystems
+    with engine.connect() as conn:
+        return {pragma: conn.exec_driver_sql(f"PRAGMA {pragma}").scalar() for pragma in SQLITE_PRAGMAS}
+
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+# expire_on_commit=False, an expired attribute would lazy load outside the event loop during serialization
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+WriterSessionLocal = async_sessionmaker(
+    bind=writer_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 Base.metadata.create_all(bind=engine)
@@ -20,3 +78,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+import asyncio
+import json
+from datetime import datetime, timezone
+
+RESULT_ARRIVED = "result_arrived"
+TASK_PICKED_UP = "task_picked_up"
+SESSION_REGISTERED = "session_registered"
+SESSION_DEREGISTERED = "session_deregistered"
+SESSION_LOST = "session_lost"
+
+
+class EventBus:
+    """
+    Fan out of server events to the merchant event streams (GET /events/). Every subscriber gets its own
+    bounded queue, a subscriber that stops reading loses events instead of growing server memory.
+    """
+
+    def __init__(self, queue_size: int = 1000):
+        self.queue_size = queue_size
+        self.dropped = 0
+        self._subscribers = set()  # (queue, loop it is read on)
+
+    def subscribe(self) -> tuple:
+        subscriber = (asyncio.Queue(self.queue_size), asyncio.get_running_loop())
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: tuple) -> None:
+        self._subscribers.discard(subscriber)
+
+    def publish(self, event: str, **data) -> None:
+        """
+        Queue an event for every subscriber, safe to call from any route or thread
+        :param event: The event type, one of the module level event names
+        :param data: The event payload, must be json serializable
+        :return: None
+        """
+        message = {"event": event, "date": datetime.now(timezone.utc).isoformat(), **data}
+        for queue, loop in list(self._subscribers):
+            loop.call_soon_threadsafe(self._offer, queue, message)
+
+    def _offer(self, queue: asyncio.Queue, message: dict) -> None:
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+
+def format_sse(message: dict) -> str:
+    # one server-sent event, the event type doubles as the sse event name
+    return f"event: {message['event']}\ndata: {json.dumps(message)}\n\n"
+
+
+events = EventBus()
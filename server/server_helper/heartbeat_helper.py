@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+import threading
+from functools import partial
+
+from sqlalchemy import bindparam, update
+
+# local imports
+from .column_helper import EpochMicros
+from .implant_helper import Implant, next_checkin_sql
+from .job_helper import run_periodic
+from .registry_helper import registry
+from .writer_helper import writer
+
+
+class HeartbeatBuffer:
+    """
+    Write-behind buffer for Implant.last_checkin. Check ins only record the latest time per session
+    in memory, a background task flushes every buffered session with one batched UPDATE, which also
+    moves next_checkin along and brings a session the liveness reaper gave up on back to alive.
+    """
+
+    def __init__(self, flush_interval: float = 5.0):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def record(self, session: str, check_in_time: str) -> None:
+        with self._lock:
+            self._pending[session] = check_in_time
+
+    def discard(self, session: str) -> None:
+        # used when a route writes last_checkin itself, the buffered value must not clobber it
+        with self._lock:
+            self._pending.pop(session, None)
+
+    def get(self, session: str) -> str | None:
+        with self._lock:
+            return self._pending.get(session)
+
+    def merge(self, implant):
+        """
+        Overlay the unflushed check in time on an implant read from the database
+        :param implant: A pydantic implant model (ImplantCreate / ImplantRead)
+        :return: The same model, with last_checkin replaced if a newer one is buffered
+        """
+        last_checkin = self.get(implant.session)
+        if last_checkin is not None:
+            implant.last_checkin = last_checkin
+        return implant
+
+    async def flush(self) -> int:
+        """
+        Write every buffered check in time to the implants table in a single executemany UPDATE
+        :return: The number of sessions flushed
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        check_in = bindparam("b_last_checkin", type_=EpochMicros)
+        stmt = (
+            update(Implant.__table__)
+            .where(Implant.__table__.c.session == bindparam("b_session"))
+            .values(last_checkin=check_in, next_checkin=next_checkin_sql(check_in), alive=True)
+        )
+        rows = [{"b_session": s, "b_last_checkin": t} for s, t in pending.items()]
+        try:
+            await writer.submit(partial(execute_write, stmt, rows))
+        except BaseException:
+            # put the values back unless a newer check in already replaced them, also when the
+            # flush loop is cancelled at shutdown with the write in flight
+            with self._lock:
+                for session, check_in_time in pending.items():
+                    self._pending.setdefault(session, check_in_time)
+            raise
+        for session in pending:
+            registry.update(session, alive=True)
+        return len(rows)
+
+    async def run(self) -> None:
+        # flush loop started from the FastAPI lifespan, the final flush happens on shutdown
+        await run_periodic("Heartbeat flush", self.flush_interval, self.flush)
+
+
+async def execute_write(stmt, rows: list, db) -> None:
+    await db.execute(stmt, rows)
+
+
+heartbeats = HeartbeatBuffer()
@@ -1,23 +1,27 @@
 #!/usr/bin/python3
+from datetime import datetime, timedelta
 from pydantic import BaseModel
 from typing import Optional
-from sqlalchemy import Column, Integer, String, Boolean, Text
+from sqlalchemy import Column, Integer, String, Boolean, Text, func
 
 # local imports
+from .column_helper import EpochMicros
 from .db import Base
+from .pagination_helper import PageQuery, paginate, prefix_filter
 
 
 class Implant(Base):
     __tablename__ = "implants"
     id = Column(Integer, primary_key=True, index=True)
     session = Column(String, unique=True, nullable=False)
-    first_checkin = Column(String)
-    last_checkin = Column(String)
+    first_checkin = Column(EpochMicros)
+    last_checkin = Column(EpochMicros)
     alive = Column(Boolean)
     callback_freq = Column(Integer)
     jitter = Column(Integer)
     username = Column(Text)
     hostname = Column(Text)
+    next_checkin = Column(EpochMicros)  # when the session is next due, see next_checkin below
 
 
 class ImplantCreate(BaseModel):
@@ -33,6 +37,49 @@ class ImplantCreate(BaseModel):
 
 class ImplantRead(ImplantCreate):
     id: int
+    next_checkin: Optional[str] = None
 
     class Config:
         form_attributes = True
+
+
+# the implant list selects exactly the ImplantRead fields, in order, for the serialization fast path
+READ_COLUMNS = tuple(getattr(Implant, name) for name in ImplantRead.model_fields)
+
+
+class ImplantQuery(PageQuery):
+    alive: Optional[bool] = None
+    hostname: Optional[str] = None  # prefix
+    username: Optional[str] = None  # prefix
+
+
+def implants_page(stmt, query: ImplantQuery):
+    """
+    Narrow an implants select to the requested filters and page
+    :param stmt: The select over the implants table
+    :param query: The filter and pagination query parameters
+    :return: The filtered, paged select
+    """
+    if query.alive is not None:
+        stmt = stmt.where(Implant.alive == query.alive)
+    stmt = prefix_filter(stmt, Implant.hostname, query.hostname)
+    stmt = prefix_filter(stmt, Implant.username, query.username)
+    return paginate(stmt, Implant.id, query)
+
+
+def next_checkin(check_in_time: str, callback_freq: int | None, jitter: int | None) -> str:
+    """
+    When a session that checked in at check_in_time is next due, callback_freq minutes plus the
+    whole jitter percentage (the agent adds between 0 and jitter % to each sleep)
+    :param check_in_time: The isoformat time of the check in
+    :param callback_freq: The callback frequency in minutes
+    :param jitter: The jitter cap, as a percentage of callback_freq
+    :return: The isoformat time the next check in is expected by
+    """
+    window = timedelta(minutes=callback_freq or 0) * (100 + (jitter or 0)) / 100
+    return (datetime.fromisoformat(check_in_time) + window).isoformat()
+
+
+def next_checkin_sql(check_in, callback_freq=Implant.callback_freq):
+    # next_checkin for UPDATEs, check_in must be bound as EpochMicros so the sum stays in microseconds
+    return check_in + callback_freq * 60_000_000 * (100 + func.coalesce(Implant.jitter, 0)) // 100
@@ -0,0 +1,29 @@
+#!/usr/bin/python3
+import asyncio
+from datetime import datetime, timezone
+
+
+def utc_now() -> datetime:
+    # the default clock of the background jobs, tests swap in a fake one
+    return datetime.now(timezone.utc)
+
+
+async def run_periodic(name: str, interval: float, job, report=None) -> None:
+    """
+    The loop of every background job started from the FastAPI lifespan, a failed run is retried on
+    the next interval instead of ending the loop
+    :param name: What a run does, the start of the failure message
+    :param interval: Seconds to sleep before each run
+    :param job: Coroutine function doing one run
+    :param report: Optional callable given what each run returned, for the jobs that log their work
+    :return: None, runs until cancelled
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            done = await job()
+        except Exception as e:
+            print(f"{name} failed, retrying next interval: {e}")
+            continue
+        if report is not None:
+            report(done)
@@ -1,5 +1,46 @@
 
 
+from .body_helper import BODY_LIMITS
+from .db import SQLITE_PRAGMAS
+
+# optional runtime tunables, anything left out of lighthouse.conf falls back to these values
+TUNABLE_DEFAULTS = {
+    "heartbeat_flush_interval": 5.0,  # seconds between batched last_checkin writes
+    "reaper_interval": 30.0,  # seconds between liveness sweeps, 0 disables the reaper
+    "reaper_grace": 60.0,  # seconds past its expected check in before a session is marked dead
+    "retention_interval": 3600.0,  # seconds between background retention purges, 0 leaves only POST /retention/purge
+    "retention_max_age_days": 0,  # results and finished tasks older than this are purged, 0 keeps them
+    "retention_max_results": 0,  # results kept per session, older ones beyond this are purged, 0 keeps them all
+    "retention_dead_days": 0,  # dead sessions not seen for this many days are purged with their tasking and results
+    "retention_batch": 500,  # rows deleted per write, bounds how long a purge holds the write lock
+    "retention_vacuum_pages": 256,  # free pages given back to the filesystem per write after a purge
+    "archive_after_days": 0,  # results older than this move to the compressed archive, 0 keeps them in sqlite
+    "archive_interval": 3600.0,  # seconds between archive runs
+    "archive_batch": 500,  # results moved per write
+    "archive_segment_size": 67108864,  # bytes, a session's archive starts a new segment file past this
+    "archive_dir": "",  # the result archive, empty puts it next to the database
+    "threadpool_size": 40,  # worker threads left for sync code, the routes themselves are async
+    "session_cache_size": 0,  # sessions kept in the in memory registry, 0 keeps them all
+    "longpoll_max_wait": 60.0,  # longest a check in may be held open waiting for tasking (?wait=seconds)
+    "longpoll_max_waiters": 1000,  # check ins held open at once, any more return immediately
+    "blob_dir": "",  # blob store for large transfer payloads, empty puts it next to the database
+    "blob_threshold": 65536,  # encoded upload / download payloads this long or longer go to the blob store
+    "transfer_max_chunk": 8388608,  # largest chunk accepted by the chunked result transfer endpoints, bytes
+    "transfer_expire_hours": 24.0,  # transfers with no chunk acknowledged for this long are removed, 0 keeps them
+    "writer_max_batch": 64,  # writes committed together by the group commit writer at most
+    "writer_max_delay": 0.001,  # seconds a write batch waits for more writes after the first one
+    "task_lease_seconds": 300.0,  # a handed out task is sent again if no result arrives within this
+    "task_max_attempts": 5,  # deliveries before a task without a result is marked Dead
+    "compression_min_size": 1024,  # json / text responses at least this many bytes are compressed
+    "compression_encodings": "zstd,br,gzip",  # server preference, zstd / br only when installed, empty disables
+    "body_spool_threshold": 1048576,  # request bodies larger than this are spooled to disk, not memory
+    # body_limit_<route>, largest request body for routes under /<route>, default for the rest
+    **{f"body_limit_{route}": limit for route, limit in BODY_LIMITS.items()},
+    # sqlite_<pragma>, applied to every sqlite connection (see SQLITE_PRAGMAS in db.py)
+    **{f"sqlite_{pragma}": value for pragma, value in SQLITE_PRAGMAS.items()},
+}
+
+
 class WebServer:
     def __init__(
         self,
@@ -14,6 +55,20 @@ class WebServer:
         self.server_key = server_key
         self.listen_host = listen_host
         self.listen_port = int(listen_port)  # ensure int
+        self.tunables = dict(TUNABLE_DEFAULTS)
+
+
+def convert_tunable(key: str, val: str):
+    """
+    Convert a raw lighthouse.conf value to the type of its default
+    :param key: The tunable name, must exist in TUNABLE_DEFAULTS
+    :param val: The raw string value read from the config file
+    :return: The typed value
+    """
+    default = TUNABLE_DEFAULTS[key]
+    if isinstance(default, bool):
+        return val.lower() in ("1", "true", "yes", "on")
+    return type(default)(val)
 
 
 def parse_config(config_file_path: str) -> str:
@@ -25,6 +80,7 @@ def parse_config(config_file_path: str) -> str:
 
 
 def parse_config_vals(conf: str) -> WebServer:
+    tunables = {}
     for line in conf:
         if line.startswith("#") or len(line) == 0 or ":" not in line:
             continue
@@ -41,7 +97,11 @@ def parse_config_vals(conf: str) -> WebServer:
                 listen_host = val
             case "listen_port":
                 listen_port = val
+            case _ if key in TUNABLE_DEFAULTS:
+                tunables[key] = convert_tunable(key, val)
             case _:
                 continue
-    return WebServer(debug, server_crt, server_key, listen_host, listen_port)
+    web_server = WebServer(debug, server_crt, server_key, listen_host, listen_port)
+    web_server.tunables.update(tunables)
+    return web_server
     
\ No newline at end of file
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+import asyncio
+
+
+class TaskNotifier:
+    """
+    Per session wake ups for long-poll check ins. A check in with nothing to do parks on an asyncio.Event
+    for its session, create_tasking sets it, so queued work goes out as soon as it exists instead of on
+    the next callback. In process only, like the session registry.
+    """
+
+    def __init__(self, max_wait: float = 60.0, max_waiters: int = 1000):
+        self.max_wait = max_wait  # upper bound on the wait an agent can ask for, in seconds
+        self.max_waiters = max_waiters  # check ins held open at once, past this they return immediately
+        self.waiting = 0
+        self._events = {}  # session -> [event, loop it is awaited on, check ins waiting on it]
+
+    def notify(self, session: str) -> None:
+        entry = self._events.pop(session, None)
+        if entry is not None:
+            event, loop, _ = entry
+            # the waiter can be on another loop / thread (sync test clients), set it from its own loop
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, session: str, timeout: float) -> bool:
+        """
+        Hold a check in until work is queued for the session or the timeout passes
+        :param session: The session id of the agent checking in
+        :param timeout: The seconds the agent asked to wait, capped at max_wait
+        :return: True if woken by new work, False on timeout or when too many check ins are already held
+        """
+        timeout = min(timeout, self.max_wait)
+        if timeout <= 0 or self.waiting >= self.max_waiters:
+            return False
+        entry = self._events.setdefault(session, [asyncio.Event(), asyncio.get_running_loop(), 0])
+        entry[2] += 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(entry[0].wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+            entry[2] -= 1
+            # last one out forgets the event, unless notify already took it
+            if entry[2] == 0 and self._events.get(session) is entry:
+                del self._events[session]
+
+
+notifier = TaskNotifier()
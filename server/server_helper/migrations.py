@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+import importlib.util
+import sqlite3
+from pathlib import Path
+
+# local imports
+from .db import engine
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent.parent.parent / "db" / "migrations"
+
+
+def discover_migrations() -> list:
+    """
+    Find the migration scripts, named NNNN_description.sql (or .py for data migrations exposing
+    upgrade(conn), REBUILDS_TABLES = True runs it with foreign keys off, OUTSIDE_TRANSACTION = True
+    without a transaction) and applied in NNNN order
+    :return migrations: A sorted list of (version, path) tuples
+    """
+    migrations = []
+    for pattern in ("[0-9][0-9][0-9][0-9]_*.sql", "[0-9][0-9][0-9][0-9]_*.py"):
+        for path in MIGRATIONS_DIR.glob(pattern):
+            migrations.append((int(path.name[:4]), path))
+    return sorted(migrations)
+
+
+def load_python_migration(path: Path):
+    spec = importlib.util.spec_from_file_location(f"migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_python_migration(conn: sqlite3.Connection, version: int, path: Path) -> None:
+    module = load_python_migration(path)
+    if getattr(module, "OUTSIDE_TRANSACTION", False):
+        # for VACUUM and friends, the script has to be safe to run again should it fail before the bump
+        module.upgrade(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+        return
+    rebuild = getattr(module, "REBUILDS_TABLES", False)
+    foreign_keys = conn.execute("PRAGMA foreign_keys").fetchone()[0]
+    # sqlite's table rebuild procedure: dropping the old parent table with foreign keys on would cascade
+    # the delete into its children, and the pragma is a no-op inside a transaction
+    if rebuild:
+        conn.execute("PRAGMA foreign_keys = OFF")
+    try:
+        conn.execute("BEGIN")
+        module.upgrade(conn)
+        conn.execute(f"PRAGMA user_version = {version}")
+        conn.execute("COMMIT")
+    finally:
+        if rebuild:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            conn.execute(f"PRAGMA foreign_keys = {foreign_keys}")
+
+
+def apply_migration(conn: sqlite3.Connection, version: int, path: Path) -> None:
+    # the script and the version bump commit together, a failed script leaves the db untouched
+    try:
+        if path.suffix == ".py":
+            run_python_migration(conn, version, path)
+        else:
+            conn.executescript(f"BEGIN;\n{path.read_text()}\nPRAGMA user_version = {version};\nCOMMIT;")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+
+
+def run_migrations(bind=engine) -> int:
+    """
+    Bring a database up to the newest schema version, the current version lives in PRAGMA user_version
+    :param bind: The SQLAlchemy engine for the database to migrate
+    :return applied: The number of migrations applied
+    """
+    raw = bind.raw_connection()
+    try:
+        conn = raw.driver_connection
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        applied = 0
+        for version, path in discover_migrations():
+            if version <= current:
+                continue
+            apply_migration(conn, version, path)
+            print(f"Applied database migration {path.name}")
+            applied += 1
+        return applied
+    finally:
+        raw.close()
+
+
+if __name__ == "__main__":
+    # python3 -m server.server_helper.migrations
+    run_migrations()
@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+from typing import Literal
+
+from pydantic import BaseModel, Field
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+class PageQuery(BaseModel):
+    """
+    Keyset pagination on the primary key, pass the id of the last row of a page as after_id to get the next one.
+    A page shorter than limit is the last page
+    """
+    after_id: int = 0
+    limit: int = Field(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+    order: Literal["asc", "desc"] = "asc"
+
+
+def paginate(stmt, id_column, page: PageQuery):
+    """
+    Apply the cursor, ordering and page size to a select, the cost stays flat however deep the page is
+    :param stmt: The select to page through, filters already applied
+    :param id_column: The integer primary key column the cursor walks
+    :param page: The pagination query parameters
+    :return: The paged select
+    """
+    if page.order == "desc":
+        if page.after_id:
+            stmt = stmt.where(id_column < page.after_id)
+        return stmt.order_by(id_column.desc()).limit(page.limit)
+    return stmt.where(id_column > page.after_id).order_by(id_column).limit(page.limit)
+
+
+def prefix_filter(stmt, column, prefix: str | None):
+    # LIKE wildcards in the prefix are escaped, "a_b" only matches values starting with "a_b"
+    if prefix:
+        stmt = stmt.where(column.startswith(prefix, autoescape=True))
+    return stmt
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+from datetime import timedelta
+from functools import partial
+
+from sqlalchemy import update
+
+# local imports
+from .events_helper import events, SESSION_LOST
+from .heartbeat_helper import heartbeats
+from .implant_helper import Implant
+from .job_helper import run_periodic, utc_now
+from .registry_helper import registry
+from .writer_helper import writer
+
+
+class LivenessReaper:
+    """
+    Background sweep for agents that vanished without calling /health/d. Every interval the alive
+    sessions whose next_checkin is more than grace seconds behind are marked dead, one range UPDATE
+    over the partial next_checkin index, so a sweep reads only the overdue rows and never the table.
+    """
+
+    def __init__(self, interval: float = 30.0, grace: float = 60.0, clock=utc_now):
+        self.interval = interval
+        self.grace = grace
+        self.clock = clock  # tests swap in a fake clock
+        self.reaped = 0
+
+    async def sweep(self) -> list:
+        """
+        Mark every overdue session dead
+        :return: The sessions marked dead by this sweep
+        """
+        # a check in still sitting in the heartbeat buffer has not moved next_checkin yet
+        await heartbeats.flush()
+        cutoff = (self.clock() - timedelta(seconds=self.grace)).isoformat()
+        sessions = await writer.submit(partial(reap_overdue, cutoff))
+        for session in sessions:
+            registry.update(session, alive=False)
+            events.publish(SESSION_LOST, session=session)
+        self.reaped += len(sessions)
+        return sessions
+
+    async def run(self) -> None:
+        # sweep loop started from the FastAPI lifespan
+        await run_periodic("Liveness sweep", self.interval, self.sweep)
+
+
+async def reap_overdue(cutoff: str, db) -> list:
+    """
+    The write of a sweep, alive = 1 matches the partial index idx_implants_next_checkin
+    :param cutoff: The isoformat time a session's next_checkin must be before to be marked dead
+    :param db: The writer's session
+    :return: The sessions marked dead
+    """
+    stmt = (
+        update(Implant)
+        .where(Implant.alive == True, Implant.next_checkin < cutoff)  # noqa: E712
+        .values(alive=False)
+        .returning(Implant.session)
+        .execution_options(synchronize_session=False)
+    )
+    return list((await db.execute(stmt)).scalars())
+
+
+reaper = LivenessReaper()
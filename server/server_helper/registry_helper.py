@@ -0,0 +1,207 @@
+#!/usr/bin/python3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy import func, select
+
+# local imports
+from .db import async_engine
+from .implant_helper import Implant
+from .tasking_helper import Tasking
+
+
+class SessionEntry(BaseModel):
+    id: int
+    alive: Optional[bool] = False
+    callback_freq: Optional[int] = 0
+    jitter: Optional[int] = 0
+    queued: int = 0  # tasks never handed out (complete == "False")
+    lease_due: Optional[str] = None  # earliest lease expiry of the Pending tasks, when one may go out again
+
+    def lease_expired(self) -> bool:
+        return self.lease_due is not None and self.lease_due <= datetime.now(timezone.utc).isoformat()
+
+    def has_work(self) -> bool:
+        # anything to hand out, queued tasks or a lease that ran out without a result
+        return bool(self.queued) or self.lease_expired()
+
+
+class PendingLookup(BaseModel):
+    lookups: int = 0  # misses reading this session from sqlite right now
+    queued: int = 0  # tasks queued while they read, their select may have run before the insert
+
+
+class RegistryStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+
+
+def entry_query():
+    # one row per implant with its count of queued tasks and its next lease expiry
+    queued = (
+        select(func.count(Tasking.id))
+        .where(Tasking.session == Implant.session, Tasking.complete == "False")
+        .scalar_subquery()
+    )
+    lease_due = (
+        select(func.min(Tasking.lease_expires))
+        .where(Tasking.session == Implant.session, Tasking.complete == "Pending")
+        .scalar_subquery()
+    )
+    return select(
+        Implant.session,
+        Implant.id,
+        Implant.alive,
+        Implant.callback_freq,
+        Implant.jitter,
+        queued.label("queued"),
+        lease_due.label("lease_due"),
+    )
+
+
+class SessionRegistry:
+    """
+    Process local map of session -> id, liveness, callback settings and queued task count, so the
+    existence checks at the top of every route and the "no work" check in skip sqlite. Misses fall
+    back to the database and are cached. Only valid while lighthouse runs as a single process.
+    """
+
+    def __init__(self, max_size: int = 0):
+        self.max_size = max_size  # 0 keeps every session, otherwise least recently used are evicted
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = {}  # session -> PendingLookup, only while a miss is being read
+        self._lock = threading.Lock()
+
+    def put(self, session: str, entry: SessionEntry) -> SessionEntry:
+        with self._lock:
+            self._store(session, entry)
+        return entry
+
+    def _store(self, session: str, entry: SessionEntry) -> None:
+        # caller holds the lock
+        self._entries[session] = entry
+        self._entries.move_to_end(session)
+        while self.max_size and len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, session: str) -> SessionEntry | None:
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(session)
+            return entry
+
+    def update(self, session: str, **fields) -> None:
+        # only cached sessions are touched, anything else is read fresh on its next miss
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is not None:
+                for name, value in fields.items():
+                    setattr(entry, name, value)
+
+    def add_queued(self, session: str, count: int = 1) -> None:
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is not None:
+                entry.queued += count
+            elif session in self._pending:
+                # a lookup is reading this session, it adds the count to what it caches
+                self._pending[session].queued += count
+
+    def claimed(self, session: str, tasking: list) -> None:
+        """
+        Record a claim, nothing is queued any more and the new leases may be the next to run out
+        :param session: The session id that claimed tasking
+        :param tasking: The tasks just leased by claim_tasks
+        :return: None
+        """
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is None:
+                return
+            if entry.lease_expired():
+                # a lease ran out, the next expiry among the other Pending tasks is only known to sqlite
+                del self._entries[session]
+                return
+            entry.queued = 0
+            expiries = [task.lease_expires for task in tasking if task.lease_expires]
+            if entry.lease_due is not None:
+                expiries.append(entry.lease_due)
+            entry.lease_due = min(expiries, default=None)
+
+    def forget(self, session: str) -> None:
+        with self._lock:
+            self._entries.pop(session, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> RegistryStats:
+        with self._lock:
+            return RegistryStats(size=len(self._entries), max_size=self.max_size, hits=self.hits, misses=self.misses)
+
+    async def lookup(self, session: str, db) -> SessionEntry | None:
+        """
+        Cached existence check for a session, reads the database on a miss
+        :param session: The session id to look up
+        :param db: The active async database session, only used on a miss
+        :return: The registry entry, None if the session does not exist
+        """
+        entry = self.get(session)
+        if entry is not None:
+            return entry
+        with self._lock:
+            self._pending.setdefault(session, PendingLookup()).lookups += 1
+        row = None
+        try:
+            row = (await db.execute(entry_query().where(Implant.session == session))).first()
+        finally:
+            entry = self._loaded(session, row)
+        return entry
+
+    def _loaded(self, session: str, row) -> SessionEntry | None:
+        # end of a lookup miss, tasks queued while the select ran are added to the row it read
+        with self._lock:
+            pending = self._pending[session]
+            pending.lookups -= 1
+            if not pending.lookups:
+                del self._pending[session]
+            entry = self._entries.get(session)
+            if entry is not None or row is None:
+                # another lookup cached it first and has kept its count since
+                return entry
+            entry = SessionEntry.model_validate(row, from_attributes=True)
+            entry.queued += pending.queued
+            pending.queued = 0
+            self._store(session, entry)
+            return entry
+
+    async def load(self) -> int:
+        """
+        Warm the registry from the implants table at startup, the most recently seen sessions first
+        :return: The number of sessions loaded
+        """
+        stmt = entry_query().order_by(Implant.last_checkin.desc())
+        if self.max_size:
+            stmt = stmt.limit(self.max_size)
+        async with async_engine.connect() as conn:
+            rows = (await conn.execute(stmt)).all()
+        # insert oldest first so the most recent end up at the fresh end of the LRU
+        for row in reversed(rows):
+            self.put(row.session, SessionEntry.model_validate(row, from_attributes=True))
+        return len(rows)
+
+
+registry = SessionRegistry()
@@ -0,0 +1,23 @@
+#!/usr/bin/python3
+from fastapi.responses import ORJSONResponse
+
+
+def row_dicts(result) -> list:
+    """
+    Turn a Core select result into plain dicts keyed by column label, in select order
+    :param result: The result of db.execute(select(...))
+    :return: One dict per row
+    """
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def rows_response(rows: list) -> ORJSONResponse:
+    """
+    Serialize list endpoint rows with orjson, returned as a Response so FastAPI skips the per row
+    response_model validation. Only for selects whose columns already match the response model
+    field for field and in order, orjson then renders the same bytes as the default JSONResponse
+    :param rows: The row dicts to send
+    :return: The json response
+    """
+    return ORJSONResponse(rows)
@@ -5,6 +5,7 @@ from sqlalchemy import Column, Integer, String, ForeignKey
 from sqlalchemy.orm import relationship
 
 # local imports
+from .column_helper import EpochMicros
 from .db import Base
 
 
@@ -17,10 +18,12 @@ class Results(Base):
     session = Column(
         String, ForeignKey("implants.session", ondelete="CASCADE"), nullable=False
     )
-    date = Column(String)
+    date = Column(EpochMicros)
     task = Column(String)
     args = Column(String)
     results = Column(String)
+    blob_ref = Column(String)  # sha256 of the payload in the blob store, results is left empty
+    blob_size = Column(Integer)
     implant = relationship("Implant", backref="results")
 
 
@@ -42,6 +45,8 @@ class ResultsCreds(BaseModel):
 # only client ensure auth
 class ResultsRead(ResultsCreate):
     id: int
+    blob_ref: Optional[str] = None  # fetch GET /results/{session}/{tasking_id}/blob when set
+    blob_size: Optional[int] = None
 
     class Config:
         form_attributes = True
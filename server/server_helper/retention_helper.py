@@ -0,0 +1,335 @@
+#!/usr/bin/python3
+import time
+from datetime import timedelta
+from functools import partial
+
+from anyio import to_thread
+from pydantic import BaseModel
+from sqlalchemy import LargeBinary, and_, cast, delete, func, or_, select, union
+
+# local imports
+from .archive_helper import archive
+from .blob_helper import blobs
+from .db import AsyncSessionLocal
+from .heartbeat_helper import heartbeats
+from .implant_helper import Implant
+from .job_helper import run_periodic, utc_now
+from .registry_helper import registry
+from .results_helper import Results
+from .tasking_helper import Tasking
+from .transfer_helper import transfers
+from .writer_helper import writer
+
+# tasks the age limit may remove, anything still queued or out with an agent is kept
+FINISHED = ["True", "Dead"]
+# blob references checked per query when looking for blobs nothing points at any more
+REF_CHUNK = 500
+
+
+class RetentionReport(BaseModel):
+    dry_run: bool
+    sessions: int = 0  # dead sessions purged with everything they own
+    tasking: int = 0
+    results: int = 0
+    row_bytes: int = 0  # args and results text of the purged rows
+    blob_bytes: int = 0  # blob store files removed, a dry run counts every blob a purged row references
+    pages_reclaimed: int = 0  # returned to the filesystem by incremental vacuum
+    bytes_reclaimed: int = 0
+    transfers: int = 0  # abandoned chunked transfers removed, past transfer_expire_hours
+
+
+def row_bytes(table):
+    # stored size of the text columns, length() of text would count characters
+    size = func.coalesce(func.length(cast(table.args, LargeBinary)), 0)
+    if table is Results:
+        size = size + func.coalesce(func.length(cast(table.results, LargeBinary)), 0)
+    return size
+
+
+class RetentionEngine:
+    """
+    Retention policy from lighthouse.conf: results and finished tasks past max_age_days, results beyond
+    the newest max_results of a session, and sessions dead for dead_days along with their tasking and
+    results (archived results included). A purge deletes in chunks of batch rows, each chunk its own
+    write through the group commit writer so no write waits behind a long delete, then gives the freed
+    pages back with incremental vacuum. A limit of 0 is off, with every limit off nothing is ever
+    removed. Every purge also removes the chunked transfers abandoned for transfer_expire_hours.
+    """
+
+    def __init__(
+        self,
+        interval: float = 3600.0,
+        max_age_days: int = 0,
+        max_results: int = 0,
+        dead_days: int = 0,
+        batch: int = 500,
+        vacuum_pages: int = 256,
+        clock=utc_now,
+    ):
+        self.interval = interval  # seconds between background purges, 0 leaves only the operator endpoint
+        self.max_age_days = max_age_days
+        self.max_results = max_results
+        self.dead_days = dead_days
+        self.batch = batch
+        self.vacuum_pages = vacuum_pages
+        self.clock = clock
+        self.running = False
+
+    def enabled(self) -> bool:
+        return bool(self.max_age_days or self.max_results or self.dead_days)
+
+    def cutoff(self, days: int) -> str:
+        return (self.clock() - timedelta(days=days)).isoformat()
+
+    def dead_sessions(self):
+        return select(Implant.session).where(
+            Implant.alive == False, Implant.last_checkin < self.cutoff(self.dead_days)  # noqa: E712
+        )
+
+    def purged_tasking(self):
+        # what the policy removes from tasking, as one condition for the dry run
+        conditions = []
+        if self.dead_days:
+            conditions.append(Tasking.session.in_(self.dead_sessions()))
+        if self.max_age_days:
+            old = Tasking.date < self.cutoff(self.max_age_days)
+            conditions.append(and_(old, Tasking.complete.in_(FINISHED)))
+        return or_(*conditions) if conditions else None
+
+    def purged_results(self):
+        conditions = []
+        if self.dead_days:
+            conditions.append(Results.session.in_(self.dead_sessions()))
+        if self.max_age_days:
+            conditions.append(Results.date < self.cutoff(self.max_age_days))
+        if self.max_results:
+            newest = func.row_number().over(partition_by=Results.session, order_by=Results.id.desc())
+            ranked = select(Results.id, newest.label("rank")).subquery()
+            conditions.append(Results.id.in_(select(ranked.c.id).where(ranked.c.rank > self.max_results)))
+        tasking = self.purged_tasking()
+        if tasking is not None:
+            # a purged task takes its results with it
+            conditions.append(Results.tasking_id.in_(select(Tasking.id).where(tasking)))
+        return or_(*conditions) if conditions else None
+
+    async def purge(self, dry_run: bool = False) -> RetentionReport:
+        """
+        Apply the retention policy now
+        :param dry_run: Only report what a purge would remove, nothing is deleted
+        :return: The rows and bytes removed, or that would be
+        """
+        report = RetentionReport(dry_run=dry_run)
+        report.transfers = await to_thread.run_sync(transfers.expire, dry_run)
+        if not self.enabled():
+            return report
+        if dry_run:
+            return await self.measure(report)
+        self.running = True
+        started = time.time()
+        refs = {}
+        try:
+            if self.dead_days:
+                await self.purge_dead_sessions(report, refs)
+            if self.max_age_days:
+                await self.purge_old(report, refs)
+            if self.max_results:
+                await self.purge_beyond_max(report, refs)
+            report.blob_bytes = await self.discard_blobs(refs, started)
+            await self.reclaim(report)
+        finally:
+            self.running = False
+        return report
+
+    async def measure(self, report: RetentionReport) -> RetentionReport:
+        # the dry run, one read per table over the same conditions the purge deletes by
+        tasking, results = self.purged_tasking(), self.purged_results()
+        async with AsyncSessionLocal() as db:
+            if self.dead_days:
+                dead = self.dead_sessions().subquery()
+                report.sessions = await db.scalar(select(func.count()).select_from(dead))
+            referenced = []
+            for table, condition in ((Tasking, tasking), (Results, results)):
+                if condition is None:
+                    continue
+                measured = select(func.count(), func.sum(row_bytes(table))).where(condition)
+                count, size = (await db.execute(measured)).one()
+                setattr(report, table.__tablename__, count)
+                report.row_bytes += size or 0
+                referenced.append(
+                    select(table.blob_ref, table.blob_size).where(condition, table.blob_ref.is_not(None))
+                )
+            blobs_used = union(*referenced).subquery()
+            report.blob_bytes = await db.scalar(select(func.coalesce(func.sum(blobs_used.c.blob_size), 0)))
+        return report
+
+    async def delete_all(self, write, report: RetentionReport, refs: dict) -> None:
+        # one chunk per write until a chunk of the rows picked (tasks, or results alone) comes back short
+        while True:
+            tasking, results = await writer.submit(write)
+            for rows, name in ((tasking, "tasking"), (results, "results")):
+                setattr(report, name, getattr(report, name) + len(rows))
+                for size, ref, blob_size in rows:
+                    report.row_bytes += size or 0
+                    if ref:
+                        refs[ref] = blob_size
+            if len(tasking or results) < self.batch:
+                return
+
+    async def purge_dead_sessions(self, report: RetentionReport, refs: dict) -> None:
+        async with AsyncSessionLocal() as db:
+            sessions = list(await db.scalars(self.dead_sessions()))
+        for session in sessions:
+            tasking = partial(delete_tasking, [Tasking.session == session], self.batch)
+            await self.delete_all(tasking, report, refs)
+            results = partial(delete_results, [Results.session == session], self.batch)
+            await self.delete_all(results, report, refs)
+            if await writer.submit(partial(delete_implant, session)):
+                report.sessions += 1
+                registry.forget(session)
+                heartbeats.discard(session)
+                await to_thread.run_sync(archive.drop, session)
+
+    async def purge_old(self, report: RetentionReport, refs: dict) -> None:
+        cutoff = self.cutoff(self.max_age_days)
+        await self.delete_all(partial(delete_results, [Results.date < cutoff], self.batch), report, refs)
+        where = [Tasking.date < cutoff, Tasking.complete.in_(FINISHED)]
+        await self.delete_all(partial(delete_tasking, where, self.batch), report, refs)
+
+    async def purge_beyond_max(self, report: RetentionReport, refs: dict) -> None:
+        async with AsyncSessionLocal() as db:
+            sessions = list(
+                await db.scalars(
+                    select(Results.session).group_by(Results.session).having(func.count() > self.max_results)
+                )
+            )
+            for session in sessions:
+                # the oldest result kept, everything before it in the session goes
+                boundary = await db.scalar(
+                    select(Results.id)
+                    .where(Results.session == session)
+                    .order_by(Results.id.desc())
+                    .offset(self.max_results - 1)
+                    .limit(1)
+                )
+                where = [Results.session == session, Results.id < boundary]
+                await self.delete_all(partial(delete_results, where, self.batch), report, refs)
+
+    async def discard_blobs(self, refs: dict, started: float) -> int:
+        """
+        Remove the blobs of purged rows that no remaining row references (they are shared by content)
+        :param refs: blob_ref -> blob_size of every purged row with a blob
+        :param started: Epoch seconds the purge started, blobs stored again since are kept
+        :return: The bytes freed in the blob store
+        """
+        freed = 0
+        pending = list(refs)
+        async with AsyncSessionLocal() as db:
+            for start in range(0, len(pending), REF_CHUNK):
+                chunk = pending[start:start + REF_CHUNK]
+                used = union(
+                    select(Results.blob_ref).where(Results.blob_ref.in_(chunk)),
+                    select(Tasking.blob_ref).where(Tasking.blob_ref.in_(chunk)),
+                )
+                still_used = set(await db.scalars(used))
+                for ref in chunk:
+                    if ref not in still_used:
+                        freed += await to_thread.run_sync(blobs.discard, ref, started)
+        return freed
+
+    async def reclaim(self, report: RetentionReport) -> None:
+        # incremental vacuum a few pages per write, only possible once 0008 switched auto_vacuum on
+        while True:
+            freed, remaining, page_size = await writer.submit(partial(incremental_vacuum, self.vacuum_pages))
+            report.pages_reclaimed += freed
+            report.bytes_reclaimed += freed * page_size
+            if not freed or not remaining:
+                return
+
+    async def run(self) -> None:
+        # purge loop started from the FastAPI lifespan
+        await run_periodic("Retention purge", self.interval, self.scheduled_purge, log_purge)
+
+    async def scheduled_purge(self) -> RetentionReport | None:
+        # an operator purge still running is left alone, the next interval tries again
+        if self.running:
+            return None
+        return await self.purge()
+
+
+def log_purge(report: RetentionReport | None) -> None:
+    if report and (report.results or report.tasking or report.sessions or report.transfers):
+        print(f"Retention purge: {report.model_dump()}")
+
+
+def purged_columns(table) -> tuple:
+    return row_bytes(table), table.blob_ref, table.blob_size
+
+
+async def delete_results(where: list, limit: int | None, db) -> tuple[list, list]:
+    """
+    Delete one chunk of results
+    :param where: The conditions picking the results to delete
+    :param limit: Rows deleted at most, None for all of them
+    :param db: The writer's session
+    :return: No tasking rows and the (bytes, blob_ref, blob_size) of every deleted result
+    """
+    chunk = select(Results.id).where(*where).limit(limit)
+    stmt = (
+        delete(Results)
+        .where(Results.id.in_(chunk))
+        .returning(*purged_columns(Results))
+        .execution_options(synchronize_session=False)
+    )
+    return [], (await db.execute(stmt)).all()
+
+
+async def delete_tasking(where: list, limit: int, db) -> tuple[list, list]:
+    """
+    Delete one chunk of tasks and their results, results first so none go unreported by the cascade
+    :param where: The conditions picking the tasks to delete
+    :param limit: Tasks deleted at most
+    :param db: The writer's session
+    :return: The (bytes, blob_ref, blob_size) of the deleted tasks and of their results
+    """
+    ids = list(await db.scalars(select(Tasking.id).where(*where).limit(limit)))
+    if not ids:
+        return [], []
+    _, results = await delete_results([Results.tasking_id.in_(ids)], None, db)
+    stmt = (
+        delete(Tasking)
+        .where(Tasking.id.in_(ids))
+        .returning(*purged_columns(Tasking))
+        .execution_options(synchronize_session=False)
+    )
+    return (await db.execute(stmt)).all(), results
+
+
+async def delete_implant(session: str, db) -> bool:
+    # still dead, a session that checked in again while its rows were purged keeps its implant row
+    stmt = delete(Implant).where(Implant.session == session, Implant.alive == False)  # noqa: E712
+    return bool((await db.execute(stmt.execution_options(synchronize_session=False))).rowcount)
+
+
+async def incremental_vacuum(pages: int, db) -> tuple[int, int, int]:
+    """
+    Return up to pages free pages to the filesystem
+    :param pages: Pages to free at most
+    :param db: The writer's session
+    :return: Pages freed, free pages left and the page size
+    """
+    conn = await db.connection()
+
+    async def pragma(statement: str):
+        return (await conn.exec_driver_sql(f"PRAGMA {statement}")).scalar()
+
+    if await pragma("auto_vacuum") != 2:
+        return 0, 0, 0
+    before = await pragma("freelist_count")
+    # the driver steps a statement once and each step of incremental_vacuum frees a single page
+    for _ in range(min(pages, before)):
+        await conn.exec_driver_sql("PRAGMA incremental_vacuum")
+    after = await pragma("freelist_count")
+    return before - after, after, await pragma("page_size")
+
+
+retention = RetentionEngine()
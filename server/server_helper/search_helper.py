@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field, field_validator
+from sqlalchemy import Integer, Text, column, func, insert, literal_column, select, table
+
+# local imports
+from .blob_helper import decode_transport
+from .pagination_helper import PageQuery, paginate
+from .results_helper import Results
+
+# decoded text indexed per result at most, the rest of a huge listing is left out of the index
+MAX_INDEXED_CHARS = 1048576
+# rows decoded per query by the backfill
+BACKFILL_BATCH = 1000
+# how the errors fts5 raises while parsing a MATCH expression start, anything else is not the query's fault
+QUERY_ERRORS = ("fts5:", "no such column:", "unterminated string", "expected integer")
+
+# the fts5 table created by migration 0009, its rowid is the id of the result the text was decoded from.
+# the session is indexed too, a session filter intersects two posting lists instead of walking every match
+results_fts = table("results_fts", column("rowid", Integer), column("output", Text), column("session", Text))
+FTS = literal_column("results_fts")
+
+
+class SearchQuery(PageQuery):
+    """
+    q is an fts5 query: words all have to match, "quoted words" match as a phrase, OR / NOT / prefix*
+    work as in sqlite. Newest results first unless order is asc, after_id walks the results ids
+    """
+    q: str = Field(..., min_length=1)
+    session: Optional[str] = None
+    order: Literal["asc", "desc"] = "desc"
+    mark_open: str = Field("<b>", max_length=16)  # wrapped around each match in the snippet
+    mark_close: str = Field("</b>", max_length=16)
+
+    @field_validator("q")
+    @classmethod
+    def brackets_balanced(cls, q: str) -> str:
+        # q is wrapped in the output column filter, a ")" closing it early would let q match the session
+        if not balanced_brackets(q):
+            raise ValueError("unbalanced brackets in the search query")
+        return q
+
+
+class SearchHit(BaseModel):
+    id: int  # the results row id, the cursor for the next page
+    tasking_id: int
+    session: str
+    date: str
+    task: str
+    snippet: str
+
+
+def balanced_brackets(q: str) -> bool:
+    """
+    Check the brackets of an fts5 query pair up, brackets inside "strings" are just text
+    :param q: The fts5 query
+    :return: False if a ")" has no "(" before it or a "(" is never closed
+    """
+    depth = 0
+    quoted = False
+    for char in q:
+        if char == '"':
+            # a "" inside a string toggles twice and stays quoted
+            quoted = not quoted
+        elif quoted:
+            continue
+        elif char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def query_error(message: str) -> bool:
+    """
+    Tell an fts5 query that does not parse apart from the database failing the search
+    :param message: The sqlite error message
+    :return: True if fts5 rejected the MATCH expression
+    """
+    return message.startswith(QUERY_ERRORS)
+
+
+def searchable_text(task: str | None, results: str | None, blob_ref: str | None = None) -> str | None:
+    """
+    The decoded text of a result as it goes into the search index
+    :param task: The task that produced the result
+    :param results: The results column, normally hex(base64(output))
+    :param blob_ref: The blob reference of the row, payloads in the blob store are not indexed
+    :return: The text to index, None for downloads, blob backed, empty and binary results
+    """
+    if task == "download" or blob_ref or not results:
+        return None
+    payload = decode_transport(results)
+    if payload is None:
+        # not transport encoded (an error message), the text itself is the result
+        return results[:MAX_INDEXED_CHARS]
+    try:
+        text = payload.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    if "\x00" in text:
+        return None
+    return text[:MAX_INDEXED_CHARS]
+
+
+async def index_result(result_id: int, session: str, text: str, db) -> None:
+    # runs in the writer transaction that inserts the result, rows leave the index by the 0009 trigger
+    await db.execute(insert(results_fts).values(rowid=result_id, output=text, session=session))
+
+
+def match_expression(query: SearchQuery) -> str:
+    # q only ever matches the output, a session id in it is not a match for every result of that session.
+    # q can't close the column filter (SearchQuery checks its brackets) and a column filter inside it
+    # only narrows the columns further
+    expression = f"output : ({query.q})"
+    if query.session:
+        session = query.session.replace('"', '""')
+        expression = f'session : "{session}" AND {expression}'
+    return expression
+
+
+def search_statement(query: SearchQuery):
+    """
+    The select behind GET /results/search, fts5 finds the matching rowids and the results rows are
+    joined on their primary key
+    :param query: The search and pagination query parameters
+    :return: The paged select of SearchHit columns
+    """
+    snippet = func.snippet(FTS, 0, query.mark_open, query.mark_close, "...", 16)
+    stmt = (
+        select(
+            Results.id,
+            Results.tasking_id,
+            Results.session,
+            Results.date,
+            Results.task,
+            snippet.label("snippet"),
+        )
+        .select_from(results_fts)
+        .join(Results, Results.id == results_fts.c.rowid)
+        .where(FTS.op("MATCH")(match_expression(query)))
+    )
+    return paginate(stmt, results_fts.c.rowid, query)
+
+
+def backfill(conn) -> int:
+    """
+    Index every stored result that is not in the index yet, a batch of rows at a time
+    :param conn: A sqlite3 connection, the caller commits
+    :return: The number of results indexed
+    """
+    indexed = 0
+    last_id = conn.execute("SELECT coalesce(max(rowid), 0) FROM results_fts").fetchone()[0]
+    while True:
+        rows = conn.execute(
+            "SELECT id, session, task, results, blob_ref FROM results WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, BACKFILL_BATCH),
+        ).fetchall()
+        batch = []
+        for row_id, session, task, results, blob_ref in rows:
+            text = searchable_text(task, results, blob_ref)
+            if text:
+                batch.append((row_id, text, session))
+        conn.executemany("INSERT INTO results_fts (rowid, output, session) VALUES (?, ?, ?)", batch)
+        indexed += len(batch)
+        if len(rows) < BACKFILL_BATCH:
+            return indexed
+        last_id = rows[-1][0]
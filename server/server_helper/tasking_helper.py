@@ -1,11 +1,17 @@
 #!/usr/bin/python3
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel
-from typing import Optional
-from sqlalchemy import Column, Integer, String, ForeignKey
+from typing import List, Literal, Optional
+from sqlalchemy import Column, Integer, String, ForeignKey, and_, case, literal, or_, update
 from sqlalchemy.orm import relationship
 
 # local imports
+from .column_helper import EpochMicros, TaskState
 from .db import Base
+from .pagination_helper import PageQuery, paginate
+
+# characters of args kept for the tasking list, the full value is only read by GET /tasking/{session}/{id}
+ARGS_PREVIEW = 128
 
 
 class Tasking(Base):
@@ -14,10 +20,16 @@ class Tasking(Base):
     session = Column(
         String, ForeignKey("implants.session", ondelete="CASCADE"), nullable=False
     )
-    date = Column(String)
+    date = Column(EpochMicros)
     task = Column(String)
     args = Column(String)
-    complete = Column(String, default="False")
+    complete = Column(TaskState, default="False")
+    blob_ref = Column(String)  # upload payload in the blob store, args keep only the destination
+    blob_size = Column(Integer)
+    args_size = Column(Integer)  # bytes of args as stored, filled on insert so listing never reads args
+    args_preview = Column(String)
+    lease_expires = Column(EpochMicros)  # while Pending, handed out again once this passes
+    attempts = Column(Integer, default=0)  # times handed out, Dead once it reaches the lease max_attempts
     implant = relationship("Implant", backref="taskings")
 
 
@@ -31,11 +43,134 @@ class TaskingCreate(BaseModel):
 
 class TaskingRead(TaskingCreate):
     id: int
+    blob_ref: Optional[str] = None  # agents fetch GET /tasks/{session}/{id}/payload when set
+    blob_size: Optional[int] = None
+    lease_expires: Optional[str] = None
+    attempts: Optional[int] = None
 
     class Config:
         form_attributes = True
 
 
+class TaskingSummary(BaseModel):
+    id: int
+    session: Optional[str] = None
+    date: Optional[str] = None
+    task: Optional[str] = None
+    args_preview: Optional[str] = None  # uploads show their (encoded) destination only
+    args_size: Optional[int] = None
+    blob_size: Optional[int] = None
+    complete: Optional[str] = None
+    attempts: Optional[int] = None
+
+
+# the tasking list selects these columns only, never args itself
+SUMMARY_COLUMNS = tuple(getattr(Tasking, name) for name in TaskingSummary.model_fields)
+
+
+def args_summary(task: str | None, args: str | None) -> dict:
+    """
+    The args_size and args_preview column values for a task, computed once when it is created
+    :param task: The task name
+    :param args: The args as they will be stored
+    :return: The column values to store alongside args
+    """
+    args = args or ""
+    if task == "upload":
+        preview = args.partition(":")[0]
+    else:
+        preview = args[:ARGS_PREVIEW]
+    return {"args_size": len(args.encode("utf-8")), "args_preview": preview}
+
+
 class TaskingDelete(BaseModel):
     id: int
     session: str
+
+
+class TaskingQuery(PageQuery):
+    complete: Optional[Literal["False", "Pending", "True", "Dead"]] = None
+    task: Optional[str] = None
+    since: Optional[datetime] = None  # naive times are taken as UTC
+    until: Optional[datetime] = None
+
+
+def utc_iso(value: datetime) -> str:
+    # dates are handled as UTC isoformat strings, EpochMicros stores them as integers
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def taskings_page(stmt, query: TaskingQuery):
+    """
+    Narrow a tasking select to the requested filters and page
+    :param stmt: The select over the tasking table
+    :param query: The filter and pagination query parameters
+    :return: The filtered, paged select
+    """
+    if query.complete is not None:
+        stmt = stmt.where(Tasking.complete == query.complete)
+    if query.task is not None:
+        stmt = stmt.where(Tasking.task == query.task)
+    if query.since is not None:
+        stmt = stmt.where(Tasking.date >= utc_iso(query.since))
+    if query.until is not None:
+        stmt = stmt.where(Tasking.date < utc_iso(query.until))
+    return paginate(stmt, Tasking.id, query)
+
+
+class CheckIn(BaseModel):
+    session: str
+    last_checkin: Optional[str] = None
+    tasks: List[TaskingRead] = []
+
+
+class TaskLeases:
+    """
+    Visibility timeout for handed out tasks. A claimed task is Pending with a lease, it is not sent again
+    until the lease runs out without a result, and after max_attempts deliveries it is marked Dead
+    instead of being retried forever.
+    """
+
+    def __init__(self, duration: float = 300.0, max_attempts: int = 5):
+        self.duration = duration  # seconds an agent has to post the result before the task goes out again
+        self.max_attempts = max_attempts
+
+    def expiry(self, now: datetime) -> str:
+        return (now + timedelta(seconds=self.duration)).isoformat()
+
+
+async def claim_tasks(session: str, db) -> list:
+    """
+    Lease the queued tasks of a session, plus any Pending task whose lease ran out, with a single
+    UPDATE ... RETURNING, the cost is the same whatever the queue depth. Expired tasks already handed
+    out max_attempts times are marked Dead in the same statement and not returned. The caller owns the commit
+    :param session: The session id of the agent picking up tasking
+    :param db: The active async database session
+    :return tasking: The leased tasks in id order, empty if nothing was due
+    """
+    now = datetime.now(timezone.utc)
+    expired = and_(Tasking.complete == "Pending", Tasking.lease_expires <= now.isoformat())
+    dead = and_(expired, Tasking.attempts >= leases.max_attempts)
+    # session repeated in both branches so sqlite answers each from its own index (MULTI-INDEX OR),
+    # never walking the completed history of the session
+    queued = and_(Tasking.session == session, Tasking.complete == "False")
+    due = and_(Tasking.session == session, expired)
+    stmt = (
+        update(Tasking)
+        .where(or_(queued, due))
+        .values(
+            # typed literals, a bare string in a CASE would be bound as text instead of the stored integer
+            complete=case((dead, literal("Dead", TaskState)), else_=literal("Pending", TaskState)),
+            lease_expires=case((dead, None), else_=literal(leases.expiry(now), EpochMicros)),
+            attempts=case((dead, Tasking.attempts), else_=Tasking.attempts + 1),
+        )
+        .returning(Tasking)
+    )
+    tasking = (await db.scalars(stmt, execution_options={"synchronize_session": False})).all()
+    # RETURNING gives no ordering guarantee
+    return sorted((task for task in tasking if task.complete == "Pending"), key=lambda task: task.id)
+
+
+leases = TaskLeases()
@@ -0,0 +1,213 @@
+#!/usr/bin/python3
+import asyncio
+import hashlib
+import os
+import re
+import secrets
+import shutil
+import time
+import weakref
+from pathlib import Path
+from typing import Optional
+
+from anyio import to_thread
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+# local imports
+from .blob_helper import blobs, offload_raw_file, COPY_CHUNK
+
+TRANSFER_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class TransferState(BaseModel):
+    # sidecar of an open chunked transfer, also what the transfer endpoints return
+    transfer_id: str
+    session: str
+    tasking_id: int
+    task: str
+    args: str = ""
+    size: Optional[int] = None  # total announced by the sender, checked on finalize when given
+    received: int = 0  # bytes acknowledged, the next chunk starts at this offset
+    chunks: int = 0  # chunks acknowledged, the index of the next chunk
+    finalized: bool = False  # the result is stored, a repeated finalize answers with it
+
+
+class TransferStore:
+    """
+    Chunked, resumable result uploads. Each open transfer is a .part file the chunks are appended to
+    and a json sidecar with what has been acknowledged, both under the blob store so a finished
+    transfer is renamed into it rather than copied. A sender that loses its connection reads the
+    sidecar back and carries on from the last acknowledged chunk. A finalized transfer keeps its
+    sidecar so a sender that lost the finalize response can ask again. A transfer nothing was
+    acknowledged for in expire_hours is removed by the retention engine, finished or abandoned.
+    """
+
+    def __init__(self, max_chunk: int = 8 << 20, expire_hours: float = 24.0):
+        self.max_chunk = max_chunk  # largest chunk body accepted, bytes
+        self.expire_hours = expire_hours  # 0 keeps abandoned transfers
+        # one lock per transfer with a chunk being written, gone with the last request holding it
+        self._locks = weakref.WeakValueDictionary()
+
+    @property
+    def root(self) -> Path:
+        # follows blob_dir, same filesystem as the blobs
+        return blobs.root / ".transfers"
+
+    def part_path(self, transfer_id: str) -> Path:
+        return self.root / f"{transfer_id}.part"
+
+    def state_path(self, transfer_id: str) -> Path:
+        return self.root / f"{transfer_id}.json"
+
+    def save(self, state: TransferState) -> None:
+        # write then rename, a crash leaves the previous acknowledged state
+        path = self.state_path(state.transfer_id)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(state.model_dump_json())
+        os.replace(tmp, path)
+
+    def open(self, state: TransferState) -> TransferState:
+        """
+        Start a transfer, the caller has checked the session and task exist
+        :param state: The transfer fields, transfer_id is assigned here
+        :return: The new transfer with nothing received
+        """
+        self.root.mkdir(parents=True, exist_ok=True)
+        state.transfer_id = secrets.token_hex(16)
+        self.part_path(state.transfer_id).touch()
+        self.save(state)
+        return state
+
+    def load(self, session: str, transfer_id: str) -> TransferState:
+        """
+        Read the acknowledged state of a transfer
+        :param session: The session the transfer belongs to
+        :param transfer_id: The id returned when the transfer was opened
+        :return: The transfer state or 404 if there is no such transfer for the session
+        """
+        path = self.state_path(transfer_id)
+        if not TRANSFER_ID.fullmatch(transfer_id) or not path.is_file():
+            raise HTTPException(status_code=404, detail="Transfer not found")
+        state = TransferState.model_validate_json(path.read_text())
+        if state.session != session:
+            raise HTTPException(status_code=404, detail="Transfer not found")
+        return state
+
+    def lock(self, transfer_id: str) -> asyncio.Lock:
+        lock = self._locks.get(transfer_id)
+        if lock is None:
+            lock = self._locks[transfer_id] = asyncio.Lock()
+        return lock
+
+    async def write_chunk(
+        self, state: TransferState, position: tuple[int, int], checksum: str, body: bytes | Path
+    ) -> TransferState:
+        """
+        Append one chunk, already read (spooled to disk when large). Chunks of a transfer are written
+        one at a time, the state is read again once it is this chunk's turn
+        :param state: The transfer the chunk belongs to
+        :param position: The chunk index and the byte offset it starts at
+        :param checksum: The hex sha256 of the chunk
+        :param body: The chunk, or the path of the file it was spooled to (the caller removes it)
+        :return: The updated state, 409 if the chunk is not the next one or 400 on a checksum mismatch
+        """
+        async with self.lock(state.transfer_id):
+            state = self.load(state.session, state.transfer_id)
+            return await to_thread.run_sync(self.append_chunk, state, position, checksum, body)
+
+    def append_chunk(
+        self, state: TransferState, position: tuple[int, int], checksum: str, body: bytes | Path
+    ) -> TransferState:
+        # the blocking half of write_chunk, on a worker thread and under the transfer's lock
+        index, offset = position
+        if index < state.chunks:
+            # already acknowledged, the sender lost the response and is sending it again
+            return state
+        if state.finalized:
+            raise HTTPException(status_code=409, detail="Transfer already finalized")
+        if index != state.chunks or offset != state.received:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Expected chunk {state.chunks} at offset {state.received}",
+            )
+        if isinstance(body, Path):
+            digest = hashlib.sha256()
+            with open(body, "rb") as src:
+                while piece := src.read(COPY_CHUNK):
+                    digest.update(piece)
+            written = body.stat().st_size
+        else:
+            digest = hashlib.sha256(body)
+            written = len(body)
+        # checked before the part file is touched, a bad chunk leaves it as it was
+        if digest.hexdigest() != checksum.lower():
+            raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+        with open(self.part_path(state.transfer_id), "r+b") as fp:
+            # drop whatever an interrupted attempt at this chunk left behind
+            fp.truncate(offset)
+            fp.seek(offset)
+            if isinstance(body, Path):
+                with open(body, "rb") as src:
+                    shutil.copyfileobj(src, fp, COPY_CHUNK)
+            else:
+                fp.write(body)
+            fp.flush()
+            os.fsync(fp.fileno())
+        state.received += written
+        state.chunks += 1
+        self.save(state)
+        return state
+
+    def finalize(self, state: TransferState, checksum: str) -> dict:
+        """
+        Check the assembled payload and move it into the blob store, runs on a worker thread
+        :param state: The transfer to finish
+        :param checksum: The hex sha256 of the whole payload
+        :return: The results, blob_ref and blob_size column values, 409 if bytes are missing or 400 if
+        the payload does not match its checksum
+        """
+        if state.size is not None and state.received != state.size:
+            raise HTTPException(status_code=409, detail=f"Received {state.received} of {state.size} bytes")
+        part = self.part_path(state.transfer_id)
+        digest = hashlib.sha256()
+        with open(part, "rb") as fp:
+            while chunk := fp.read(COPY_CHUNK):
+                digest.update(chunk)
+        if digest.hexdigest() != checksum.lower():
+            raise HTTPException(status_code=400, detail="Transfer checksum mismatch")
+        return offload_raw_file(state.task, part)
+
+    def finished(self, state: TransferState) -> None:
+        # the result of the transfer is stored, blocking file io
+        state.finalized = True
+        self.save(state)
+
+    def expire(self, dry_run: bool = False, now: float = None) -> int:
+        """
+        Remove the transfers nothing was acknowledged for in expire_hours, blocking file io
+        :param dry_run: Only count them
+        :param now: Epoch seconds to measure from, the current time when not given
+        :return: The number of transfers removed, or that would be
+        """
+        if not self.expire_hours or not self.root.is_dir():
+            return 0
+        cutoff = (now or time.time()) - self.expire_hours * 3600
+        expired = 0
+        for path in self.root.glob("*.json"):
+            try:
+                # the sidecar is rewritten on every acknowledged chunk
+                if path.stat().st_mtime >= cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            expired += 1
+            if dry_run:
+                continue
+            # sidecar first, a chunk arriving now finds no transfer instead of a missing part file
+            path.unlink(missing_ok=True)
+            self.part_path(path.stem).unlink(missing_ok=True)
+        return expired
+
+
+transfers = TransferStore()
@@ -3,11 +3,13 @@ import hashlib
 import string
 import random
 from datetime import datetime, timezone
+from typing import Optional
 from pydantic import BaseModel
 from sqlalchemy import Column, Integer, String
 
 # local imports
 from .db import Base
+from .pagination_helper import PageQuery
 
 
 class Users(Base):
@@ -34,6 +36,10 @@ class UserRead(BaseModel):
         form_attributes = True
 
 
+class UserQuery(PageQuery):
+    username: Optional[str] = None  # prefix
+
+
 class UserDelete(BaseModel):
     id: int
 
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+import asyncio
+from typing import Awaitable, Callable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# local imports
+from .db import AsyncSessionLocal, WriterSessionLocal, writer_engine
+
+T = TypeVar("T")
+Write = Callable[[AsyncSession], Awaitable[T]]
+
+
+class GroupCommitWriter:
+    """
+    The single writer for the database. Routes do their reads on their own session and hand the
+    write itself over as an async function of a session, queued writes are run back to back in one
+    transaction and committed together, so N concurrent writes cost one commit instead of N commits
+    fighting over the sqlite write lock. Each caller's future resolves once its batch has committed.
+    A write may run twice (see commit), it must build its rows itself and raise nothing it expects.
+    """
+
+    def __init__(self, max_batch: int = 64, max_delay: float = 0.001):
+        self.max_batch = max_batch  # writes committed together at most
+        self.max_delay = max_delay  # seconds a batch waits for more writes after the first one
+        self.batches = 0
+        self.writes = 0
+        self._queue = None
+        self._task = None
+
+    def running(self) -> bool:
+        if self._task is None or self._task.done():
+            return False
+        # TestClient runs every request on a loop of its own, the writer serves only the loop it started on
+        return self._task.get_loop() is asyncio.get_running_loop()
+
+    async def start(self) -> None:
+        # started from the FastAPI lifespan, without it (tests, benchmarks) every write commits alone
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        # writes already queued are committed before this returns
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+        # its connection belongs to this event loop
+        await writer_engine.dispose()
+
+    async def submit(self, write: Write) -> T:
+        """
+        Queue a write and wait for the commit of the batch it lands in
+        :param write: An async function of the writer's session, its return value is handed back
+        :return: What write returned, or its exception raised here
+        """
+        if not self.running():
+            return await run_write(write)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((write, future))
+        return await future
+
+    async def next_batch(self) -> tuple[list, bool]:
+        """
+        Collect a batch, whatever queued up during the last commit plus what arrives within max_delay
+        :return: The (write, future) pairs and whether stop was requested
+        """
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.max_delay
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - asyncio.get_running_loop().time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        if batch[-1] is None:
+            return batch[:-1], True
+        return batch, False
+
+    async def run(self) -> None:
+        while True:
+            batch, stopping = await self.next_batch()
+            try:
+                await self.commit(batch)
+            except BaseException:
+                # cancelled mid commit, nobody is left to resolve these
+                for _, future in batch:
+                    future.cancel()
+                raise
+            if stopping:
+                return
+
+    async def commit(self, batch: list) -> None:
+        """
+        Run a batch of writes in one transaction. When any of them (or the commit) fails the batch is
+        rolled back and every write is run again in a transaction of its own, so the failure reaches
+        only the caller it belongs to
+        :param batch: The (write, future) pairs, writes whose caller went away are skipped
+        :return: None
+        """
+        batch = [(write, future) for write, future in batch if not future.done()]
+        if not batch:
+            return
+        try:
+            async with WriterSessionLocal() as db:
+                results = [await write(db) for write, _ in batch]
+                await db.commit()
+        except Exception:
+            for write, future in batch:
+                await self.commit_alone(write, future)
+            return
+        self.batches += 1
+        self.writes += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def commit_alone(self, write: Write, future: asyncio.Future) -> None:
+        try:
+            result = await run_write(write, WriterSessionLocal)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.writes += 1
+        if not future.done():
+            future.set_result(result)
+
+
+async def run_write(write: Write, session_factory=AsyncSessionLocal) -> T:
+    # one write in a transaction of its own, inline callers (writer not running) use the shared pool
+    async with session_factory() as db:
+        result = await write(db)
+        await db.commit()
+        return result
+
+
+async def insert_row(model, values: dict, db: AsyncSession):
+    """
+    A write adding one row, built here so a batch that is run again never re-adds a flushed object
+    :param model: The ORM class of the row
+    :param values: The column values
+    :param db: The writer's session
+    :return: The new row, refreshed after the insert
+    """
+    row = model(**values)
+    db.add(row)
+    await db.flush()
+    await db.refresh(row)
+    return row
+
+
+writer = GroupCommitWriter()
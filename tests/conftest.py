@@ -0,0 +1,31 @@
+import pytest
+
+from server.server_helper.archive_helper import archive
+from server.server_helper.blob_helper import blobs
+from server.server_helper.db import engine, async_engine
+from server.server_helper.migrations import run_migrations
+
+
+# async tests run on asyncio only, aiosqlite and the server are asyncio based
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+# payloads over 1 KiB go to the blob store, the tests don't have to post a megabyte to get there
+@pytest.fixture
+def low_threshold(monkeypatch):
+    monkeypatch.setattr(blobs, "threshold", 1024)
+
+
+# the server migrates on startup, TestClient(app) never runs the lifespan so do it once here.
+# blobs and archives written by the tests go to scratch directories, not next to the committed test database
+@pytest.fixture(scope="session", autouse=True)
+def migrated_database(tmp_path_factory):
+    blobs.root = tmp_path_factory.mktemp("blobs")
+    archive.root = tmp_path_factory.mktemp("archive")
+    # test_lighthouse rebuilds the database file while collecting, drop connections to the old file
+    # first or the migrations land on it instead of the new one
+    engine.dispose()
+    async_engine.sync_engine.dispose(close=False)
+    run_migrations()
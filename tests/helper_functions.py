@@ -1,12 +1,21 @@
 import pytest
 import string 
 import random 
+import base64
+import sqlite3
+from contextlib import closing, contextmanager
+from pathlib import Path
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
 from server.lighthouse import app
+from server.server_helper.db import async_engine
 
 client = TestClient(app)
 
+# far older than anything the tests write, a 30 day limit only ever reaches rows backdated to it
+LONG_AGO = "2000-01-01T00:00:00+00:00"
+
 def get_headers_helper():
     headers = {
         "accept": "application/json",
@@ -85,4 +94,78 @@ def get_implant_session_helper():
 
 def get_implants_req_helper():
     response = client.get("/implants/", headers=get_token_headers_helper())
-    return get_response_helper(response)
\ No newline at end of file
+    return get_response_helper(response)
+
+def schema_db(path: Path) -> Path:
+    # a new database file holding db/schema.sql, the migrations are left to the test
+    with closing(sqlite3.connect(path)) as conn:
+        conn.executescript(Path("db/schema.sql").read_text())
+    return path
+
+
+def create_tasking_helper(session: str, task: str = "ls", args: str = "/tmp"):
+    data = {
+        "task": task,
+        "args": base64.b64encode(args.encode("utf-8")).hex(),
+    }
+    response = client.post(f"/tasking/{session}", headers=get_token_headers_helper(), json=data)
+    return response
+
+
+def queue_and_claim_helper(session: str, task: str = "ls", args: str = "/tmp"):
+    create_tasking_helper(session, task=task, args=args)
+    return client.get(f"/tasks/{session}").json()[-1]
+
+
+def queue_task_helper(task: str, args: str = "/x") -> tuple:
+    # a new session with one task already claimed, the session id and the task the agent got
+    session = generate_fake_session().json()["session"]
+    return session, queue_and_claim_helper(session, task=task, args=args)
+
+
+def post_result_helper(session: str, tasking: dict, results: str | bytes = "output"):
+    if isinstance(results, bytes):
+        # raw output is sent hex(base64(output)) like the agent does
+        results = base64.b64encode(results).hex()
+    data = {
+        "tasking_id": tasking["id"],
+        "task": tasking["task"],
+        "args": base64.b64encode(tasking["args"].encode("utf-8")).hex(),
+        "results": results,
+    }
+    return client.post(f"/results/{session}", json=data)
+
+
+def result_helper(session: str, results: str | bytes = "output", task: str = "ls") -> int:
+    # queue a task, claim it and answer it, the id of the task the result is stored for
+    tasking = queue_and_claim_helper(session, task=task)
+    post_result_helper(session, tasking, results)
+    return tasking["id"]
+
+
+@contextmanager
+def count_queries_helper():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+@contextmanager
+def capture_queries_helper():
+    queries = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        queries.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        yield queries
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
@@ -0,0 +1,81 @@
+import base64
+import random
+import time
+
+import pytest
+import zstandard
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from server.lighthouse import app
+from server.server_helper.archive_helper import ResultArchive, archive
+from server.server_helper.db import SessionLocal, async_engine
+from server.server_helper.results_helper import Results, ResultsRead
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import result_helper
+from tests.helper_functions import LONG_AGO
+
+client = TestClient(app)
+
+
+@pytest.mark.anyio
+async def test_archive_round_trip(monkeypatch):
+    print(f"Testing: test_archive_round_trip()")
+    session = generate_fake_session().json()["session"]
+    outputs = ["plain", "ünïcödé ☃ \"quoted\"\nnew line", base64.b64encode(bytes(range(256)) * 64).hex()]
+    tasking_ids = [result_helper(session, output) for output in outputs]
+    headers = get_token_headers_helper()
+    before = [client.get(f"/results/{session}/{tasking_id}", headers=headers).json() for tasking_id in tasking_ids]
+    with SessionLocal() as db:
+        db.execute(update(Results).where(Results.session == session).values(date=LONG_AGO))
+        db.commit()
+        before = [dict(result, date=LONG_AGO) for result in before]
+
+    monkeypatch.setattr(archive, "after_days", 30)
+    assert await archive.archive() >= 3
+    with SessionLocal() as db:
+        assert db.query(Results).filter(Results.session == session).count() == 0
+    # the route falls back to the archive and answers exactly as it did from sqlite
+    after = [client.get(f"/results/{session}/{tasking_id}", headers=headers).json() for tasking_id in tasking_ids]
+    assert after == before
+    raw = client.get(f"/results/v2/{session}/{tasking_ids[0]}", headers=headers)
+    assert raw.content == b"plain"
+    # a cold archive reads the same records from the files alone
+    cold = ResultArchive(root=archive.root)
+    assert [cold.read(session, tasking_id).model_dump() for tasking_id in tasking_ids] == before
+    assert client.get(f"/results/{session}/999999", headers=headers).status_code == 416
+    await async_engine.dispose()
+
+
+def test_archive_read_latency(tmp_path):
+    print(f"Testing: test_archive_read_latency()")
+    store = ResultArchive(root=tmp_path, segment_size=1 << 20)
+    rows = [
+        ResultsRead(
+            id=i, tasking_id=i, session="abcdefgh", date=LONG_AGO, task="ls", args="/tmp",
+            results=base64.b64encode(random.randbytes(2048)).hex(),
+        )
+        for i in range(1, 5001)
+    ]
+    for start in range(0, len(rows), 500):
+        store.append("abcdefgh", rows[start:start + 500])
+    segments = sorted((tmp_path / "abcdefgh").glob("*.zst"))
+    assert len(segments) > 1
+    # a segment is a plain zstd stream of json lines
+    with open(segments[0], "rb") as fp:
+        lines = zstandard.ZstdDecompressor().stream_reader(fp, read_across_frames=True).read().splitlines()
+    assert ResultsRead.model_validate_json(lines[0]) == rows[0]
+
+    cold = ResultArchive(root=tmp_path)
+    picks = random.sample(rows, 500)
+    started = time.perf_counter()
+    for row in picks:
+        assert cold.read("abcdefgh", row.tasking_id) == row
+    elapsed = (time.perf_counter() - started) / len(picks)
+    print(f"archive read {elapsed * 1000:.3f}ms")
+    # one seek and one small frame, not a segment decompressed
+    assert elapsed < 0.005
+    assert cold.read("abcdefgh", 999999) is None
+    assert cold.read("ffffffff", 1) is None
@@ -0,0 +1,133 @@
+import base64
+import gzip
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.body_helper import body_limits
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+
+client = TestClient(app)
+OCTET = {"Content-Type": "application/octet-stream"}
+
+
+def queue_raw_helper(session: str, task: str, args: str, body: bytes = b""):
+    headers = dict(get_token_headers_helper(), **OCTET)
+    return client.post(f"/tasking/v2/{session}", headers=headers, params={"task": task, "args": args}, content=body)
+
+
+def post_raw_result_helper(session: str, tasking: dict, body: bytes):
+    params = {"task": tasking["task"], "args": tasking["args"]}
+    return client.post(f"/results/v2/{session}/{tasking['id']}", headers=OCTET, params=params, content=body)
+
+
+def test_tasking_raw_plain_args():
+    print(f"Testing: test_tasking_raw_plain_args()")
+    session = generate_fake_session().json()["session"]
+    response = queue_raw_helper(session, "exec_fg", "ls -la /tmp | grep 'x y'")
+    assert response.status_code == 200
+    tasks = client.get(f"/tasks/{session}").json()
+    assert [(task["task"], task["args"]) for task in tasks] == [("exec_fg", "ls -la /tmp | grep 'x y'")]
+    assert queue_raw_helper("aaaaaa", "ls", "/").status_code == 404
+
+
+def test_tasking_raw_upload():
+    print(f"Testing: test_tasking_raw_upload()")
+    session = generate_fake_session().json()["session"]
+    payload = gzip.compress(os.urandom(2048), mtime=0)
+    assert queue_raw_helper(session, "upload", "/tmp/dst", payload).status_code == 200
+    tasking = client.get(f"/tasks/{session}").json()[0]
+    # the agent sees the same upload args it always did, with the file behind the payload endpoint
+    assert tasking["args"] == base64.b64encode(b"/tmp/dst").hex() + ":"
+    assert client.get(f"/tasks/{session}/{tasking['id']}/payload").content == payload
+    response = queue_raw_helper(session, "upload", "/tmp/dst", b"not gzip")
+    assert response.status_code == 400
+
+
+def test_results_raw_small_inline():
+    print(f"Testing: test_results_raw_small_inline()")
+    session = generate_fake_session().json()["session"]
+    queue_raw_helper(session, "ls", "/tmp")
+    tasking = client.get(f"/tasks/{session}").json()[0]
+    output = "total 0\ndrwx 2 root root tmp ✓\n".encode("utf-8")
+    response = post_raw_result_helper(session, tasking, output)
+    assert response.status_code == 200
+    headers = get_token_headers_helper()
+    # stored inline in the legacy encoding, json readers (older merchants) are unaffected
+    legacy = client.get(f"/results/{session}/{tasking['id']}", headers=headers).json()
+    assert legacy["results"] == base64.b64encode(output).hex()
+    assert legacy["args"] == "/tmp"
+    response = client.get(f"/results/v2/{session}/{tasking['id']}", headers=headers)
+    assert response.headers["content-type"] == "application/octet-stream"
+    assert response.headers["x-task"] == "ls"
+    assert response.content == output
+    # the task is complete
+    assert client.get(f"/tasks/{session}").status_code == 404
+
+
+def test_results_raw_legacy_result():
+    print(f"Testing: test_results_raw_legacy_result()")
+    session = generate_fake_session().json()["session"]
+    queue_raw_helper(session, "ls", "/tmp")
+    tasking = client.get(f"/tasks/{session}").json()[0]
+    client.post(f"/results/{session}", json={
+        "tasking_id": tasking["id"],
+        "task": "ls",
+        "args": base64.b64encode(b"/tmp").hex(),
+        "results": base64.b64encode(b"from an old agent").hex(),
+    })
+    response = client.get(f"/results/v2/{session}/{tasking['id']}", headers=get_token_headers_helper())
+    assert response.content == b"from an old agent"
+
+
+def test_results_raw_large(low_threshold):
+    print(f"Testing: test_results_raw_large()")
+    session = generate_fake_session().json()["session"]
+    headers = get_token_headers_helper()
+    queue_raw_helper(session, "exec_fg", "cat big")
+    queue_raw_helper(session, "download", "/etc/big")
+    output_task, download_task = client.get(f"/tasks/{session}").json()
+    output = os.urandom(4096)
+    download = gzip.compress(os.urandom(4096), mtime=0)
+    post_raw_result_helper(session, output_task, output)
+    post_raw_result_helper(session, download_task, download)
+    legacy = client.get(f"/results/{session}/{output_task['id']}", headers=headers).json()
+    assert legacy["results"] == "" and legacy["blob_ref"]
+    response = client.get(f"/results/v2/{session}/{output_task['id']}", headers=headers)
+    assert response.content == output
+    # a download result is the agent's gzip stream, returned as is
+    response = client.get(f"/results/v2/{session}/{download_task['id']}", headers=headers)
+    assert "content-encoding" not in response.headers
+    assert response.content == download
+
+
+@pytest.mark.parametrize("spool_threshold", [1048576, 1024])
+def test_results_raw_large_plain_download(low_threshold, monkeypatch, spool_threshold):
+    print(f"Testing: test_results_raw_large_plain_download(): {spool_threshold}")
+    # read into memory, or spooled to disk and moved into the store as a file
+    monkeypatch.setattr(body_limits, "spool_threshold", spool_threshold)
+    session = generate_fake_session().json()["session"]
+    headers = get_token_headers_helper()
+    queue_raw_helper(session, "download", "/etc/big")
+    tasking = client.get(f"/tasks/{session}").json()[0]
+    # not a gzip stream, it comes back as sent and not compressed by the store
+    download = os.urandom(4096)
+    post_raw_result_helper(session, tasking, download)
+    response = client.get(f"/results/v2/{session}/{tasking['id']}", headers=headers)
+    assert "content-encoding" not in response.headers
+    assert response.content == download
+
+
+def test_results_raw_not_found():
+    print(f"Testing: test_results_raw_not_found()")
+    session = generate_fake_session().json()["session"]
+    response = post_raw_result_helper(session, {"id": 999999, "task": "ls", "args": ""}, b"x")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Task not found"
+    response = client.get(f"/results/v2/{session}/999999", headers=get_token_headers_helper())
+    assert response.status_code == 416
+    response = client.get("/results/v2/aaaaaa/1", headers=get_token_headers_helper())
+    assert response.status_code == 404
@@ -0,0 +1,114 @@
+import base64
+import gzip
+import os
+import sqlite3
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from server.lighthouse import app
+from server.server_helper.blob_helper import blobs, BlobStore
+from server.server_helper.migrations import run_migrations
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import create_tasking_helper
+from tests.helper_functions import schema_db
+
+client = TestClient(app)
+
+
+def transfer_encode(data: bytes) -> str:
+    # hex(base64(gzip)), how the agent and merchant ship files
+    return base64.b64encode(gzip.compress(data, mtime=0)).hex()
+
+
+def post_download_helper(session: str, data: bytes):
+    create_tasking_helper(session, task="download", args="/etc/passwd")
+    tasking = client.get(f"/tasks/{session}").json()[-1]
+    payload = {
+        "tasking_id": tasking["id"],
+        "task": "download",
+        "args": base64.b64encode(b"/etc/passwd").hex(),
+        "results": transfer_encode(data),
+    }
+    client.post(f"/results/{session}", json=payload)
+    return tasking["id"]
+
+
+def test_blob_store_dedup(tmp_path):
+    print(f"Testing: test_blob_store_dedup()")
+    store = BlobStore(tmp_path)
+    first = store.put(b"A" * 4096)
+    second = store.put(b"A" * 4096)
+    assert first == second
+    assert first[1] < 4096  # stored compressed
+    assert gzip.decompress(store.path(first[0]).read_bytes()) == b"A" * 4096
+    assert len(list(tmp_path.rglob("*"))) == 2  # fan out directory and one blob
+
+
+def test_download_result_offloaded(low_threshold):
+    print(f"Testing: test_download_result_offloaded()")
+    session = generate_fake_session().json()["session"]
+    data = os.urandom(4096)
+    tasking_id = post_download_helper(session, data)
+    headers = get_token_headers_helper()
+    result = client.get(f"/results/{session}/{tasking_id}", headers=headers).json()
+    assert result["results"] == ""
+    assert result["blob_ref"]
+    response = client.get(f"/results/{session}/{tasking_id}/blob", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert int(response.headers["content-length"]) == result["blob_size"]
+    assert gzip.decompress(response.content) == data
+
+
+def test_small_download_stays_inline(low_threshold):
+    print(f"Testing: test_small_download_stays_inline()")
+    session = generate_fake_session().json()["session"]
+    tasking_id = post_download_helper(session, b"root:x:0:0")
+    headers = get_token_headers_helper()
+    result = client.get(f"/results/{session}/{tasking_id}", headers=headers).json()
+    assert result["blob_ref"] is None
+    assert result["results"] == transfer_encode(b"root:x:0:0")
+    response = client.get(f"/results/{session}/{tasking_id}/blob", headers=headers)
+    assert response.status_code == 404
+
+
+def test_upload_payload_offloaded(low_threshold):
+    print(f"Testing: test_upload_payload_offloaded()")
+    session = generate_fake_session().json()["session"]
+    data = os.urandom(4096)
+    destination = base64.b64encode(b"/tmp/dst").hex()
+    create_tasking_helper(session, task="upload", args=f"{destination}:{transfer_encode(data)}")
+    tasking = client.get(f"/health/v2/{session}").json()["tasks"][0]
+    assert tasking["args"] == f"{destination}:"
+    # the operator listing previews only the destination
+    summary = client.get(f"/tasking/{session}", headers=get_token_headers_helper()).json()[0]
+    assert summary["args_preview"] == destination
+    assert summary["blob_size"] > 0
+    response = client.get(f"/tasks/{session}/{tasking['id']}/payload")
+    assert response.status_code == 200
+    assert gzip.decompress(response.content) == data
+    # the payload is only served to the session the task belongs to
+    other = generate_fake_session().json()["session"]
+    assert client.get(f"/tasks/{other}/{tasking['id']}/payload").status_code == 404
+
+
+def test_migration_moves_inline_payloads(tmp_path, low_threshold):
+    print(f"Testing: test_migration_moves_inline_payloads()")
+    db_path = schema_db(tmp_path / "database.db")
+    data = os.urandom(4096)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("INSERT INTO implants (session) VALUES ('abcdefgh')")
+        conn.execute("INSERT INTO tasking (session, task) VALUES ('abcdefgh', 'download')")
+        conn.execute(
+            "INSERT INTO results (tasking_id, session, task, results) VALUES (1, 'abcdefgh', 'download', ?)",
+            (transfer_encode(data),),
+        )
+    run_migrations(create_engine(f"sqlite:///{db_path}"))
+    with sqlite3.connect(db_path) as conn:
+        results, blob_ref = conn.execute("SELECT results, blob_ref FROM results").fetchone()
+    assert results == ""
+    assert gzip.decompress(blobs.path(blob_ref).read_bytes()) == data
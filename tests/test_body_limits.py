@@ -0,0 +1,216 @@
+import asyncio
+import base64
+import gzip
+import io
+import json
+import os
+import tracemalloc
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.blob_helper import blobs
+from server.server_helper.body_helper import BodyLimitMiddleware, BodyLimits, FlatJsonReader, body_limits
+from server.server_helper.db import async_engine
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import queue_task_helper
+
+client = TestClient(app)
+
+
+@pytest.fixture
+def small_spool(monkeypatch):
+    monkeypatch.setattr(body_limits, "spool_threshold", 1024)
+    monkeypatch.setattr(blobs, "threshold", 1024)
+
+
+class TrickleText(io.StringIO):
+    # hands out three chars per read so values straddle every chunk boundary
+    def read(self, size=-1):
+        return super().read(3)
+
+
+class ChunkedText(io.StringIO):
+    # hands out chunk chars per read, a stand in for COPY_CHUNK at a size every escape can straddle
+    def __init__(self, text: str, chunk: int):
+        super().__init__(text)
+        self.chunk = chunk
+
+    def read(self, size=-1):
+        return super().read(self.chunk)
+
+
+def read_all_chunkings_helper(text: str) -> list:
+    # what FlatJsonReader makes of text for every chunk size up to past a surrogate pair escape
+    read = []
+    for chunk in range(1, 14):
+        spill = io.StringIO()
+        fields = FlatJsonReader(ChunkedText(text, chunk), 1024).read_object("results", spill)
+        if fields.get("results") == "":
+            fields["results"] = spill.getvalue()
+        read.append(fields)
+    return read
+
+
+@pytest.mark.anyio
+async def test_body_limit_content_length_refused_unread():
+    print(f"Testing: test_body_limit_content_length_refused_unread()")
+    messages = []
+
+    async def inner_app(scope, receive, send):
+        raise AssertionError("the app must not run")
+
+    async def receive():
+        raise AssertionError("the body must not be read")
+
+    async def send(message):
+        messages.append(message)
+
+    middleware = BodyLimitMiddleware(inner_app, settings=BodyLimits({"default": 100}))
+    scope = {"type": "http", "method": "POST", "path": "/implants/", "headers": [(b"content-length", b"101")]}
+    await middleware(scope, receive, send)
+    assert messages[0]["status"] == 413
+    assert json.loads(messages[1]["body"]) == {"detail": "Request body too large"}
+
+
+def test_body_limit_per_route(monkeypatch):
+    print(f"Testing: test_body_limit_per_route()")
+    monkeypatch.setattr(body_limits, "limits", {"default": 1024, "results": 4096})
+    response = client.post("/implants/", content=b"x" * 2048, headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+    session, tasking = queue_task_helper("ls")
+    results = {"tasking_id": tasking["id"], "task": "ls", "args": "", "results": "A" * 2048}
+    assert client.post(f"/results/{session}", json=results).status_code == 200
+    # no Content-Length (chunked), cut off once the body passes the limit
+    chunks = (b"x" * 1024 for _ in range(8))
+    response = client.post(f"/results/{session}", content=chunks, headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        {"tasking_id": 7, "task": "ls", "args": "a\"b\\c\n", "results": "plain"},
+        {"tasking_id": -1.5e3, "task": None, "args": True, "results": "café 😀 \"q\" \\ \t"},
+        {"results": "", "task": "☃" * 10},
+        {},
+    ],
+)
+def test_body_flat_json_reader(document):
+    print(f"Testing: test_body_flat_json_reader(): {document}")
+    for text in (json.dumps(document), json.dumps(document, ensure_ascii=False, indent=2)):
+        spill = io.StringIO()
+        fields = FlatJsonReader(TrickleText(text), 1024).read_object("results", spill)
+        assert spill.getvalue() == document.get("results", "")
+        assert fields == dict(document, **({"results": ""} if "results" in document else {}))
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # escaped quotes and backslashes, every chunk size puts a boundary inside one of them
+        r'{"task": "a\"b\\c", "results": "\\\"\\\\\"x\\", "args": "\""}',
+        r'{"results": "' + "\\\"" * 40 + r'"}',
+        # a surrogate pair escape, in both cases, split across chunks, a lone high surrogate before the quote
+        r'{"results": "a\uD83D\uDE00b\ud83d\ude00", "task": "\uD83D\uDE00", "args": "\ud83d"}',
+        r'{"task": "\u00e9\u2603\/\b\f\n\r\t"}',
+        # duplicate keys, the last one wins as in json.loads, for the spilled field too
+        '{"task": "a", "task": "b", "tasking_id": 1, "tasking_id": 2}',
+        '{"results": "first and longer", "results": "second"}',
+        '{"results": "spilled", "results": 5}',
+    ],
+)
+def test_body_flat_json_reader_matches_json_loads(text):
+    print(f"Testing: test_body_flat_json_reader_matches_json_loads(): {text[:40]}")
+    expected = json.loads(text)
+    assert read_all_chunkings_helper(text) == [expected] * 13
+
+
+@pytest.mark.parametrize("text", ['{"a": [1]}', '{"a": []}', '{"a": {}}', '{"results": "x", "a": [1, 2]}'])
+def test_body_flat_json_reader_rejects_nested(text):
+    print(f"Testing: test_body_flat_json_reader_rejects_nested(): {text}")
+    # valid json, but only flat objects of scalars are read
+    json.loads(text)
+    for chunk in (1, 3, 64):
+        with pytest.raises(ValueError):
+            FlatJsonReader(ChunkedText(text, chunk), 1024).read_object("results", io.StringIO())
+
+
+@pytest.mark.parametrize("text", ['{"a": 1' + "0" * 70 + '}', '{"a": 1', '{"a" 1}', '["a"]', '{"a": "b" "c": 1}', '{"a": {"b": 1}}', '{"a": "x'])
+def test_body_flat_json_reader_invalid(text):
+    print(f"Testing: test_body_flat_json_reader_invalid(): {text}")
+    with pytest.raises(ValueError):
+        FlatJsonReader(TrickleText(text), 1024).read_object("results", io.StringIO())
+
+
+def test_body_spooled_results(small_spool):
+    print(f"Testing: test_body_spooled_results()")
+    headers = get_token_headers_helper()
+    session, download_task = queue_task_helper("download")
+    payload = gzip.compress(os.urandom(8192), mtime=0)
+    args = base64.b64encode("/tmp/café".encode()).hex()
+    results = {"tasking_id": download_task["id"], "task": "download", "args": args, "results": base64.b64encode(payload).hex()}
+    assert client.post(f"/results/{session}", json=results).status_code == 200
+    stored = client.get(f"/results/{session}/{download_task['id']}", headers=headers).json()
+    assert stored["args"] == "/tmp/café" and stored["results"] == "" and stored["blob_ref"]
+    assert client.get(f"/results/v2/{session}/{download_task['id']}", headers=headers).content == payload
+    # results that are not hex(base64) (an agent error message) are kept as the text itself
+    session, ls_task = queue_task_helper("ls")
+    text = "ls: cannot access ☃: " + "No such file or directory\n" * 100
+    results = {"tasking_id": ls_task["id"], "task": "ls", "args": "", "results": text}
+    assert client.post(f"/results/{session}", json=results).status_code == 200
+    assert client.get(f"/results/v2/{session}/{ls_task['id']}", headers=headers).text == text
+    assert list(body_limits.spool_dir.iterdir()) == []
+
+
+def test_body_spooled_results_invalid(small_spool):
+    print(f"Testing: test_body_spooled_results_invalid()")
+    session, tasking = queue_task_helper("ls")
+    results = {"tasking_id": "not a number", "task": "ls", "args": "", "results": "A" * 4096}
+    response = client.post(f"/results/{session}", json=results)
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "tasking_id"]
+    body = json.dumps(dict(results, tasking_id=tasking["id"]))[:-2]
+    response = client.post(f"/results/{session}", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["type"] == "json_invalid"
+    # unknown task, the spooled body is cleaned up on the 404 as well
+    results = {"tasking_id": 999999, "task": "ls", "args": "", "results": "A" * 4096}
+    assert client.post(f"/results/{session}", json=results).status_code == 404
+    assert list(body_limits.spool_dir.iterdir()) == []
+
+
+async def legacy_body(tasking_id: int, size: int):
+    # a legacy json download result streamed a block at a time, about size bytes of hex(base64(payload))
+    block = base64.b64encode(b"\x1f\x8b" + os.urandom(3 * (1 << 17) - 2)).hex().encode()
+    yield json.dumps({"tasking_id": tasking_id, "task": "download", "args": ""})[:-1].encode() + b', "results": "'
+    for _ in range(size // len(block)):
+        yield block
+    yield b'"}'
+
+
+@pytest.mark.anyio
+async def test_body_concurrent_large_posts_memory():
+    print(f"Testing: test_body_concurrent_large_posts_memory()")
+    size = 200 * 1024 * 1024
+    tasks = [queue_task_helper("download") for _ in range(3)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://lighthouse") as async_client:
+        tracemalloc.start()
+        responses = await asyncio.gather(
+            *[
+                async_client.post(f"/results/{session}", content=legacy_body(tasking["id"], size))
+                for session, tasking in tasks
+            ]
+        )
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    # three 200MB bodies in flight at once, none of them is ever held in memory
+    assert peak < 32 * 1024 * 1024
+    for session, tasking in tasks:
+        stored = client.get(f"/results/{session}/{tasking['id']}", headers=get_token_headers_helper()).json()
+        assert stored["blob_size"] == size * 3 // 8
+    await async_engine.dispose()
@@ -0,0 +1,82 @@
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.compression_helper import CompressionMiddleware, ResponseCompression
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+
+client = TestClient(app)
+
+
+def test_compression_gzip_json():
+    print(f"Testing: test_compression_gzip_json()")
+    for _ in range(5):
+        generate_fake_session()
+    headers = dict(get_token_headers_helper(), **{"Accept-Encoding": "gzip"})
+    response = client.get("/implants/", headers=headers)
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    # the wire size is the compressed one, httpx hands back the decoded body
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert len(response.json()) >= 5
+
+
+def test_compression_zstd_preferred():
+    print(f"Testing: test_compression_zstd_preferred()")
+    pytest.importorskip("zstandard")
+    headers = dict(get_token_headers_helper(), **{"Accept-Encoding": "gzip, zstd"})
+    response = client.get("/implants/", headers=headers)
+    assert response.headers["content-encoding"] == "zstd"
+    assert isinstance(response.json(), list)
+
+
+def test_compression_not_accepted_or_small():
+    print(f"Testing: test_compression_not_accepted_or_small()")
+    headers = dict(get_token_headers_helper(), **{"Accept-Encoding": "identity"})
+    response = client.get("/implants/", headers=headers)
+    assert "content-encoding" not in response.headers
+    # under compression_min_size
+    response = client.get("/health/aaaaaa", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+
+@pytest.mark.parametrize(
+    "accept, expected",
+    [("gzip", "gzip"), ("zstd;q=0, gzip", "gzip"), ("gzip;q=0", None), ("*", "gzip"), ("", None)],
+)
+def test_compression_negotiate(accept, expected):
+    print(f"Testing: test_compression_negotiate(): {accept}")
+    assert ResponseCompression(encodings="gzip").negotiate(accept) == expected
+
+
+def test_compression_streamed_and_allowlist():
+    print(f"Testing: test_compression_streamed_and_allowlist()")
+    stream_app = FastAPI()
+    stream_app.add_middleware(CompressionMiddleware, settings=ResponseCompression(min_size=10, encodings="gzip"))
+    rows = [{"id": i, "args": "A" * 100} for i in range(50)]
+    blob = gzip.compress(b"x" * 100)
+
+    @stream_app.get("/json")
+    async def stream_json():
+        chunks = (json.dumps(row).encode() + b"\n" for row in rows)
+        return StreamingResponse(chunks, media_type="application/json")
+
+    @stream_app.get("/blob")
+    async def stream_blob():
+        return StreamingResponse(iter([blob]), media_type="application/gzip")
+
+    stream_client = TestClient(stream_app)
+    response = stream_client.get("/json", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    assert [json.loads(line) for line in response.text.splitlines()] == rows
+    # already compressed content types are not in the allowlist and go out untouched
+    response = stream_client.get("/blob", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.content == blob
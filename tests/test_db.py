@@ -0,0 +1,31 @@
+import pytest
+
+from server.server_helper.db import engine, effective_pragmas
+from server.server_helper.lighthouse_config import parse_config, parse_config_vals
+
+
+def test_sqlite_pragmas_every_connection():
+    print(f"Testing: test_sqlite_pragmas_every_connection()")
+    pragmas = effective_pragmas()
+    print(pragmas)
+    assert pragmas["journal_mode"] == "wal"
+    assert pragmas["synchronous"] == 1  # NORMAL
+    assert pragmas["busy_timeout"] == 5000
+    assert pragmas["foreign_keys"] == 1
+    # a brand new connection, not one handed back from the pool
+    engine.dispose()
+    with engine.connect() as conn:
+        raw = conn.connection.driver_connection
+        assert raw.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+
+def test_sqlite_pragmas_from_config():
+    print(f"Testing: test_sqlite_pragmas_from_config()")
+    conf = parse_config("server/lighthouse.conf")
+    conf.append("sqlite_synchronous: FULL\n")
+    conf.append("sqlite_foreign_keys: off\n")
+    web_server = parse_config_vals(conf)
+    assert web_server.tunables["sqlite_journal_mode"] == "WAL"
+    assert web_server.tunables["sqlite_synchronous"] == "FULL"
+    assert web_server.tunables["sqlite_busy_timeout"] == 5000
+    assert web_server.tunables["sqlite_foreign_keys"] is False
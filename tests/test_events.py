@@ -0,0 +1,92 @@
+import asyncio
+import base64
+import json
+from datetime import timedelta
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.auth_helper import create_access_token
+from server.server_helper.db import async_engine
+from server.server_helper.events_helper import EventBus, format_sse
+
+from tests.helper_functions import gen_fake_session_name
+from tests.helper_functions import get_token_headers_helper
+
+client = TestClient(app)
+
+
+def parse_sse_helper(body: str) -> list:
+    return [
+        json.loads(line[len("data: "):])
+        for line in body.splitlines()
+        if line.startswith("data: ")
+    ]
+
+
+def test_events_requires_token():
+    print(f"Testing: test_events_requires_token()")
+    response = client.get("/events/")
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_events_stream_lifecycle():
+    print(f"Testing: test_events_stream_lifecycle()")
+    # the stream ends when the token expires, a short one lets the buffered test response complete
+    token = create_access_token({"sub": "admin"}, timedelta(seconds=2))
+    headers = {"Authorization": f"Bearer {token}"}
+    operator_headers = get_token_headers_helper()
+    implant = {
+        "session": gen_fake_session_name(),
+        "hostname": "evthost",
+        "username": "evtuser",
+        "callback_freq": 1,
+        "jitter": 15,
+    }
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as ac:
+        stream = asyncio.create_task(ac.get("/events/", headers=headers))
+        await asyncio.sleep(0.2)
+        session = (await ac.post("/implants/", json=implant)).json()["session"]
+        await ac.post(
+            f"/tasking/{session}",
+            headers=operator_headers,
+            json={"task": "ls", "args": base64.b64encode(b"/tmp").hex()},
+        )
+        tasking = (await ac.get(f"/tasks/{session}")).json()[-1]
+        await ac.post(f"/results/{session}", json={
+            "tasking_id": tasking["id"],
+            "task": tasking["task"],
+            "args": base64.b64encode(b"/tmp").hex(),
+            "results": "output",
+        })
+        await ac.get(f"/health/d/{session}")
+        response = await stream
+    await async_engine.dispose()
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    mine = [message for message in parse_sse_helper(response.text) if message.get("session") == session]
+    assert [message["event"] for message in mine] == [
+        "session_registered",
+        "task_picked_up",
+        "result_arrived",
+        "session_deregistered",
+    ]
+    assert mine[0]["hostname"] == "evthost"
+    assert mine[1]["tasking_ids"] == [tasking["id"]]
+    assert mine[2]["tasking_id"] == tasking["id"]
+
+
+@pytest.mark.anyio
+async def test_events_slow_subscriber_drops():
+    print(f"Testing: test_events_slow_subscriber_drops()")
+    bus = EventBus(queue_size=2)
+    queue, _ = bus.subscribe()
+    for i in range(5):
+        bus.publish("result_arrived", session="aaaaaa", tasking_id=i)
+    await asyncio.sleep(0)
+    # the queue is bounded, what the subscriber never read is counted and dropped
+    assert queue.qsize() == 2
+    assert bus.dropped == 3
+    assert format_sse(queue.get_nowait()).startswith("event: result_arrived\ndata: ")
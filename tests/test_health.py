@@ -1,12 +1,24 @@
+import asyncio
+import base64
+import time
+
+import httpx
 import pytest
 
 from httpx import codes
 from fastapi.testclient import TestClient
 from server.lighthouse import app
+from server.server_helper.db import SessionLocal, async_engine
+from server.server_helper.heartbeat_helper import heartbeats
+from server.server_helper.implant_helper import Implant
+from server.server_helper.longpoll_helper import notifier
+from server.server_helper.writer_helper import writer
 
 from tests.helper_functions import get_token_headers_helper
 from tests.helper_functions import get_response_helper
 from tests.helper_functions import generate_fake_session
+from tests.helper_functions import create_tasking_helper
+from tests.helper_functions import count_queries_helper
 
 client = TestClient(app)
 
@@ -40,4 +52,150 @@ def test_health_implant_death_req():
     assert implant_to_kill_alive == True
     response = client.get(f"/health/d/{implant_to_kill_session}", headers=get_token_headers_helper())
     get_response_helper(response)
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_health_checkin_v2_no_tasks():
+    print(f"Testing: test_health_checkin_v2_no_tasks()")
+    fake = generate_fake_session()
+    implant_session_name = fake.json()["session"]
+    response = client.get(f"/health/v2/{implant_session_name}")
+    get_response_helper(response)
+    assert response.status_code == 200
+    assert response.json()["session"] == implant_session_name
+    assert response.json()["last_checkin"] != fake.json()["last_checkin"]
+    assert response.json()["tasks"] == []
+
+def test_health_checkin_v2_not_found():
+    print(f"Testing: test_health_checkin_v2_not_found()")
+    response = client.get(f"/health/v2/aaaaaa")
+    get_response_helper(response)
+    assert response.status_code == 404
+
+def test_health_checkin_v2_tasks_inline():
+    print(f"Testing: test_health_checkin_v2_tasks_inline()")
+    implant_session_name = generate_fake_session().json()["session"]
+    create_tasking_helper(implant_session_name)
+    response = client.get(f"/health/v2/{implant_session_name}")
+    get_response_helper(response)
+    assert response.status_code == 200
+    tasks = response.json()["tasks"]
+    assert len(tasks) == 1
+    assert tasks[0]["task"] == "ls"
+    assert tasks[0]["args"] == "/tmp"
+    assert tasks[0]["complete"] == "Pending"
+    # already handed out, nothing new on the next poll
+    response = client.get(f"/health/v2/{implant_session_name}")
+    assert response.json()["tasks"] == []
+
+def test_health_checkin_v2_fewer_round_trips():
+    print(f"Testing: test_health_checkin_v2_fewer_round_trips()")
+    legacy_session = generate_fake_session().json()["session"]
+    v2_session = generate_fake_session().json()["session"]
+    create_tasking_helper(legacy_session)
+    create_tasking_helper(v2_session)
+
+    with count_queries_helper() as legacy_statements:
+        redirect = client.get(f"/health/{legacy_session}", follow_redirects=False)
+        tasks = client.get(redirect.headers["location"])
+    assert redirect.status_code == 301
+    assert len(tasks.json()) == 1
+
+    with count_queries_helper() as v2_statements:
+        response = client.get(f"/health/v2/{v2_session}")
+    assert len(response.json()["tasks"]) == 1
+    # the session registry answers the lookups, both paths are down to the claiming UPDATE
+    assert len(v2_statements) <= len(legacy_statements)
+
+@pytest.mark.anyio
+async def test_health_checkin_write_behind():
+    print(f"Testing: test_health_checkin_write_behind()")
+    fake = generate_fake_session()
+    implant_session_name = fake.json()["session"]
+    registered_checkin = fake.json()["last_checkin"]
+    response = client.get(f"/health/{implant_session_name}")
+    buffered_checkin = response.json()["last_checkin"]
+    with SessionLocal() as db:
+        stored = db.query(Implant).filter(Implant.session == implant_session_name).first()
+        assert stored.last_checkin == registered_checkin
+    # operators see the unflushed value
+    response = client.get(f"/implants/{implant_session_name}", headers=get_token_headers_helper())
+    assert response.json()["last_checkin"] == buffered_checkin
+    await heartbeats.flush()
+    assert heartbeats.get(implant_session_name) is None
+    with SessionLocal() as db:
+        stored = db.query(Implant).filter(Implant.session == implant_session_name).first()
+        assert stored.last_checkin == buffered_checkin
+
+@pytest.mark.anyio
+async def test_health_heartbeat_flush_single_update():
+    print(f"Testing: test_health_heartbeat_flush_single_update()")
+    await heartbeats.flush()
+    for _ in range(5):
+        implant_session_name = generate_fake_session().json()["session"]
+        client.get(f"/health/{implant_session_name}")
+    with count_queries_helper() as statements:
+        assert await heartbeats.flush() == 5
+    updates = [s for s in statements if s.startswith("UPDATE")]
+    assert len(updates) == 1
+
+@pytest.mark.anyio
+async def test_health_checkin_longpoll_wakes_on_tasking():
+    print(f"Testing: test_health_checkin_longpoll_wakes_on_tasking()")
+    session = generate_fake_session().json()["session"]
+    headers = get_token_headers_helper()
+    data = {"task": "ls", "args": base64.b64encode(b"/tmp").hex()}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as ac:
+        poll = asyncio.create_task(ac.get(f"/health/v2/{session}", params={"wait": 30}))
+        await asyncio.sleep(0.2)
+        assert not poll.done()
+        start = time.perf_counter()
+        await ac.post(f"/tasking/{session}", headers=headers, json=data)
+        response = await poll
+        latency = time.perf_counter() - start
+    # close the connections opened on this test's event loop, their worker threads keep the process alive
+    await async_engine.dispose()
+    print(f"pickup latency {latency * 1000:.2f}ms")
+    assert [task["args"] for task in response.json()["tasks"]] == ["/tmp"]
+    # picked up as soon as it was queued, not on the next callback (minutes)
+    assert latency < 1.0
+
+def test_health_checkin_longpoll_timeout():
+    print(f"Testing: test_health_checkin_longpoll_timeout()")
+    session = generate_fake_session().json()["session"]
+    start = time.perf_counter()
+    response = client.get(f"/health/v2/{session}", params={"wait": 0.2})
+    assert response.status_code == 200
+    assert response.json()["tasks"] == []
+    assert time.perf_counter() - start >= 0.2
+
+def test_health_checkin_longpoll_capped(monkeypatch):
+    print(f"Testing: test_health_checkin_longpoll_capped()")
+    monkeypatch.setattr(notifier, "max_waiters", 0)
+    session = generate_fake_session().json()["session"]
+    start = time.perf_counter()
+    response = client.get(f"/health/v2/{session}", params={"wait": 30})
+    assert response.json()["tasks"] == []
+    # over the cap the check in is answered straight away instead of being held
+    assert time.perf_counter() - start < 1.0
+
+@pytest.mark.anyio
+async def test_health_heartbeat_flush_cancelled_keeps_checkins(monkeypatch):
+    print(f"Testing: test_health_heartbeat_flush_cancelled_keeps_checkins()")
+    await heartbeats.flush()
+    session = generate_fake_session().json()["session"]
+    client.get(f"/health/{session}")
+    buffered_checkin = heartbeats.get(session)
+    submitted = asyncio.Event()
+
+    async def stalled_submit(write):
+        submitted.set()
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(writer, "submit", stalled_submit)
+    flusher = asyncio.create_task(heartbeats.flush())
+    await submitted.wait()
+    # shutdown cancels the flush loop with this write in flight
+    flusher.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await flusher
+    assert heartbeats.get(session) == buffered_checkin
@@ -1,8 +1,12 @@
 import pytest
 
 from httpx import codes
+from fastapi.responses import JSONResponse
 from fastapi.testclient import TestClient
 from server.lighthouse import app
+from server.server_helper.db import SessionLocal
+from server.server_helper.heartbeat_helper import heartbeats
+from server.server_helper.implant_helper import Implant, ImplantRead
 
 from tests.helper_functions import get_token_headers_helper
 from tests.helper_functions import get_response_helper
@@ -38,6 +42,53 @@ def test_get_implants_req():
     get_response_helper(response)
     assert response.status_code == 200
 
+def test_get_implants_paged():
+    print(f"Testing: test_get_implants_paged()")
+    for _ in range(3):
+        generate_fake_session()
+    headers = get_token_headers_helper()
+    first = client.get("/implants/", headers=headers, params={"limit": 2})
+    assert len(first.json()) == 2
+    after_id = first.json()[-1]["id"]
+    second = client.get("/implants/", headers=headers, params={"limit": 2, "after_id": after_id})
+    assert all(implant["id"] > after_id for implant in second.json())
+    newest = client.get("/implants/", headers=headers, params={"limit": 1, "order": "desc"})
+    assert newest.json()[0]["id"] >= second.json()[-1]["id"]
+
+
+def test_get_implants_bytes_unchanged():
+    print(f"Testing: test_get_implants_bytes_unchanged()")
+    session = generate_fake_session().json()["session"]
+    client.get(f"/health/{session}")
+    response = client.get("/implants/", headers=get_token_headers_helper(), params={"limit": 50, "order": "desc"})
+    # what the ORM + response_model + JSONResponse path renders for the same rows
+    with SessionLocal() as db:
+        implants = db.query(Implant).order_by(Implant.id.desc()).limit(50).all()
+        models = [heartbeats.merge(ImplantRead.model_validate(i, from_attributes=True)) for i in implants]
+    expected = JSONResponse([model.model_dump(mode="json") for model in models]).body
+    assert response.content == expected
+
+
+def test_get_implants_filtered():
+    print(f"Testing: test_get_implants_filtered()")
+    session = generate_fake_session().json()["session"]
+    hostname = client.get(f"/implants/{session}", headers=get_token_headers_helper()).json()["hostname"]
+    params = {"hostname": hostname[:6], "alive": True}
+    response = client.get("/implants/", headers=get_token_headers_helper(), params=params)
+    get_response_helper(response)
+    assert session in [implant["session"] for implant in response.json()]
+    assert all(implant["hostname"].startswith(hostname[:6]) for implant in response.json())
+    # LIKE wildcards are matched literally
+    params = {"hostname": "%"}
+    assert client.get("/implants/", headers=get_token_headers_helper(), params=params).json() == []
+
+
+@pytest.mark.parametrize("limit", [0, 1001])
+def test_get_implants_limit_bounds(limit):
+    print(f"Testing: test_get_implants_limit_bounds(): {limit}")
+    response = client.get("/implants/", headers=get_token_headers_helper(), params={"limit": limit})
+    assert response.status_code == 422
+
 def test_get_implant_session():
     print(f"Testing: test_get_implant_session()")
     fake = generate_fake_session()
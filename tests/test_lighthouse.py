@@ -30,11 +30,19 @@ GET /implants/{session}
 
 GET /results/{session}/{id}
 POST /results/{session}
+GET /results/v2/{session}/{id}
+POST /results/v2/{session}/{id}
+POST /results/v2/{session}/{id}/transfers
+GET /results/v2/{session}/transfers/{transfer_id}
+PUT /results/v2/{session}/transfers/{transfer_id}/{index}
+POST /results/v2/{session}/transfers/{transfer_id}/finalize
 
 GET /tasks/{session}
 
 GET /tasking/{session}
+GET /tasking/{session}/{id}
 POST /tasking/{session}
+POST /tasking/v2/{session}
 
 POST /token
 
@@ -0,0 +1,127 @@
+import pytest
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from server.lighthouse import app
+from server.server_helper.column_helper import MICROSECOND, TASK_STATES, to_epoch_micros
+from server.server_helper.db import engine
+from server.server_helper.migrations import apply_migration, run_migrations, discover_migrations
+from server.server_helper.registry_helper import registry
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import create_tasking_helper
+from tests.helper_functions import capture_queries_helper
+from tests.helper_functions import schema_db
+
+client = TestClient(app)
+
+
+def scratch_engine(tmp_path):
+    db_path = schema_db(tmp_path / "database.db")
+    return create_engine(f"sqlite:///{db_path}")
+
+
+def query_plan(statement, parameters):
+    with engine.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters)).fetchall()
+    return [row[-1] for row in rows]
+
+
+def test_migrations_versioned(tmp_path):
+    print(f"Testing: test_migrations_versioned()")
+    scratch = scratch_engine(tmp_path)
+    latest = discover_migrations()[-1][0]
+    assert run_migrations(scratch) == len(discover_migrations())
+    with scratch.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA user_version").scalar() == latest
+        indexes = [row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert "idx_tasking_open" in indexes
+    # already current, nothing to do
+    assert run_migrations(scratch) == 0
+
+
+@pytest.mark.parametrize(
+    "route",
+    [
+        "/health/{session}",
+        "/health/v2/{session}",
+        "/tasks/{session}",
+        "/tasking/{session}",
+        "/results/{session}/1",
+        "/results/{session}/creds",
+    ]
+)
+def test_route_queries_use_index(route):
+    print(f"Testing: test_route_queries_use_index(): {route}")
+    run_migrations()
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session)
+    headers = get_token_headers_helper()
+    # force the registry miss path so its lookup query is planned too
+    registry.forget(session)
+    with capture_queries_helper() as queries:
+        client.get(route.format(session=session), headers=headers, follow_redirects=False)
+    lookups = [(s, p) for s, p in queries if "WHERE" in s and not isinstance(p, list)]
+    assert lookups
+    for statement, parameters in lookups:
+        plan = query_plan(statement, parameters)
+        print(statement, plan)
+        # SCAN CONSTANT ROW is the SELECT EXISTS (...) wrapper, not a table scan
+        assert not any(step.startswith("SCAN") and step != "SCAN CONSTANT ROW" for step in plan)
+
+
+
+def test_migration_epoch_timestamps(tmp_path):
+    print(f"Testing: test_migration_epoch_timestamps()")
+    scratch = scratch_engine(tmp_path)
+    raw = scratch.raw_connection()
+    conn = raw.driver_connection
+    conn.execute("PRAGMA foreign_keys = ON")
+    # the string schema of 0005 with rows written the way the server wrote them
+    for version, path in discover_migrations():
+        if version < 6:
+            apply_migration(conn, version, path)
+    conn.execute("INSERT INTO implants (session, first_checkin, last_checkin) VALUES ('abcdefgh', ?, ?)",
+                 ("2024-01-01T00:00:00+00:00", "2024-05-06T07:08:09.123456+00:00"))
+    conn.executemany(
+        "INSERT INTO tasking (id, session, date, complete, lease_expires) VALUES (?, 'abcdefgh', ?, ?, ?)",
+        [(1, "2024-01-01T00:00:01+00:00", "True", None), (7, "not a date", "Pending", "2024-01-01T00:05:00+00:00")],
+    )
+    conn.execute("DELETE FROM tasking WHERE id = 7")
+    conn.execute("INSERT INTO tasking (session, complete) VALUES ('abcdefgh', 'Pending')")
+    conn.execute("INSERT INTO results (tasking_id, session, date) VALUES (1, 'abcdefgh', '2024-01-01T00:00:02+00:00')")
+    conn.commit()
+    assert run_migrations(scratch) == len(discover_migrations()) - 5
+    rows = conn.execute("SELECT id, typeof(date), date, complete FROM tasking ORDER BY id").fetchall()
+    assert rows == [(1, "integer", 1704067201000000, 2), (8, "null", None, 1)]
+    assert conn.execute("SELECT last_checkin FROM implants").fetchone()[0] == 1714979289123456
+    assert conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tasking'").fetchone()[0] == 8
+    assert conn.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+    plan = [row[-1] for row in conn.execute("EXPLAIN QUERY PLAN SELECT id FROM implants WHERE last_checkin < 5")]
+    assert plan == ["SEARCH implants USING COVERING INDEX idx_implants_last_checkin (last_checkin<?)"]
+    # the foreign keys still point at the rebuilt tables
+    conn.execute("DELETE FROM implants")
+    assert conn.execute("SELECT count(*) FROM results").fetchone()[0] == 0
+    raw.close()
+
+
+def test_epoch_columns_keep_api_strings():
+    print(f"Testing: test_epoch_columns_keep_api_strings()")
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session)
+    headers = get_token_headers_helper()
+    tasking = client.get(f"/tasking/{session}", headers=headers).json()[0]
+    implant = client.get(f"/implants/{session}", headers=headers).json()
+    assert implant["first_checkin"] == datetime.fromisoformat(implant["first_checkin"]).isoformat()
+    assert datetime.fromisoformat(tasking["date"]).tzinfo == timezone.utc
+    with engine.connect() as conn:
+        stored = conn.exec_driver_sql("SELECT date, complete FROM tasking WHERE id = ?", (tasking["id"],)).one()
+    assert stored == (to_epoch_micros(tasking["date"]), TASK_STATES["False"])
+    # since compares integers, the task's own date is inside the range and a microsecond later is not
+    for since, count in ((tasking["date"], 1), ((datetime.fromisoformat(tasking["date"]) + MICROSECOND).isoformat(), 0)):
+        response = client.get(f"/tasking/{session}", headers=headers, params={"since": since})
+        assert len(response.json()) == count
+    assert client.get(f"/tasking/{session}", headers=headers, params={"complete": "Maybe"}).status_code == 422
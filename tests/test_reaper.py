@@ -0,0 +1,132 @@
+import asyncio
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from server.lighthouse import app
+from server.server_helper.column_helper import to_epoch_micros
+from server.server_helper.db import SessionLocal, async_engine
+from server.server_helper.heartbeat_helper import heartbeats
+from server.server_helper.implant_helper import Implant
+from server.server_helper.job_helper import run_periodic
+from server.server_helper.migrations import run_migrations
+from server.server_helper.reaper_helper import LivenessReaper, reap_overdue
+from server.server_helper.registry_helper import registry
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import schema_db
+
+client = TestClient(app)
+
+# far behind every session the other tests register, a fake clock here reaps only this module's sessions
+FAKE_START = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self) -> datetime:
+        return self.now
+
+    def advance(self, **delta) -> None:
+        self.now += timedelta(**delta)
+
+
+def test_reaper_next_checkin_from_callback():
+    print(f"Testing: test_reaper_next_checkin_from_callback()")
+    implant = generate_fake_session().json()
+    # callback_freq 1 minute plus the full 15% jitter
+    expected = datetime.fromisoformat(implant["last_checkin"]) + timedelta(seconds=69)
+    assert datetime.fromisoformat(implant["next_checkin"]) == expected
+
+
+@pytest.mark.anyio
+async def test_reaper_marks_overdue_dead_and_checkin_revives():
+    print(f"Testing: test_reaper_marks_overdue_dead_and_checkin_revives()")
+    session = generate_fake_session().json()["session"]
+    with SessionLocal() as db:
+        db.execute(update(Implant).where(Implant.session == session).values(next_checkin=FAKE_START.isoformat()))
+        db.commit()
+    clock = FakeClock(FAKE_START)
+    reaper = LivenessReaper(grace=60, clock=clock)
+    clock.advance(seconds=59)
+    assert await reaper.sweep() == []
+    clock.advance(seconds=2)
+    assert await reaper.sweep() == [session]
+    assert registry.get(session).alive is False
+    headers = get_token_headers_helper()
+    assert client.get(f"/implants/{session}", headers=headers).status_code == 410
+    # the agent was only late, its next check in brings it back
+    client.get(f"/health/{session}")
+    await heartbeats.flush()
+    assert registry.get(session).alive is True
+    implant = client.get(f"/implants/{session}", headers=headers).json()
+    assert implant["next_checkin"] > implant["last_checkin"]
+    await async_engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_reaper_sweep_time_bounded(tmp_path):
+    print(f"Testing: test_reaper_sweep_time_bounded()")
+    db_path = schema_db(tmp_path / "database.db")
+    run_migrations(create_engine(f"sqlite:///{db_path}"))
+    # 100k alive sessions due one every 60ms over 100 minutes
+    start = to_epoch_micros(FAKE_START.isoformat())
+    with sqlite3.connect(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO implants (session, alive, callback_freq, jitter, next_checkin) VALUES (?, 1, 1, 15, ?)",
+            ((f"{i:08x}", start + i * 60_000) for i in range(100_000)),
+        )
+    scratch = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    statements = []
+    event.listen(scratch.sync_engine, "before_cursor_execute", lambda *args: statements.append(args[2:4]))
+    clock = FakeClock(FAKE_START)
+    timings = []
+    reaped = 0
+    async with AsyncSession(scratch) as db:
+        # a sweep a minute for 110 minutes, the last ones find nothing left
+        for _ in range(110):
+            clock.advance(minutes=1)
+            started = time.perf_counter()
+            reaped += len(await reap_overdue(clock().isoformat(), db))
+            await db.commit()
+            timings.append(time.perf_counter() - started)
+    await scratch.dispose()
+    print(f"sweep max {max(timings) * 1000:.2f}ms mean {sum(timings) / len(timings) * 1000:.2f}ms")
+    assert reaped == 100_000
+    # each sweep reads only its own ~1000 overdue rows, never all 100k
+    assert max(timings) < 0.5
+    statement, parameters = statements[0]
+    with sqlite3.connect(db_path) as conn:
+        plan = [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+    assert plan == ["SEARCH implants USING INDEX idx_implants_next_checkin (next_checkin<?)"]
+
+
+@pytest.mark.anyio
+async def test_periodic_job_survives_failures(capsys):
+    print(f"Testing: test_periodic_job_survives_failures()")
+    runs = []
+    done = asyncio.Event()
+
+    async def flaky():
+        runs.append(len(runs))
+        if len(runs) == 1:
+            raise RuntimeError("database is locked")
+        if len(runs) == 3:
+            done.set()
+        return len(runs)
+
+    reported = []
+    job = asyncio.create_task(run_periodic("Flaky job", 0, flaky, reported.append))
+    await asyncio.wait_for(done.wait(), 1)
+    job.cancel()
+    # the failed run is logged and the loop carries on, only the runs that finished are reported
+    assert "Flaky job failed, retrying next interval: database is locked" in capsys.readouterr().out
+    assert reported[:2] == [2, 3]
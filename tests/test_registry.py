@@ -0,0 +1,159 @@
+import asyncio
+import base64
+
+import pytest
+
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.db import AsyncSessionLocal, async_engine
+from server.server_helper.registry_helper import registry, SessionRegistry, SessionEntry
+
+from tests.helper_functions import get_response_helper
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import create_tasking_helper
+from tests.helper_functions import count_queries_helper
+from tests.helper_functions import post_result_helper
+
+client = TestClient(app)
+
+
+def test_registry_no_work_checkin_skips_sqlite():
+    print(f"Testing: test_registry_no_work_checkin_skips_sqlite()")
+    session = generate_fake_session().json()["session"]
+    with count_queries_helper() as statements:
+        response = client.get(f"/health/v2/{session}")
+    assert response.status_code == 200
+    assert response.json()["tasks"] == []
+    assert statements == []
+
+
+def test_registry_tracks_queued_tasks():
+    print(f"Testing: test_registry_tracks_queued_tasks()")
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session)
+    create_tasking_helper(session)
+    assert registry.get(session).queued == 2
+    response = client.get(f"/health/v2/{session}")
+    assert len(response.json()["tasks"]) == 2
+    assert registry.get(session).queued == 0
+
+
+def test_registry_miss_reads_database():
+    print(f"Testing: test_registry_miss_reads_database()")
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session)
+    registry.forget(session)
+    misses = registry.stats().misses
+    response = client.get(f"/health/v2/{session}")
+    assert len(response.json()["tasks"]) == 1
+    assert registry.stats().misses == misses + 1
+    assert registry.get(session) is not None
+
+
+def test_registry_unknown_session_not_found():
+    print(f"Testing: test_registry_unknown_session_not_found()")
+    response = client.get("/health/v2/aaaaaa")
+    assert response.status_code == 404
+    assert registry.get("aaaaaa") is None
+
+
+def test_registry_follows_deregister_and_reconfig():
+    print(f"Testing: test_registry_follows_deregister_and_reconfig()")
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session, task="reconfig", args="45 10")
+    tasking = client.get(f"/tasks/{session}").json()[0]
+    data = {
+        "tasking_id": tasking["id"],
+        "task": "reconfig",
+        "args": base64.b64encode(b"45 10").hex(),
+        "results": "",
+    }
+    client.post(f"/results/{session}", json=data)
+    assert registry.get(session) is None
+    client.get(f"/health/v2/{session}")
+    assert registry.get(session).callback_freq == 45
+    client.get(f"/health/d/{session}")
+    assert registry.get(session).alive is False
+
+
+def test_registry_lru_eviction():
+    print(f"Testing: test_registry_lru_eviction()")
+    lru = SessionRegistry(max_size=2)
+    for index, session in enumerate(["a", "b", "c"]):
+        lru.put(session, SessionEntry(id=index))
+        if session == "b":
+            lru.get("a")
+    assert lru.get("b") is None
+    assert lru.get("a").id == 0
+    assert lru.get("c").id == 2
+    assert lru.stats().size == 2
+
+
+def test_registry_stats():
+    print(f"Testing: test_registry_stats()")
+    response = client.get("/implants/stats/registry", headers=get_token_headers_helper())
+    get_response_helper(response)
+    assert response.status_code == 200
+    assert set(response.json()) == {"size", "max_size", "hits", "misses"}
+    response = client.get("/implants/stats/registry")
+    assert response.status_code == 401
+
+
+@pytest.mark.anyio
+async def test_registry_load_bounded():
+    print(f"Testing: test_registry_load_bounded()")
+    session = generate_fake_session().json()["session"]
+    bounded = SessionRegistry(max_size=3)
+    assert await bounded.load() == 3
+    assert bounded.stats().size == 3
+    # the most recently registered session is among the warm entries
+    assert bounded.get(session) is not None
+
+
+class SlowSession:
+    # an async session whose reads stall after running until release is set
+    def __init__(self, db):
+        self.db = db
+        self.read = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def execute(self, stmt):
+        result = await self.db.execute(stmt)
+        self.read.set()
+        await self.release.wait()
+        return result
+
+
+@pytest.mark.anyio
+async def test_registry_queued_during_miss_not_lost():
+    print(f"Testing: test_registry_queued_during_miss_not_lost()")
+    session = generate_fake_session().json()["session"]
+    registry.forget(session)
+    async with AsyncSessionLocal() as db:
+        slow = SlowSession(db)
+        lookup = asyncio.create_task(registry.lookup(session, slow))
+        await slow.read.wait()
+        # create_tasking commits and counts the task while the miss still holds its select result
+        registry.add_queued(session)
+        slow.release.set()
+        entry = await lookup
+    assert entry.queued == 1
+    assert registry.get(session).has_work()
+    await async_engine.dispose()
+
+
+def test_registry_result_clears_lease_due():
+    print(f"Testing: test_registry_result_clears_lease_due()")
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session)
+    create_tasking_helper(session)
+    first, second = client.get(f"/health/v2/{session}").json()["tasks"]
+    assert registry.get(session).lease_due == first["lease_expires"]
+    for tasking in (first, second):
+        post_result_helper(session, tasking, "")
+    # nothing left Pending, no check in claims against a lease that is gone
+    assert registry.get(session).lease_due is None
+    with count_queries_helper() as statements:
+        client.get(f"/health/v2/{session}")
+    assert statements == []
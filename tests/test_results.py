@@ -0,0 +1,74 @@
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from server.lighthouse import app
+from server.server_helper.db import async_engine
+
+from tests.helper_functions import get_response_helper
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import create_tasking_helper
+from tests.helper_functions import queue_and_claim_helper
+from tests.helper_functions import post_result_helper
+
+client = TestClient(app)
+
+
+def test_create_results_marks_task_complete():
+    print(f"Testing: test_create_results_marks_task_complete()")
+    session = generate_fake_session().json()["session"]
+    tasking = queue_and_claim_helper(session)
+    response = post_result_helper(session, tasking)
+    get_response_helper(response)
+    assert response.status_code == 200
+    assert response.json()["args"] == "/tmp"
+    response = client.get(f"/results/{session}/{tasking['id']}", headers=get_token_headers_helper())
+    assert response.json()["results"] == "output"
+    response = client.get(f"/tasking/{session}", headers=get_token_headers_helper())
+    assert [task["complete"] for task in response.json() if task["id"] == tasking["id"]] == ["True"]
+
+
+def test_create_results_session_not_found():
+    print(f"Testing: test_create_results_session_not_found()")
+    response = client.post("/results/aaaaaa", json={"tasking_id": 1, "task": "ls", "results": "x"})
+    get_response_helper(response)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Session not found"
+
+
+def test_create_results_task_not_found():
+    print(f"Testing: test_create_results_task_not_found()")
+    session = generate_fake_session().json()["session"]
+    response = post_result_helper(session, {"id": 999999, "task": "ls", "args": "/tmp"})
+    get_response_helper(response)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Task not found"
+    response = client.get(f"/results/{session}/999999", headers=get_token_headers_helper())
+    assert response.status_code == 416
+
+
+def test_create_results_reconfig_updates_callback_freq():
+    print(f"Testing: test_create_results_reconfig_updates_callback_freq()")
+    session = generate_fake_session().json()["session"]
+    tasking = queue_and_claim_helper(session, task="reconfig", args="30 20")
+    response = post_result_helper(session, tasking)
+    assert response.status_code == 200
+    response = client.get(f"/implants/{session}", headers=get_token_headers_helper())
+    assert response.json()["callback_freq"] == 30
+
+
+def test_create_results_single_commit():
+    print(f"Testing: test_create_results_single_commit()")
+    session = generate_fake_session().json()["session"]
+    tasking = queue_and_claim_helper(session, task="reconfig", args="10 20")
+    commits = []
+
+    def record(conn):
+        commits.append(conn)
+
+    event.listen(async_engine.sync_engine, "commit", record)
+    try:
+        response = post_result_helper(session, tasking)
+    finally:
+        event.remove(async_engine.sync_engine, "commit", record)
+    assert response.status_code == 200
+    assert len(commits) == 1
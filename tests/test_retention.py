@@ -0,0 +1,103 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+
+from server.lighthouse import app
+from server.server_helper.blob_helper import blobs
+from server.server_helper.db import SessionLocal, async_engine, engine
+from server.server_helper.implant_helper import Implant
+from server.server_helper.results_helper import Results
+from server.server_helper.retention_helper import retention
+from server.server_helper.tasking_helper import Tasking
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import result_helper
+from tests.helper_functions import LONG_AGO
+
+client = TestClient(app)
+
+
+def backdate_helper(*tasking_ids: int) -> None:
+    with SessionLocal() as db:
+        db.execute(update(Tasking).where(Tasking.id.in_(tasking_ids)).values(date=LONG_AGO))
+        db.execute(update(Results).where(Results.tasking_id.in_(tasking_ids)).values(date=LONG_AGO))
+        db.commit()
+
+
+def purge_helper(dry_run: bool) -> dict:
+    response = client.post("/retention/purge", headers=get_token_headers_helper(), params={"dry_run": dry_run})
+    assert response.status_code == 200
+    return response.json()
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    # the policy under test on the shared engine, batch 1 so every purge runs many chunks
+    monkeypatch.setattr(retention, "batch", 1)
+
+    def set_policy(**limits):
+        for name, value in limits.items():
+            monkeypatch.setattr(retention, name, value)
+
+    yield set_policy
+    # connections opened on the TestClient's loops
+    engine.dispose()
+    async_engine.sync_engine.dispose(close=False)
+
+
+def test_retention_disabled_removes_nothing():
+    print(f"Testing: test_retention_disabled_removes_nothing()")
+    report = purge_helper(dry_run=False)
+    assert (report["sessions"], report["tasking"], report["results"]) == (0, 0, 0)
+
+
+def test_retention_old_rows_and_dead_sessions(policy):
+    print(f"Testing: test_retention_old_rows_and_dead_sessions()")
+    policy(max_age_days=30, dead_days=30)
+    kept = generate_fake_session().json()["session"]
+    # outputs spanning overflow pages, purging them leaves whole pages free for the vacuum
+    old_ids = [result_helper(kept, "y" * 20000), result_helper(kept, "y" * 20000)]
+    new_id = result_helper(kept)
+    backdate_helper(*old_ids)
+    dead = generate_fake_session().json()["session"]
+    dead_id = result_helper(dead, "x" * 100)
+    client.get(f"/health/d/{dead}")
+    ref, _ = blobs.put(b"only the dead session has this")
+    with SessionLocal() as db:
+        db.execute(update(Implant).where(Implant.session == dead).values(last_checkin=LONG_AGO))
+        db.execute(update(Results).where(Results.tasking_id == dead_id).values(blob_ref=ref, blob_size=50))
+        db.commit()
+
+    dry = purge_helper(dry_run=True)
+    assert (dry["sessions"], dry["tasking"], dry["results"]) == (1, 3, 3)
+    assert blobs.exists(ref)
+    report = purge_helper(dry_run=False)
+    for field in ("sessions", "tasking", "results", "row_bytes"):
+        assert report[field] == dry[field]
+    assert report["blob_bytes"] > 0 and not blobs.exists(ref)
+    assert report["pages_reclaimed"] > 0
+
+    headers = get_token_headers_helper()
+    assert client.get(f"/implants/{dead}", headers=headers).status_code == 404
+    assert [task["id"] for task in client.get(f"/tasking/{kept}", headers=headers).json()] == [new_id]
+    with SessionLocal() as db:
+        assert db.query(Results).filter(Results.session.in_([kept, dead])).count() == 1
+    # nothing left to purge
+    again = purge_helper(dry_run=True)
+    assert (again["sessions"], again["tasking"], again["results"]) == (0, 0, 0)
+
+
+def test_retention_max_results_keeps_newest(policy):
+    print(f"Testing: test_retention_max_results_keeps_newest()")
+    session = generate_fake_session().json()["session"]
+    tasking_ids = [result_helper(session) for _ in range(4)]
+    policy(max_results=2)
+    dry = purge_helper(dry_run=True)
+    report = purge_helper(dry_run=False)
+    assert report["results"] == dry["results"] >= 2
+    with SessionLocal() as db:
+        kept = [row.tasking_id for row in db.query(Results).filter(Results.session == session).order_by(Results.id)]
+    assert kept == tasking_ids[2:]
+    # results only, the tasks themselves are kept
+    assert len(client.get(f"/tasking/{session}", headers=get_token_headers_helper()).json()) == 4
@@ -0,0 +1,122 @@
+import base64
+import sqlite3
+
+import pytest
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, delete, text
+from sqlalchemy.exc import OperationalError
+
+from server.lighthouse import app
+from server.routes import results_routes
+from server.server_helper.db import SessionLocal
+from server.server_helper.migrations import run_migrations
+from server.server_helper.results_helper import Results
+from server.server_helper.search_helper import backfill, searchable_text
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import result_helper
+from tests.helper_functions import gen_fake_host_data
+from tests.helper_functions import schema_db
+
+client = TestClient(app)
+
+
+def search_helper(**params) -> list:
+    response = client.get("/results/search", headers=get_token_headers_helper(), params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_search_finds_decoded_text():
+    print(f"Testing: test_search_finds_decoded_text()")
+    # a word no other test writes, the index is shared with the whole suite
+    word = gen_fake_host_data(24)
+    session = generate_fake_session().json()["session"]
+    other = generate_fake_session().json()["session"]
+    text_id = result_helper(session, f"uid=0(root) {word} /etc/shadow".encode("utf-8"))
+    other_id = result_helper(other, f"{word}\n".encode("utf-8"))
+    result_helper(session, f"{word}".encode("utf-8"), task="download")
+    result_helper(session, word.encode("utf-8") + b"\x00\xff\xfe binary")
+
+    hits = search_helper(q=word)
+    assert [(hit["session"], hit["tasking_id"]) for hit in hits] == [(other, other_id), (session, text_id)]
+    assert hits[1]["snippet"] == f"uid=0(root) <b>{word}</b> /etc/shadow"
+    assert hits[1]["task"] == "ls" and hits[1]["date"]
+    # phrase, session filter and custom highlight marks
+    hits = search_helper(q=f'"root {word}"', session=session, mark_open="[", mark_close="]")
+    assert [hit["snippet"] for hit in hits] == [f"uid=0([root) {word}] /etc/shadow"]
+    assert search_helper(q=word, session=gen_fake_host_data(8)) == []
+    # the session id is only matched by the session filter, and q can't get out of it
+    assert search_helper(q=session) == []
+    assert [hit["session"] for hit in search_helper(q=f"({word}) OR (x)", session=other)] == [other]
+    # brackets in a "string" are text, not grouping
+    assert [hit["session"] for hit in search_helper(q=f'"({word}"', session=other)] == [other]
+    assert search_helper(q=f"session : {other}") == []
+
+
+def test_search_pages_and_rejects_bad_queries():
+    print(f"Testing: test_search_pages_and_rejects_bad_queries()")
+    word = gen_fake_host_data(24)
+    session = generate_fake_session().json()["session"]
+    tasking_ids = [result_helper(session, f"line {i} {word}".encode("utf-8")) for i in range(5)]
+    seen = []
+    page = search_helper(q=word, limit=2)
+    while page:
+        seen += [hit["tasking_id"] for hit in page]
+        page = search_helper(q=word, limit=2, after_id=page[-1]["id"])
+    assert seen == tasking_ids[::-1]
+    assert [hit["tasking_id"] for hit in search_helper(q=word, order="asc")] == tasking_ids
+
+    headers = get_token_headers_helper()
+    for bad in ("AND", "foo:bar", '"abc', "-x"):
+        assert client.get("/results/search", headers=headers, params={"q": bad}).status_code == 400
+    # a bracket closing the output column filter never reaches fts5
+    for unbalanced in (f"{word}) OR (x", "(x", "x)"):
+        assert client.get("/results/search", headers=headers, params={"q": unbalanced}).status_code == 422
+    assert client.get("/results/search", headers=headers, params={"q": ""}).status_code == 422
+    assert client.get("/results/search", params={"q": word}).status_code == 401
+
+
+def test_search_database_errors_not_bad_queries(monkeypatch):
+    print(f"Testing: test_search_database_errors_not_bad_queries()")
+    # stands in for "database is locked", an error sqlite raises while the query itself is fine
+    monkeypatch.setattr(results_routes, "search_statement", lambda query: text("SELECT * FROM no_such_table"))
+    with pytest.raises(OperationalError):
+        client.get("/results/search", headers=get_token_headers_helper(), params={"q": "word"})
+
+
+def test_search_forgets_deleted_results():
+    print(f"Testing: test_search_forgets_deleted_results()")
+    word = gen_fake_host_data(24)
+    session = generate_fake_session().json()["session"]
+    result_helper(session, word.encode("utf-8"))
+    assert len(search_helper(q=word)) == 1
+    with SessionLocal() as db:
+        db.execute(delete(Results).where(Results.session == session))
+        db.commit()
+    assert search_helper(q=word) == []
+
+
+def test_search_backfill(tmp_path):
+    print(f"Testing: test_search_backfill()")
+    db_path = schema_db(tmp_path / "database.db")
+    run_migrations(create_engine(f"sqlite:///{db_path}"))
+    rows = [
+        ("ls", base64.b64encode(b"passwords.txt").hex(), None),
+        ("cat", "not transport encoded passwords", None),
+        ("download", base64.b64encode(b"passwords").hex(), None),
+        ("cat", "", "0" * 64),
+        ("cat", base64.b64encode(b"\x00passwords").hex(), None),
+    ]
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.executemany("INSERT INTO results (session, tasking_id, task, results, blob_ref) VALUES ('abcdefgh', 1, ?, ?, ?)", rows)
+        assert backfill(conn) == 2
+        # run again it only looks past the last indexed row
+        assert backfill(conn) == 0
+        matches = conn.execute("SELECT rowid FROM results_fts WHERE results_fts MATCH 'passwords' ORDER BY rowid").fetchall()
+    assert matches == [(1,), (2,)]
+    assert searchable_text("cat", "ab") == "ab"
+    assert searchable_text("cat", base64.b64encode("ünïcödé".encode("utf-8")).hex()) == "ünïcödé"
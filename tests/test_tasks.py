@@ -0,0 +1,151 @@
+import pytest
+import time
+
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.tasking_helper import ARGS_PREVIEW, leases
+
+from tests.helper_functions import get_response_helper
+from tests.helper_functions import generate_fake_session
+from tests.helper_functions import create_tasking_helper
+from tests.helper_functions import count_queries_helper
+from tests.helper_functions import capture_queries_helper
+from tests.helper_functions import get_token_headers_helper
+
+client = TestClient(app)
+
+
+def test_get_tasks_not_found():
+    print(f"Testing: test_get_tasks_not_found()")
+    response = client.get("/tasks/aaaaaa")
+    get_response_helper(response)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Session not found"
+
+
+def test_get_tasks_none_queued():
+    print(f"Testing: test_get_tasks_none_queued()")
+    session = generate_fake_session().json()["session"]
+    response = client.get(f"/tasks/{session}")
+    get_response_helper(response)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "No tasks found for this session"
+
+
+def test_get_tasks_marks_pending():
+    print(f"Testing: test_get_tasks_marks_pending()")
+    session = generate_fake_session().json()["session"]
+    paths = [f"/tmp/{i}" for i in range(3)]
+    for path in paths:
+        create_tasking_helper(session, args=path)
+    response = client.get(f"/tasks/{session}")
+    get_response_helper(response)
+    assert response.status_code == 200
+    assert [task["args"] for task in response.json()] == paths
+    assert all(task["complete"] == "Pending" for task in response.json())
+    assert all(task["attempts"] == 1 and task["lease_expires"] for task in response.json())
+    # leased, not handed out again while the lease runs
+    response = client.get(f"/tasks/{session}")
+    assert response.status_code == 404
+
+
+def test_get_tasks_lease_expired_redelivers(monkeypatch):
+    print(f"Testing: test_get_tasks_lease_expired_redelivers()")
+    monkeypatch.setattr(leases, "duration", 0)
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session, args="/tmp/a")
+    first = client.get(f"/health/v2/{session}").json()["tasks"]
+    # no result within the lease, the registry knows it is due and the check in hands it out again
+    again = client.get(f"/health/v2/{session}").json()["tasks"]
+    assert [task["id"] for task in again] == [task["id"] for task in first]
+    assert again[0]["attempts"] == 2
+
+
+def test_get_tasks_dead_after_max_attempts(monkeypatch):
+    print(f"Testing: test_get_tasks_dead_after_max_attempts()")
+    monkeypatch.setattr(leases, "duration", 0)
+    monkeypatch.setattr(leases, "max_attempts", 2)
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session, args="/tmp/a")
+    assert client.get(f"/tasks/{session}").status_code == 200
+    assert client.get(f"/tasks/{session}").status_code == 200
+    response = client.get(f"/tasks/{session}")
+    assert response.status_code == 404
+    response = client.get(f"/tasking/{session}", headers=get_token_headers_helper(), params={"complete": "Dead"})
+    assert [(task["args_preview"], task["attempts"]) for task in response.json()] == [("/tmp/a", 2)]
+    # a dead task leaves nothing due, the legacy check in no longer redirects
+    response = client.get(f"/health/{session}", follow_redirects=False)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("depth", [1, 10, 50])
+def test_get_tasks_cost_independent_of_depth(depth):
+    print(f"Testing: test_get_tasks_cost_independent_of_depth(): {depth}")
+    session = generate_fake_session().json()["session"]
+    for i in range(depth):
+        create_tasking_helper(session, args=f"/tmp/{i}")
+    start = time.perf_counter()
+    with count_queries_helper() as statements:
+        response = client.get(f"/tasks/{session}")
+    print(f"depth={depth} statements={len(statements)} ms={(time.perf_counter() - start) * 1000:.2f}")
+    assert len(response.json()) == depth
+    # the session registry answers the implant lookup, one UPDATE ... RETURNING whatever the depth
+    assert len(statements) == 1
+
+
+def test_read_taskings_paged():
+    print(f"Testing: test_read_taskings_paged()")
+    session = generate_fake_session().json()["session"]
+    paths = [f"/tmp/{i}" for i in range(5)]
+    for path in paths:
+        create_tasking_helper(session, args=path)
+    headers = get_token_headers_helper()
+    seen, params = [], {"limit": 2}
+    while True:
+        page = client.get(f"/tasking/{session}", headers=headers, params=params).json()
+        seen += [task["args_preview"] for task in page]
+        if len(page) < params["limit"]:
+            break
+        params["after_id"] = page[-1]["id"]
+    assert seen == paths
+
+
+def test_read_taskings_filtered():
+    print(f"Testing: test_read_taskings_filtered()")
+    session = generate_fake_session().json()["session"]
+    create_tasking_helper(session, args="/tmp/a")
+    client.get(f"/tasks/{session}")
+    create_tasking_helper(session, task="ps", args="")
+    headers = get_token_headers_helper()
+    response = client.get(f"/tasking/{session}", headers=headers, params={"complete": "Pending"})
+    assert [task["args_preview"] for task in response.json()] == ["/tmp/a"]
+    response = client.get(f"/tasking/{session}", headers=headers, params={"task": "ps"})
+    assert [task["task"] for task in response.json()] == ["ps"]
+    response = client.get(f"/tasking/{session}", headers=headers, params={"since": "2000-01-01T00:00:00"})
+    assert len(response.json()) == 2
+    response = client.get(f"/tasking/{session}", headers=headers, params={"until": "2000-01-01T00:00:00Z"})
+    assert response.json() == []
+
+
+def test_read_taskings_summary_omits_args():
+    print(f"Testing: test_read_taskings_summary_omits_args()")
+    session = generate_fake_session().json()["session"]
+    long_args = "A" * 5000
+    create_tasking_helper(session, args=long_args)
+    headers = get_token_headers_helper()
+    with capture_queries_helper() as queries:
+        response = client.get(f"/tasking/{session}", headers=headers)
+    task = response.json()[0]
+    assert "args" not in task
+    assert task["args_preview"] == long_args[:ARGS_PREVIEW]
+    assert task["args_size"] == len(long_args)
+    # the projection happens in sql, the args column itself is never selected
+    listing = [statement for statement, _ in queries if statement.startswith("SELECT") and "tasking" in statement]
+    assert listing and not any("tasking.args," in s or "tasking.args " in s for s in listing)
+    # the full args on demand
+    response = client.get(f"/tasking/{session}/{task['id']}", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["args"] == long_args
+    response = client.get(f"/tasking/{session}/999999", headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Task not found"
@@ -0,0 +1,232 @@
+import asyncio
+import gzip
+import hashlib
+import os
+import time
+import tracemalloc
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from server.lighthouse import app
+from server.server_helper.blob_helper import blobs
+from server.server_helper.body_helper import body_limits
+from server.server_helper.db import async_engine
+from server.server_helper.transfer_helper import transfers
+
+from tests.helper_functions import get_token_headers_helper
+from tests.helper_functions import queue_task_helper
+
+client = TestClient(app)
+OCTET = {"Content-Type": "application/octet-stream"}
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def open_transfer_helper(session: str, tasking: dict, size: int = None):
+    params = {"task": tasking["task"], "args": tasking["args"]}
+    if size is not None:
+        params["size"] = size
+    return client.post(f"/results/v2/{session}/{tasking['id']}/transfers", params=params)
+
+
+def put_chunk_helper(session: str, transfer_id: str, index: int, offset: int, chunk: bytes, checksum: str = None):
+    headers = dict(OCTET, **{"X-Checksum": checksum or sha256(chunk)})
+    return client.put(
+        f"/results/v2/{session}/transfers/{transfer_id}/{index}",
+        params={"offset": offset},
+        headers=headers,
+        content=chunk,
+    )
+
+
+def fake_sender(session: str, transfer_id: str, payload: bytes, chunk_size: int, stop_after: int = None) -> int:
+    """
+    Send a payload the way an agent would, resuming from whatever the server has acknowledged
+    :return: The number of chunks sent before stopping
+    """
+    state = client.get(f"/results/v2/{session}/transfers/{transfer_id}").json()
+    index, offset, sent = state["chunks"], state["received"], 0
+    while offset < len(payload) and sent != stop_after:
+        chunk = payload[offset:offset + chunk_size]
+        response = put_chunk_helper(session, transfer_id, index, offset, chunk)
+        assert response.status_code == 200
+        index, offset, sent = index + 1, offset + len(chunk), sent + 1
+    return sent
+
+
+def finalize_helper(session: str, transfer_id: str, checksum: str):
+    return client.post(f"/results/v2/{session}/transfers/{transfer_id}/finalize", params={"checksum": checksum})
+
+
+def test_transfer_full():
+    print(f"Testing: test_transfer_full()")
+    session, tasking = queue_task_helper("exec_fg", "cat big")
+    payload = os.urandom(100_000)
+    response = open_transfer_helper(session, tasking, len(payload))
+    assert response.status_code == 200
+    transfer_id = response.json()["transfer_id"]
+    assert fake_sender(session, transfer_id, payload, 16_384) == 7
+    finalized = finalize_helper(session, transfer_id, sha256(payload))
+    assert finalized.status_code == 200
+    # stored like any other large raw result and read back through the v2 endpoint
+    response = client.get(f"/results/v2/{session}/{tasking['id']}", headers=get_token_headers_helper())
+    assert response.headers["x-task"] == "exec_fg"
+    assert response.content == payload
+    assert client.get(f"/tasks/{session}").status_code == 404
+    # the part file is gone once finalized, the sidecar says it is done
+    assert client.get(f"/results/v2/{session}/transfers/{transfer_id}").json()["finalized"] is True
+    assert not transfers.part_path(transfer_id).exists()
+    # the sender lost the response, finalizing again answers with the stored result
+    again = finalize_helper(session, transfer_id, sha256(payload))
+    assert again.status_code == 200
+    assert again.json() == finalized.json()
+    assert put_chunk_helper(session, transfer_id, 7, len(payload), b"more").status_code == 409
+
+
+def test_transfer_resume():
+    print(f"Testing: test_transfer_resume()")
+    session, tasking = queue_task_helper("download", "/etc/big")
+    payload = gzip.compress(os.urandom(50_000), mtime=0)
+    transfer_id = open_transfer_helper(session, tasking, len(payload)).json()["transfer_id"]
+    assert fake_sender(session, transfer_id, payload, 8192, stop_after=3) == 3
+    # the connection dropped in the middle of chunk 3, half of it reached the disk unacknowledged
+    with open(transfers.part_path(transfer_id), "ab") as fp:
+        fp.write(payload[3 * 8192:3 * 8192 + 4000])
+    state = client.get(f"/results/v2/{session}/transfers/{transfer_id}").json()
+    assert (state["chunks"], state["received"]) == (3, 3 * 8192)
+    # finalizing early is refused, the announced size has not arrived
+    assert finalize_helper(session, transfer_id, sha256(payload)).status_code == 409
+    fake_sender(session, transfer_id, payload, 8192)
+    # a chunk sent again after its response was lost is acknowledged, nothing is written twice
+    response = put_chunk_helper(session, transfer_id, 0, 0, payload[:8192])
+    assert response.status_code == 200 and response.json()["received"] == len(payload)
+    assert finalize_helper(session, transfer_id, sha256(payload)).status_code == 200
+    # a download result is the agent's gzip stream, stored and returned as is
+    response = client.get(f"/results/v2/{session}/{tasking['id']}", headers=get_token_headers_helper())
+    assert response.content == payload
+    assert blobs.path(sha256(payload)).is_file()
+
+
+def test_transfer_rejects_bad_chunks(monkeypatch):
+    print(f"Testing: test_transfer_rejects_bad_chunks()")
+    session, tasking = queue_task_helper("exec_fg", "cat big")
+    transfer_id = open_transfer_helper(session, tasking).json()["transfer_id"]
+    chunk = os.urandom(1000)
+    response = put_chunk_helper(session, transfer_id, 0, 0, chunk, checksum=sha256(b"other"))
+    assert response.status_code == 400
+    # skipping ahead is refused and the detail says where to resume
+    response = put_chunk_helper(session, transfer_id, 1, 1000, chunk)
+    assert response.status_code == 409
+    assert response.json()["detail"] == "Expected chunk 0 at offset 0"
+    monkeypatch.setattr(transfers, "max_chunk", 500)
+    assert put_chunk_helper(session, transfer_id, 0, 0, chunk).status_code == 413
+    assert os.path.getsize(transfers.part_path(transfer_id)) == 0
+    monkeypatch.undo()
+    assert put_chunk_helper(session, transfer_id, 0, 0, chunk).json()["received"] == 1000
+    # a payload that does not match its checksum is not stored, the transfer stays open
+    assert finalize_helper(session, transfer_id, sha256(b"other")).status_code == 400
+    assert client.get(f"/results/v2/{session}/transfers/{transfer_id}").status_code == 200
+    tasking_read = client.get(f"/tasking/{session}/{tasking['id']}", headers=get_token_headers_helper()).json()
+    assert tasking_read["complete"] != "True"
+
+
+def test_transfer_not_found():
+    print(f"Testing: test_transfer_not_found()")
+    session, tasking = queue_task_helper("ls", "/tmp")
+    response = open_transfer_helper(session, dict(tasking, id=999999))
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Task not found"
+    assert open_transfer_helper("aaaaaa", tasking).status_code == 404
+    transfer_id = open_transfer_helper(session, tasking).json()["transfer_id"]
+    # transfers belong to their session and ids are never paths
+    assert client.get(f"/results/v2/aaaaaa/transfers/{transfer_id}").status_code == 404
+    assert client.get(f"/results/v2/{session}/transfers/..%2F..%2Fdatabase").status_code == 404
+
+
+@pytest.mark.anyio
+async def test_transfer_same_chunk_twice_at_once():
+    print(f"Testing: test_transfer_same_chunk_twice_at_once()")
+    session, tasking = queue_task_helper("exec_fg", "cat big")
+    transfer_id = open_transfer_helper(session, tasking).json()["transfer_id"]
+    state = transfers.load(session, transfer_id)
+    chunks = [os.urandom(5000), os.urandom(3000)]
+    # both requests read the state before either chunk was written, the second one in is taken for a
+    # resend of the first and writes nothing
+    first, second = await asyncio.gather(
+        *(transfers.write_chunk(state.model_copy(), (0, 0), sha256(chunk), chunk) for chunk in chunks)
+    )
+    assert (first.chunks, first.received) == (second.chunks, second.received) == (1, 5000)
+    assert transfers.part_path(transfer_id).read_bytes() == chunks[0]
+
+
+@pytest.mark.anyio
+async def test_transfer_finalize_twice_at_once():
+    print(f"Testing: test_transfer_finalize_twice_at_once()")
+    session, tasking = queue_task_helper("exec_fg", "cat big")
+    payload = os.urandom(20_000)
+    transfer_id = open_transfer_helper(session, tasking, len(payload)).json()["transfer_id"]
+    fake_sender(session, transfer_id, payload, 10_000)
+    url = f"/results/v2/{session}/transfers/{transfer_id}/finalize"
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://lighthouse") as async_client:
+        first, second = await asyncio.gather(
+            *(async_client.post(url, params={"checksum": sha256(payload)}) for _ in range(2))
+        )
+    # the second waits for the first and answers with the result it stored
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    await async_engine.dispose()
+
+
+def test_transfer_spooled_chunk(monkeypatch):
+    print(f"Testing: test_transfer_spooled_chunk()")
+    monkeypatch.setattr(body_limits, "spool_threshold", 1000)
+    session, tasking = queue_task_helper("exec_fg", "cat big")
+    payload = os.urandom(20_000)
+    transfer_id = open_transfer_helper(session, tasking, len(payload)).json()["transfer_id"]
+    # every chunk is over the spool threshold and reaches the transfer as a file
+    assert put_chunk_helper(session, transfer_id, 0, 0, payload[:15_000], checksum=sha256(b"other")).status_code == 400
+    assert fake_sender(session, transfer_id, payload, 15_000) == 2
+    assert transfers.part_path(transfer_id).read_bytes() == payload
+    assert not any(body_limits.spool_dir.iterdir())
+
+
+def test_transfer_abandoned_expires():
+    print(f"Testing: test_transfer_abandoned_expires()")
+    session, tasking = queue_task_helper("exec_fg", "cat big")
+    transfer_id = open_transfer_helper(session, tasking).json()["transfer_id"]
+    put_chunk_helper(session, transfer_id, 0, 0, b"half a result")
+    fresh_id = open_transfer_helper(session, tasking).json()["transfer_id"]
+    # nothing acknowledged for two days
+    stale = time.time() - 48 * 3600
+    os.utime(transfers.state_path(transfer_id), (stale, stale))
+    headers = get_token_headers_helper()
+    dry = client.post("/retention/purge", headers=headers, params={"dry_run": True}).json()
+    assert dry["transfers"] >= 1 and transfers.part_path(transfer_id).exists()
+    report = client.post("/retention/purge", headers=headers, params={"dry_run": False}).json()
+    assert report["transfers"] == dry["transfers"]
+    assert client.get(f"/results/v2/{session}/transfers/{transfer_id}").status_code == 404
+    assert not transfers.part_path(transfer_id).exists()
+    assert client.get(f"/results/v2/{session}/transfers/{fresh_id}").status_code == 200
+
+
+def test_transfer_put_file_streams(tmp_path, monkeypatch):
+    print(f"Testing: test_transfer_put_file_streams()")
+    monkeypatch.setattr(blobs, "root", tmp_path)
+    source = tmp_path / "payload.part"
+    with open(source, "wb") as fp:
+        for _ in range(32):
+            fp.write(os.urandom(1 << 20))
+    tracemalloc.start()
+    ref, size = blobs.put_file(source, compress=True)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    # a 32MB payload goes into the store without ever being held in memory whole
+    assert peak < 8 << 20
+    assert not source.exists()
+    assert blobs.path(ref).stat().st_size == size
+    with gzip.open(blobs.path(ref)) as fp:
+        assert len(fp.read()) == 32 << 20
@@ -6,6 +6,7 @@ from httpx import codes
 from fastapi.testclient import TestClient
 
 from server.lighthouse import app
+from server.server_helper.writer_helper import writer
 
 from tests.helper_functions import get_token_headers_helper
 from tests.helper_functions import get_response_helper
@@ -118,6 +119,25 @@ def test_user_already_exists_req():
     assert response.json()["detail"] == "Username already exists"
 
 
+def test_user_create_race_req(monkeypatch):
+    print(f"\tTesting: test_user_create_race_req()")
+    submit = writer.submit
+
+    async def racing_submit(write):
+        # a second create of the same username gets its write in between this one's check and write
+        await submit(write)
+        return await submit(write)
+
+    monkeypatch.setattr(writer, "submit", racing_submit)
+    data = {
+        "username": gen_fake_host_data(6),
+        "password": "abcdefgh",
+    }
+    response = client.post("/users/create", headers=get_token_headers_helper(), json=data)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Username already exists"
+
+
 def test_create_user_req():
     print(f"\tTesting: test_create_user_req()")
     username = gen_fake_host_data(6) 
@@ -138,4 +158,14 @@ def test_delete_user_by_username_req():
     fake_user = create_user_helper()
     response = client.delete(f"/users/delete/username/{fake_user}", headers=get_token_headers_helper())
     get_response_helper(response)
-    assert response.status_code == 200
\ No newline at end of file
+    assert response.status_code == 200
+
+def test_users_paged_req():
+    print(f"\tTesting: test_users_paged_req()")
+    fake_user = create_user_helper()
+    headers = get_token_headers_helper()
+    response = client.get("/users/", headers=headers, params={"limit": 1})
+    assert len(response.json()) == 1
+    response = client.get("/users/", headers=headers, params={"username": fake_user})
+    get_response_helper(response)
+    assert [user["username"] for user in response.json()] == [fake_user]
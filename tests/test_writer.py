@@ -0,0 +1,124 @@
+import asyncio
+import base64
+from functools import partial
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, select
+from server.lighthouse import app
+from server.server_helper.db import SessionLocal, async_engine, writer_engine
+from server.server_helper.implant_helper import Implant
+from server.server_helper.tasking_helper import Tasking
+from server.server_helper.writer_helper import GroupCommitWriter, insert_row, writer
+
+from tests.helper_functions import gen_fake_session_name
+from tests.helper_functions import get_token_headers_helper
+
+client = TestClient(app)
+
+
+def implant_values(session: str) -> dict:
+    return {
+        "session": session,
+        "hostname": "writerhost",
+        "username": "writeruser",
+        "callback_freq": 1,
+        "jitter": 15,
+        "alive": True,
+        "first_checkin": "2024-01-01T00:00:00+00:00",
+        "last_checkin": "2024-01-01T00:00:00+00:00",
+    }
+
+
+async def failing_write(db):
+    await db.execute(select(Implant.session).limit(1))
+    raise ValueError("bad write")
+
+
+@pytest.mark.anyio
+async def test_writer_group_commit():
+    print(f"Testing: test_writer_group_commit()")
+    group = GroupCommitWriter(max_batch=64, max_delay=0.01)
+    commits = []
+
+    def record(conn):
+        commits.append(conn)
+
+    event.listen(writer_engine.sync_engine, "commit", record)
+    await group.start()
+    try:
+        sessions = [gen_fake_session_name() for _ in range(100)]
+        implants = await asyncio.gather(*[group.submit(partial(insert_row, Implant, implant_values(s))) for s in sessions])
+    finally:
+        await group.stop()
+        event.remove(writer_engine.sync_engine, "commit", record)
+    assert [implant.session for implant in implants] == sessions
+    # 100 writes, two batches of at most 64, one commit each
+    assert (group.writes, group.batches, len(commits)) == (100, 2, 2)
+    with SessionLocal() as db:
+        assert db.query(Implant).filter(Implant.session.in_(sessions)).count() == 100
+    await async_engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_writer_failure_only_reaches_its_caller():
+    print(f"Testing: test_writer_failure_only_reaches_its_caller()")
+    group = GroupCommitWriter(max_delay=0.01)
+    await group.start()
+    try:
+        sessions = [gen_fake_session_name() for _ in range(4)]
+        writes = [partial(insert_row, Implant, implant_values(s)) for s in sessions]
+        outcomes = await asyncio.gather(*[group.submit(w) for w in writes[:2] + [failing_write] + writes[2:]], return_exceptions=True)
+    finally:
+        await group.stop()
+    assert isinstance(outcomes[2], ValueError)
+    assert [implant.session for implant in outcomes[:2] + outcomes[3:]] == sessions
+    with SessionLocal() as db:
+        assert db.query(Implant).filter(Implant.session.in_(sessions)).count() == 4
+    await async_engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_writer_stop_drains_queue():
+    print(f"Testing: test_writer_stop_drains_queue()")
+    group = GroupCommitWriter(max_batch=2, max_delay=1)
+    await group.start()
+    sessions = [gen_fake_session_name() for _ in range(5)]
+    pending = [asyncio.ensure_future(group.submit(partial(insert_row, Implant, implant_values(s)))) for s in sessions]
+    await asyncio.sleep(0)
+    await group.stop()
+    # queued writes are committed before stop returns, not held for max_delay
+    assert all(future.done() for future in pending)
+    assert [future.result().session for future in pending] == sessions
+    await async_engine.dispose()
+
+
+@pytest.mark.anyio
+async def test_writer_routes_through_group_commit():
+    print(f"Testing: test_writer_routes_through_group_commit()")
+    headers = get_token_headers_helper()
+    await writer.start()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as ac:
+            sessions = [gen_fake_session_name() for _ in range(20)]
+            register = [ac.post("/implants/", json={"session": s, "callback_freq": 1, "jitter": 15}) for s in sessions]
+            assert {r.status_code for r in await asyncio.gather(*register)} == {200}
+            data = {"task": "ls", "args": base64.b64encode(b"/tmp").hex()}
+            await asyncio.gather(*[ac.post(f"/tasking/{s}", headers=headers, json=data) for s in sessions])
+            check_ins = await asyncio.gather(*[ac.get(f"/health/v2/{s}") for s in sessions])
+            tasks = [response.json()["tasks"][0] for response in check_ins]
+            results = [
+                ac.post(f"/results/{s}", json={"tasking_id": t["id"], "task": "ls", "args": "", "results": ""})
+                for s, t in zip(sessions, tasks)
+            ]
+            assert {r.status_code for r in await asyncio.gather(*results)} == {200}
+        batches = writer.batches
+    finally:
+        await writer.stop()
+    # 80 writes from 80 concurrent requests, far fewer commits
+    assert batches < 80
+    with SessionLocal() as db:
+        complete = db.scalars(select(Tasking.complete).where(Tasking.session.in_(sessions))).all()
+    assert complete == ["True"] * 20
+    await async_engine.dispose()